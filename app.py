@@ -1,38 +1,135 @@
+import startup_profile  # 最初に読み込む（--profile-startupの場合はこれ以降のimportの時間を計測する）
 import os
+import sys
+import atexit
+import signal
 import time
 import threading
 import logging
 import datetime
 import re
 import json
-import requests
 import uuid
-import base64
+import hashlib
+import functools
 import jwt  
-from io import BytesIO
+import mimetypes
+from array import array
+from collections import OrderedDict, deque
+from types import MappingProxyType
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file
+from slack_sdk import WebClient
+from flask import Flask, render_template, request, redirect, url_for, flash, get_flashed_messages, send_file, g
+from werkzeug.wsgi import wrap_file
 from dotenv import load_dotenv
-from urllib.parse import urlencode  
+from review_store import ReviewLocks, create_review_store
+from slack_outbox import SlackOutbox, OutboxFull
+from image_store import ImageStore, UploadRejected
+from user_directory import UserDirectory
+from publisher import Publisher, HttpAdapter, PublishError
+from job_queue import JobQueue, JobWorkerPool
+from review_sweeper import ReviewSweeper
+from reconciler import ReactionReconciler
+from review_archive import ReviewArchive
+from cluster import Cluster, ClusterReviewLocks
+from sns_accounts import SnsAccountRegistry
+import metrics
+from logging_setup import setup_logging, parse_levels, log_context
+import thumbnails
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+startup_profile.mark("import")
 load_dotenv()
 
-logging.basicConfig(level=logging.DEBUG)
+# ログはキュー経由でバックグラウンドのスレッドが書き込む（ハンドラの中で出力を待たない）
+log_listener = setup_logging(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    fmt=os.environ.get("LOG_FORMAT", "json"),
+    levels=parse_levels(os.environ.get("LOG_LEVELS", "")),
+    rate_limit=int(os.environ.get("LOG_RATE_LIMIT", "20")),
+)
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
+startup_profile.mark("ログの設定")
 
 SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN")
 SIGNING_SECRET = os.environ.get("SIGNING_SECRET")
 SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN")
+SLACK_API_URL = os.environ.get("SLACK_API_URL")  # 未設定ならSlackのAPIに接続する
 JWT_SECRET = os.environ.get("JWT_SECRET", "super_secret_key")  # JWT secret key
 JWT_EXPIRES_IN = int(os.environ.get("JWT_EXPIRES_IN", "3600"))  # Expiration time in seconds (default 1 hour)
+PREVIEW_URL_REFRESH_MARGIN = min(300, JWT_EXPIRES_IN // 10)  # 有効期限がこの秒数を切ったらプレビューURLを作り直す
+PORT = int(os.environ.get("PORT", "7700"))  # Webサーバーのポート番号
+BASE_URL = os.environ.get("BASE_URL", f"http://localhost:{PORT}/")  # フォームやプレビューのURLに使う（未設定ならPORTから作る）
 
 REVIEWER_IDS = [uid for uid in os.environ.get("REVIEWER_IDS", "").split(",") if uid.strip()]
 REQUIRED_APPROVALS = int(os.environ.get("REQUIRED_APPROVALS", "1"))
 
+REVIEW_STORE_BACKEND = os.environ.get("REVIEW_STORE", "sqlite")  # "sqlite" または "memory"
+REVIEW_CACHE_SIZE = int(os.environ.get("REVIEW_CACHE_SIZE", "1024"))
+SLACK_OUTBOX_SIZE = int(os.environ.get("SLACK_OUTBOX_SIZE", "1000"))
+SLACK_POST_TIMEOUT = float(os.environ.get("SLACK_POST_TIMEOUT", "30"))  # レビューのメッセージの投稿を待つ秒数
+# 投稿できなかったレビューのメッセージを投稿し直すまでの秒数（待ちきれなかった投稿と二重にならないように長めにとる）
+REVIEW_REPOST_DELAY = float(os.environ.get("REVIEW_REPOST_DELAY", "600"))
+# クラスタモードでレビューのロック（共有のリース）を持つ秒数。リースは延長しないので、ロック中に待つ最長の時間
+# （新しいレビューのメッセージの投稿を待つSLACK_POST_TIMEOUTと、送信キューの空きを待つ時間）より十分長くする
+REVIEW_LOCK_TTL = SLACK_POST_TIMEOUT * 2 + 30
+# クラスタモードでリアクションのイベントを処理中として持つ秒数（レビューのロックを待つ時間と持つ時間を合わせたより長くする）
+EVENT_CLAIM_TTL = REVIEW_LOCK_TTL * 2
+PUBLISH_WORKERS = int(os.environ.get("PUBLISH_WORKERS", "8"))
+# SNS名 -> 投稿APIのURL（JSON）。指定のないSNSはログ出力のみの仮の実装で投稿する
+SNS_PUBLISH_ENDPOINTS = json.loads(os.environ.get("SNS_PUBLISH_ENDPOINTS", "{}"))
+PUBLISH_JOB_WORKERS = int(os.environ.get("PUBLISH_JOB_WORKERS", "2"))
+PUBLISH_JOB_MAX_ATTEMPTS = int(os.environ.get("PUBLISH_JOB_MAX_ATTEMPTS", "5"))
+USER_DIRECTORY_TTL = int(os.environ.get("USER_DIRECTORY_TTL", "3600"))  # ユーザー一覧を読み直す間隔（秒）
+SNS_ACCOUNTS_POLL_INTERVAL = float(os.environ.get("SNS_ACCOUNTS_POLL_INTERVAL", "5"))  # sns.jsonの変更を確認する間隔（秒）
+# sns.jsonを読み込めなかった場合のSNSアカウント情報
+DEFAULT_SNS_ACCOUNTS = {
+    "Twitter": ["公式アカウント", "部門アカウント"],
+    "Facebook": ["公式ページ"],
+    "Instagram": ["公式アカウント"],
+}
+# 承認・リジェクトされないまま、または承認後に投稿されないままのレビューを削除するまでの秒数（0なら削除しない）
+REVIEW_PENDING_TTL = int(os.environ.get("REVIEW_PENDING_TTL", str(7 * 24 * 3600)))
+REVIEW_APPROVED_TTL = int(os.environ.get("REVIEW_APPROVED_TTL", str(14 * 24 * 3600)))
+REVIEW_SWEEP_INTERVAL = int(os.environ.get("REVIEW_SWEEP_INTERVAL", "300"))
+
+# 起動時にSlackのリアクションと承認状況を突き合わせる（停止中に付け外しされたリアクションを反映する）
+RECONCILE_ON_START = os.environ.get("RECONCILE_ON_START", "true").lower() == "true"
+RECONCILE_CONCURRENCY = int(os.environ.get("RECONCILE_CONCURRENCY", "4"))  # 同時に実行するreactions.getの数
+RECONCILE_RATE = float(os.environ.get("RECONCILE_RATE", "0.8"))  # 1秒あたりのreactions.getの回数
+RECONCILE_BURST = int(os.environ.get("RECONCILE_BURST", "5"))
+# 投稿・リジェクト・期限切れで閉じたレビューを残すアーカイブ（空にすると残さない）
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+ARCHIVE_SEGMENT_ROWS = int(os.environ.get("ARCHIVE_SEGMENT_ROWS", "10000"))
+
+MAX_IMAGES = 4
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))  # 1枚あたりの上限
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(40 * 1024 * 1024)))  # 1回の申請あたりの上限
+
+THUMBNAIL_CACHE_BYTES = int(os.environ.get("THUMBNAIL_CACHE_BYTES", str(256 * 1024 * 1024)))
+PREVIEW_THUMBNAIL_WIDTH = 640
+THUMBNAIL_PREGENERATE = os.environ.get("THUMBNAIL_PREGENERATE", "false").lower() == "true"  # アップロード時に生成する
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600  # 画像は内容のハッシュで識別するので長期間キャッシュさせてよい
+IMAGE_ACCEL_REDIRECT = os.environ.get("IMAGE_ACCEL_REDIRECT", "")  # 例: "/protected-uploads/"
+# 複数のレプリカで動かす（レビュー・ジョブ・共有状態のデータベースと画像の保存先を共有すること）
+CLUSTER_ENABLED = os.environ.get("CLUSTER_ENABLED", "false").lower() == "true"
+# 本番モード（--serve=prod）のWebサーバー（gunicorn）の設定
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "2"))  # ワーカープロセス数
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "8"))  # ワーカーごとのスレッド数
+WEB_KEEPALIVE = int(os.environ.get("WEB_KEEPALIVE", "5"))  # Keep-Aliveの接続を保つ秒数
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))  # 停止時に処理中のリクエストを待つ秒数
+WEB_DRAIN_DELAY = float(os.environ.get("WEB_DRAIN_DELAY", "5"))  # /readyzを503にしてから停止を始めるまでの秒数
+WEB_DRAIN_FILE = os.environ.get("WEB_DRAIN_FILE", "")  # このファイルがある間は/readyzが503を返す
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
 template_dir = os.path.join(current_dir, 'templates')
 static_dir = os.path.join(current_dir, 'static')
-uploads_dir = os.path.join(current_dir, 'uploads')
+uploads_dir = os.environ.get("UPLOAD_DIR", os.path.join(current_dir, 'uploads'))
+thumbnail_dir = os.path.join(current_dir, 'cache', 'thumbnails')
+review_db_path = os.environ.get("REVIEW_DB_PATH", os.path.join(current_dir, 'reviews.db'))
+job_db_path = os.environ.get("JOB_DB_PATH", os.path.join(current_dir, 'jobs.db'))
+cluster_db_path = os.environ.get("CLUSTER_DB_PATH", os.path.join(current_dir, 'cluster.db'))
 
 if not os.path.exists(template_dir):
     os.makedirs(template_dir)
@@ -46,11 +143,52 @@ flask_app = Flask(__name__,
                  template_folder=template_dir,
                  static_folder=static_dir)
 flask_app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev_secret_key")
+# 本文などのフォーム項目の分だけ余裕を持たせる（超えた場合はWerkzeugが読み込む前に413を返す）
+flask_app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 1024 * 1024
+startup_profile.mark("Flaskアプリの作成")
+
+if SLACK_API_URL:
+    # Slack Web APIの接続先を差し替える（bench.pyの偽のSlackサーバーなど）
+    app = App(client=WebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL), signing_secret=SIGNING_SECRET,
+              name=os.path.basename(__file__), token_verification_enabled=False)
+else:
+    # トークンの確認（auth.test）は作成時ではなく最初のイベントの処理時に行い、起動を待たせない
+    # nameを指定しないとboltが呼び出し元を調べるためにスタックを読むので、ファイル名を渡しておく
+    app = App(token=SLACK_BOT_TOKEN, signing_secret=SIGNING_SECRET, name=os.path.basename(__file__),
+              token_verification_enabled=False)
+startup_profile.mark("Slackアプリの作成")
+
+# 処理時間などのメトリクス（METRICS_ENABLED=trueの場合だけ記録し、/metricsで公開する）
+HTTP_REQUEST_SECONDS = metrics.Histogram(
+    "http_request_seconds", "Webリクエストの処理時間", ["endpoint", "method", "status"]
+)
+SLACK_HANDLER_SECONDS = metrics.Histogram(
+    "slack_handler_seconds", "Slackのイベント・コマンドの処理時間", ["handler"]
+)
+SLACK_EVENT_LAG_SECONDS = metrics.Histogram(
+    "slack_event_lag_seconds", "Slackでイベントが発生してから処理を始めるまでの時間", ["event"]
+)
+UPLOAD_BYTES = metrics.Histogram(
+    "upload_bytes", "1回の申請でアップロードされた画像の合計バイト数",
+    buckets=(0, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 10 * 1024 * 1024, 20 * 1024 * 1024, 40 * 1024 * 1024),
+)
+REVIEWS_OPEN = metrics.Gauge("reviews_open", "保存されているレビューの件数")
+SLACK_OUTBOX_DEPTH = metrics.Gauge("slack_outbox_queue_depth", "Slackへの送信待ちの件数")
+PUBLISH_JOBS = metrics.Gauge("publish_jobs", "状態ごとの投稿ジョブ数", ["state"])
+REVIEW_MESSAGE_UPDATES = metrics.Counter(
+    "review_message_updates", "レビューのメッセージの更新（sent: 送信、suppressed: 表示が変わらないので省略）", ["result"]
+)
 
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SIGNING_SECRET)
+# Slackへの書き込みはアウトボックス経由でバックグラウンドから送信する
+slack_outbox = SlackOutbox(lambda: app.client, maxsize=SLACK_OUTBOX_SIZE)
+atexit.register(slack_outbox.stop)
 
-# レビューリクエストをIDベースで保存する辞書
-review_requests = {}
+# /registerの名前解決用のユーザー索引（ボット起動時にバックグラウンド更新を開始する）
+user_directory = UserDirectory(lambda: app.client, ttl=USER_DIRECTORY_TTL)
+atexit.register(user_directory.stop)
+
+# レビュー処理の対象となるリアクション
+REVIEW_REACTIONS = frozenset({"review_accept", "review_reject"})
 
 # JWT関連の関数
 def generate_jwt_token(payload):
@@ -111,20 +249,294 @@ def generate_secure_url(base_url, path, params=None):
     url = f"{base_url}{path}?token={token}"
     return url
 
+class VerifiedTokenCache:
+    """
+    検証済みJWTのペイロードをトークンのダイジェストをキーに保持する
+    各エントリはトークンのexpで失効し、件数が上限を超えたら古いものから捨てる
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ダイジェスト -> (ペイロード, exp)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """
+        Returns:
+            Mapping: 有効な検証済みペイロード（キャッシュにない場合はNone）
+        """
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, exp = entry
+            if exp is not None and exp <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, token, payload):
+        """
+        検証済みのペイロードを保存する
+        Returns:
+            Mapping: exp以外のクレームを持つ読み取り専用のペイロード
+        """
+        exp = payload.get("exp")
+        data = MappingProxyType({key: value for key, value in payload.items() if key != "exp"})
+        with self._lock:
+            self._entries[self._digest(token)] = (data, exp)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+
+verified_token_cache = VerifiedTokenCache()
+
+
+class RenderCache:
+    """
+    描画済みのHTMLをキーとバージョンの組で保持する
+    キーごとに最新のバージョンだけを持ち、バージョンが変わったら描画し直す
+    件数が上限を超えたら最近使われていないものから捨てる
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # キー -> (バージョン, HTML)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, version, render):
+        """
+        Args:
+            key: キャッシュのキー（request_idなど）
+            version: 内容のバージョン（変更されるたびに変わる値）
+            render: HTMLを返す関数（キャッシュにない場合だけ呼ぶ）
+        Returns:
+            str: 描画済みのHTML
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        html = render()
+        with self._lock:
+            self._entries[key] = (version, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# プレビューページとレビューフォームの描画結果
+render_cache = RenderCache()
+
+
+class _RenderedMessage:
+    __slots__ = ("status_key", "status_block", "preview_url", "preview_url_expires_at", "preview_block",
+                 "blocks_key", "blocks", "digest", "sent_digest")
+
+    def __init__(self):
+        self.status_key = None
+        self.status_block = None
+        self.preview_url = None
+        self.preview_url_expires_at = 0
+        self.preview_block = None
+        self.blocks_key = None
+        self.blocks = None
+        self.digest = None
+        self.sent_digest = None  # 最後に送信したブロックのハッシュ
+
+
+class ReviewMessageRenderer:
+    """
+    レビューのメッセージのブロックをレビューごとに保持し、変わった部分だけ作り直す
+    - 承認状況の部分は、表示に使う値が変わったときだけ作り直す
+    - プレビューURL（JWTの署名）は有効期限が近づくまで使い回す
+    - 最後に送信したブロックのハッシュを覚えておき、表示が変わらない更新は送信しない
+    件数が上限を超えたら最近使われていないものから捨てる
+    """
+
+    DIVIDER = {"type": "divider"}
+
+    def __init__(self, base_url, max_entries=4096):
+        self.base_url = base_url
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # request_id -> _RenderedMessage
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.suppressed = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, request_id):
+        # self._lockの中で呼ぶ
+        entry = self._entries.get(request_id)
+        if entry is None:
+            entry = self._entries[request_id] = _RenderedMessage()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(request_id)
+        return entry
+
+    def preview_url(self, review):
+        """
+        レビューのプレビューURLを返す
+        URLはレビューごとに一度だけ生成し、有効期限が近づくまで使い回す
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entry(review.request_id)
+            if entry.preview_url is None or entry.preview_url_expires_at - now < PREVIEW_URL_REFRESH_MARGIN:
+                entry.preview_url = generate_secure_url(
+                    self.base_url, f"preview/{review.request_id}", {"request_id": review.request_id}
+                )
+                entry.preview_url_expires_at = now + JWT_EXPIRES_IN
+                entry.preview_block = None
+            return entry.preview_url
+
+    def render(self, review):
+        """
+        Returns:
+            tuple: (ブロックのリスト, ブロックのハッシュ)。ブロックは使い回すので変更しないこと
+        """
+        status_key = (
+            review.author, review.sns, review.account, review.approval_count, REQUIRED_APPROVALS,
+            review.approved, review.rejected, review.expired,
+        )
+        # 削除済みなのでプレビューは表示できない
+        preview_url = None if review.expired else self.preview_url(review)
+        with self._lock:
+            entry = self._entry(review.request_id)
+            if entry.blocks_key == (status_key, preview_url):
+                self.hits += 1
+                return entry.blocks, entry.digest
+            self.misses += 1
+            if entry.status_key != status_key:
+                entry.status_key = status_key
+                entry.status_block = {
+                    "type": "section",
+                    "text": {"type": "mrkdwn", "text": build_review_status_text(review)},
+                }
+            blocks = [entry.status_block]
+            if preview_url is not None:
+                if entry.preview_block is None:
+                    # プレビューページへのリンク（JWT認証付き）
+                    entry.preview_block = {
+                        "type": "section",
+                        "text": {"type": "mrkdwn", "text": f"*投稿内容をプレビュー:*\n{preview_url}"},
+                    }
+                blocks += [self.DIVIDER, entry.preview_block]
+            entry.blocks_key = (status_key, preview_url)
+            entry.blocks = blocks
+            entry.digest = hashlib.sha256(
+                json.dumps(blocks, ensure_ascii=False, sort_keys=True).encode()
+            ).hexdigest()
+            return entry.blocks, entry.digest
+
+    def should_send(self, request_id, digest):
+        """
+        送信済みの内容と違う場合だけTrueを返し、送信済みとして記録する
+        """
+        with self._lock:
+            entry = self._entry(request_id)
+            if entry.sent_digest == digest:
+                self.suppressed += 1
+                REVIEW_MESSAGE_UPDATES.inc(result="suppressed")
+                return False
+            entry.sent_digest = digest
+            self.sent += 1
+            REVIEW_MESSAGE_UPDATES.inc(result="sent")
+            return True
+
+    def mark_sent(self, request_id, digest):
+        """新規に投稿したメッセージの内容を記録する"""
+        with self._lock:
+            self._entry(request_id).sent_digest = digest
+
+    def mark_failed(self, request_id, digest):
+        """送信に失敗したので、次の更新では同じ内容でも送信する"""
+        with self._lock:
+            entry = self._entries.get(request_id)
+            if entry is not None and entry.sent_digest == digest:
+                entry.sent_digest = None
+
+    def forget(self, request_id):
+        """他のレプリカがメッセージを更新した場合などに、保持している内容を捨てる"""
+        with self._lock:
+            self._entries.pop(request_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "sent": self.sent,
+                "suppressed": self.suppressed,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# レビューのメッセージのブロック
+review_renderer = ReviewMessageRenderer(BASE_URL)
+
+
+# 承認済みレビューの投稿ジョブ（予約投稿と/postの両方をここから実行する）
+publish_jobs = JobQueue(job_db_path, max_attempts=PUBLISH_JOB_MAX_ATTEMPTS)
+
 # SNSアカウント情報をJSONから読み込む
-def load_sns_accounts():
-    try:
-        sns_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sns.json')
-        with open(sns_file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"SNSアカウント情報の読み込みに失敗しました: {e}")
-        return {"Twitter": ["公式アカウント", "部門アカウント"], 
-                "Facebook": ["公式ページ"], 
-                "Instagram": ["公式アカウント"]}
+# SNSへの投稿（SNSごとのアダプタで複数アカウントに並行して投稿する）
+# アカウントごとの投稿結果は投稿ジョブに記録するので、再起動後の再実行でも成功済みのアカウントには投稿しない
+publisher = Publisher(max_workers=PUBLISH_WORKERS, completions=publish_jobs)
+for _sns_name, _endpoint in SNS_PUBLISH_ENDPOINTS.items():
+    publisher.register_adapter(_sns_name, HttpAdapter(_endpoint))
+atexit.register(publisher.shutdown)
+
+
+def apply_sns_accounts(snapshot):
+    """
+    SNSアカウント設定の投稿制限とエンドポイントを投稿処理に反映する
+    設定から消えたSNSの投稿制限は既定値に戻し、エンドポイントは環境変数の指定（なければ仮の実装）に戻す
+    """
+    for sns in publisher.limits().keys() - snapshot.limits.keys():
+        publisher.clear_limits(sns)
+    for sns, limits in snapshot.limits.items():
+        publisher.set_limits(sns, *limits)
+
+    endpoints = {**SNS_PUBLISH_ENDPOINTS, **snapshot.endpoints}
+    for sns, adapter in publisher.adapters().items():
+        if isinstance(adapter, HttpAdapter) and sns not in endpoints:
+            publisher.unregister_adapter(sns)
+    for sns, endpoint in endpoints.items():
+        adapter = publisher.adapters().get(sns)
+        if not isinstance(adapter, HttpAdapter) or adapter.endpoint != endpoint:
+            publisher.register_adapter(sns, HttpAdapter(endpoint))
+
 
-# SNSアカウント情報をグローバル変数として保存
-SNS_ACCOUNTS = load_sns_accounts()
+# SNSアカウント情報（sns.jsonを変更すると再起動せずに反映される）
+sns_registry = SnsAccountRegistry(
+    os.path.join(current_dir, 'sns.json'),
+    DEFAULT_SNS_ACCOUNTS,
+    poll_interval=SNS_ACCOUNTS_POLL_INTERVAL,
+    on_change=apply_sns_accounts,
+    lazy=True,
+)
+atexit.register(sns_registry.stop)
 
 # SNSに投稿する関数
 def push_sns(sns_type, account, text, images=None):
@@ -138,59 +550,350 @@ def push_sns(sns_type, account, text, images=None):
     Returns:
         bool: 成功したかどうか
     """
-    logger.info(f"{sns_type}の{account}アカウントに投稿しています...")
-    # ここに実際の投稿処理を実装
-    # 今回は仮の実装としてログ出力のみ行う
-    if images:
-        logger.info(f"画像あり投稿: {len(images)}枚")
-    return True
+    results = publisher.publish([(sns_type, account)], text, images or [], idempotency_key=str(uuid.uuid4()))
+    return results[0].success
+
+class UserIndex:
+    """
+    SlackユーザーIDと小さな整数の対応
+    レビューごとに承認者のID文字列を持たず、番号だけを持つために使う（IDの文字列は1つだけになる）
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._users = []
+        self._lock = threading.Lock()
+
+    def index(self, user):
+        index = self._indexes.get(user)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(user)
+                if index is None:
+                    index = len(self._users)
+                    self._users.append(sys.intern(user))
+                    self._indexes[self._users[index]] = index
+        return index
+
+    def find(self, user):
+        """登録済みのユーザーの番号（未登録ならNone。indexと違って登録しない）"""
+        return self._indexes.get(user)
+
+    def user(self, index):
+        return self._users[index]
+
+
+user_index = UserIndex()
+
+
+def to_epoch(value):
+    """エポック秒、ISO形式、以前の承認日時の形式（%Y-%m-%d-%H:%M）を整数のエポック秒にする"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return int(datetime.datetime.strptime(value, "%Y-%m-%d-%H:%M").timestamp())
+
 
 class ReviewRequest:
-    def __init__(self, author, sns, account, text, channel, request_id=None):
+    """
+    レビューリクエスト
+    大量に保持しても小さくなるように、__slots__を使い、IDなどの文字列はinternし、日時は整数のエポック秒で持つ
+    承認・リジェクトは (ユーザー番号, エポック秒) を並べた整数の配列で持つ（なければNone）
+    """
+
+    __slots__ = (
+        "request_id", "author", "sns", "account", "accounts", "publish_at", "text", "images", "channel", "ts",
+        "_approvals", "_rejections", "approved", "rejected", "created_ts", "version", "expired",
+    )
+
+    def __init__(self, author, sns, account, text, channel, request_id=None, accounts=None):
         self.request_id = request_id if request_id else str(uuid.uuid4())
-        self.author = author
-        self.sns = sns
-        self.account = account
+        self.author = sys.intern(author)
+        self.sns = sys.intern(sns)
+        self.account = sys.intern(account)  # 表示用（複数アカウントの場合は「, 」区切り）
+        self.accounts = tuple(sys.intern(name) for name in accounts) if accounts else (self.account,)  # 投稿先のアカウント
+        self.publish_at = None  # 予約投稿の日時（エポック秒、承認後に自動で投稿される）
         self.text = text
-        self.images = []  # 画像ファイル名のリスト
-        self.channel = channel
+        self.images = ()  # 画像ファイル名のタプル
+        self.channel = sys.intern(channel)
         self.ts = None  # Slackメッセージのタイムスタンプ（投稿時に設定）
-        self.approvals = {}
-        self.rejections = {}
+        self._approvals = None
+        self._rejections = None
         self.approved = False
         self.rejected = False
-        self.created_at = datetime.datetime.now()
+        self.created_ts = int(time.time())
+        self.version = 0  # 承認状況や画像が変わるたびに増える（描画結果のキャッシュに使う）
+        self.expired = False  # 期限切れで削除された（メッセージの表示用、永続化しない）
+
+    @property
+    def created_at(self):
+        return datetime.datetime.fromtimestamp(self.created_ts)
+
+    @created_at.setter
+    def created_at(self, value):
+        self.created_ts = to_epoch(value)
+
+    @staticmethod
+    def _entries_to_dict(entries):
+        if entries is None:
+            return {}
+        return {user_index.user(entries[i]): entries[i + 1] for i in range(0, len(entries), 2)}
+
+    @property
+    def approvals(self):
+        """ユーザーID -> 承認したエポック秒（読み取り専用のコピー）"""
+        return self._entries_to_dict(self._approvals)
+
+    @property
+    def rejections(self):
+        """ユーザーID -> リジェクトしたエポック秒（読み取り専用のコピー）"""
+        return self._entries_to_dict(self._rejections)
+
+    @property
+    def approval_count(self):
+        return len(self._approvals) // 2 if self._approvals is not None else 0
+
+    @staticmethod
+    def _set_entry(entries, user, timestamp):
+        index = user_index.index(user)
+        timestamp = to_epoch(timestamp) if timestamp is not None else int(time.time())
+        if entries is None:
+            return array("q", (index, timestamp))
+        for i in range(0, len(entries), 2):
+            if entries[i] == index:
+                entries[i + 1] = timestamp
+                return entries
+        entries.extend((index, timestamp))
+        return entries
 
-    def add_approval(self, user, timestamp):
-        self.approvals[user] = timestamp
+    @staticmethod
+    def _remove_entry(entries, user):
+        """
+        Returns:
+            tuple: (削除後の配列, 削除したかどうか)
+        """
+        if entries is None:
+            return None, False
+        # 一度も承認・リジェクトしていないユーザーは番号を割り当てずに済ませる
+        index = user_index.find(user)
+        if index is None:
+            return entries, False
+        for i in range(0, len(entries), 2):
+            if entries[i] == index:
+                del entries[i:i + 2]
+                return (entries if entries else None), True
+        return entries, False
+
+    def to_dict(self):
+        """永続化用の辞書に変換する"""
+        return {
+            "request_id": self.request_id,
+            "author": self.author,
+            "sns": self.sns,
+            "account": self.account,
+            "accounts": list(self.accounts),
+            "text": self.text,
+            "images": list(self.images),
+            "channel": self.channel,
+            "ts": self.ts,
+            "approvals": self.approvals,
+            "rejections": self.rejections,
+            "approved": self.approved,
+            "rejected": self.rejected,
+            "publish_at": self.publish_at,
+            "version": self.version,
+            "created_at": self.created_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict()で変換した辞書から復元する"""
+        review = cls(
+            author=data["author"],
+            sns=data["sns"],
+            account=data["account"],
+            text=data["text"],
+            channel=data["channel"],
+            request_id=data["request_id"],
+            accounts=data.get("accounts"),
+        )
+        review.images = tuple(sys.intern(name) for name in data.get("images", []))
+        review.ts = data.get("ts")
+        for user, timestamp in data.get("approvals", {}).items():
+            review._approvals = cls._set_entry(review._approvals, user, timestamp)
+        for user, timestamp in data.get("rejections", {}).items():
+            review._rejections = cls._set_entry(review._rejections, user, timestamp)
+        review.approved = data.get("approved", False)
+        review.rejected = data.get("rejected", False)
+        review.publish_at = data.get("publish_at")
+        review.version = data.get("version", 0)
+        review.created_ts = to_epoch(data["created_at"])
+        return review
+
+    def add_approval(self, user, timestamp=None):
+        self._approvals = self._set_entry(self._approvals, user, timestamp)
+        self.version += 1
 
     def remove_approval(self, user):
-        if user in self.approvals:
-            del self.approvals[user]
+        """
+        Returns:
+            bool: 承認を取り消した場合はTrue
+        """
+        self._approvals, removed = self._remove_entry(self._approvals, user)
+        if removed:
+            self.version += 1
+        return removed
+
+    def add_rejection(self, user, timestamp=None):
+        self._rejections = self._set_entry(self._rejections, user, timestamp)
+        self.version += 1
 
-    def add_rejection(self, user, timestamp):
-        self.rejections[user] = timestamp
+    def try_approve(self, user, timestamp, required_approvals):
+        """
+        承認を追加し、必要数に達していれば承認済みにする（レビューのロック内で呼ぶこと）
+        Returns:
+            bool: この呼び出しで承認済みになった場合のみTrue
+        """
+        if self.rejected:
+            return False
+        self.add_approval(user, timestamp)
+        if self.approved or self.approval_count < required_approvals:
+            return False
+        self.approved = True
+        return True
+
+    def try_reject(self, user, timestamp):
+        """
+        リジェクト済みにする（レビューのロック内で呼ぶこと）
+        Returns:
+            bool: この呼び出しでリジェクト済みになった場合のみTrue
+        """
+        if self.rejected:
+            return False
+        self.rejected = True
+        self.add_rejection(user, timestamp)
+        return True
 
     def remove_rejection(self, user):
-        if user in self.rejections:
-            del self.rejections[user]
+        """
+        Returns:
+            bool: リジェクトを取り消した場合はTrue
+        """
+        self._rejections, removed = self._remove_entry(self._rejections, user)
+        if removed:
+            self.version += 1
+        return removed
             
     def add_image(self, filename):
         """画像ファイル名を追加する"""
-        self.images.append(filename)
+        self.images += (sys.intern(filename),)
+        self.version += 1
             
     def clear_images(self):
         """画像リストをクリアする"""
-        self.images = []
+        self.images = ()
+        self.version += 1
         
     def execute_post(self):
-        """実際にSNSに投稿する"""
+        """
+        実際にSNSに投稿する（すべてのアカウントに並行して投稿し、完了を待たずに返る）
+        request_idをidempotency keyにするので、同じレビューを再度投稿しても二重投稿にはならない
+        Returns:
+            Future: アカウントごとのPublishResultのリストが設定される
+        """
         image_paths = [os.path.join(uploads_dir, img) for img in self.images]
-        return push_sns(self.sns, self.account, self.text, image_paths)
+        targets = [(self.sns, account) for account in self.accounts]
+        return publisher.publish_async(targets, self.text, image_paths, idempotency_key=self.request_id)
+
+
+# レプリカ間の共有状態（変更の通知・イベントの重複排除・ロック・リーダーの選出）
+cluster = Cluster(cluster_db_path, node_id=os.environ.get("CLUSTER_NODE_ID")) if CLUSTER_ENABLED else None
+if cluster is not None:
+    atexit.register(cluster.close)
+
+
+def publish_review_change(request_id):
+    """他のレプリカが読めるように書き込んでから、キャッシュの破棄を通知する"""
+    review_store.flush()
+    cluster.publish("review", request_id)
+
 
+# レビューリクエストの保存先（(channel, ts)や投稿者での検索もここで行う）
+review_store = create_review_store(
+    REVIEW_STORE_BACKEND,
+    ReviewRequest.from_dict,
+    path=review_db_path,
+    cache_size=REVIEW_CACHE_SIZE,
+    on_change=publish_review_change if cluster is not None else None,
+)
+atexit.register(review_store.close)
 
-def build_review_blocks(review: ReviewRequest) -> list:
-    approvals_count = len(review.approvals)
+# 閉じたレビューの列指向アーカイブ（終了時に残りを書き出す）
+review_archive = ReviewArchive(ARCHIVE_DIR, segment_rows=ARCHIVE_SEGMENT_ROWS) if ARCHIVE_DIR else None
+if review_archive is not None:
+    atexit.register(review_archive.close)
+
+
+def archive_review(review, status):
+    """閉じたレビューをアーカイブに追加する（アーカイブしない設定なら何もしない）"""
+    if review_archive is None:
+        return
+    try:
+        review_archive.append(review, status)
+    except Exception as e:
+        logger.error(f"レビューのアーカイブに失敗しました: {review.request_id}: {e}")
+
+# アップロード画像（内容のハッシュで保存し、レビューからの参照数を管理する）
+# クラスタモードでは他のレプリカのレビューが参照している画像を消さないように、削除はリーダーの掃除に任せる
+# 参照数は起動を待たせないように、掃除役やWebサーバーのバックグラウンドのスレッドで数える（load_saved_reviews）
+image_store = ImageStore(uploads_dir, MAX_IMAGE_BYTES, delete_on_release=cluster is None)
+startup_profile.mark("レビューの保存先と画像の準備")
+
+# プレビュー用の縮小画像（Pillowがない場合は元画像を返す）
+thumbnail_cache = thumbnails.ThumbnailCache(thumbnail_dir, THUMBNAIL_CACHE_BYTES) if thumbnails.available() else None
+thumbnail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnail")
+
+# レビューごとのロック。Flaskのスレッドとboltのワーカースレッドから同時に変更されるため、
+# レビューの読み出しから書き戻しまではこのロックの中で行う（クラスタモードではレプリカをまたいで排他する）
+review_locks = ClusterReviewLocks(cluster, ttl=REVIEW_LOCK_TTL) if cluster is not None else ReviewLocks()
+
+
+def once_per_event(handler):
+    """
+    リアクションのハンドラを、同じイベントにつき1つのレプリカだけが実行するようにするデコレータ
+    クラスタモードでは、再送などで複数のレプリカに届いた同じイベントを最初のレプリカだけが処理する
+    処理中は期限付きで権利を持ち、成功したら処理済みにする。失敗した場合は手放して、再送されたイベントで処理し直せるようにする
+    """
+    @functools.wraps(handler)
+    def wrapper(event, *args, **kwargs):
+        # レビューに関係ないリアクションは記録しない
+        if cluster is None or event.get("reaction") not in REVIEW_REACTIONS:
+            return handler(event, *args, **kwargs)
+        item = event.get("item", {})
+        key = ":".join(str(value) for value in (
+            event.get("type"), event.get("user"), event.get("reaction"), item.get("channel"), item.get("ts"),
+            event.get("event_ts"),
+        ))
+        if not cluster.claim(key, ttl=EVENT_CLAIM_TTL):
+            return None
+        try:
+            result = handler(event, *args, **kwargs)
+        except BaseException:
+            cluster.release_claim(key)
+            raise
+        cluster.complete_claim(key)
+        return result
+    return wrapper
+
+
+def build_review_status_text(review: ReviewRequest) -> str:
+    approvals_count = review.approval_count
     
     description_text = f"""
 *<@{review.author}> さんの投稿レビュー*
@@ -202,26 +905,11 @@ def build_review_blocks(review: ReviewRequest) -> list:
         description_text += "\n→ *承認済み*。投稿可能です。"
     elif review.rejected:
         description_text += "\n→ *リジェクト済み*。"
+    elif review.expired:
+        description_text += "\n→ *期限切れ*。投稿する場合は `/review` からもう一度申請してください。"
     else:
         description_text += "\n許可の場合は :review_accept:、却下の場合は :review_reject: を押してください。"
-    
-    # プレビューページへのリンクを追加（JWT認証付き）
-    base_url = os.environ.get("BASE_URL", "http://localhost:5000/")
-    preview_url = generate_secure_url(base_url, f"preview/{review.request_id}", {"request_id": review.request_id})
-    
-    blocks = [
-        {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": description_text.strip()}
-        },
-        {"type": "divider"},
-        {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": f"*投稿内容をプレビュー:*\n{preview_url}"}
-        }
-    ]
-                
-    return blocks
+    return description_text.strip()
 
 
 def update_review_message(review: ReviewRequest):
@@ -233,42 +921,130 @@ def update_review_message(review: ReviewRequest):
         else:
             review_message = f"<@{review.author}>さんの投稿レビューが届いています。レビュワーが設定されていません。"
         
-        blocks = build_review_blocks(review)
+        blocks, digest = review_renderer.render(review)
         
-        response = app.client.chat_postMessage(
-            channel=review.channel,
-            text=review_message,
-            blocks=blocks
-        )
+        # tsがないとリアクションと紐付けられないので、ここだけは送信完了を待つ
+        # 投稿できなかった場合はtsを空のままにしておき、repost_unposted_reviews()で投稿し直す
+        try:
+            future = slack_outbox.call(
+                "chat_postMessage",
+                channel=review.channel,
+                text=review_message,
+                blocks=blocks
+            )
+        except OutboxFull as e:
+            logger.error(f"レビューのメッセージを投稿できませんでした（後で投稿し直します）: {review.request_id}: {e}")
+            return
+        try:
+            response = future.result(timeout=SLACK_POST_TIMEOUT)
+        except FutureTimeoutError:
+            # レビューのロックを持ったまま待ち続けないように、tsは投稿が終わったときに別のスレッドで保存する
+            logger.warning(f"レビューのメッセージの投稿が{SLACK_POST_TIMEOUT:.0f}秒以内に終わりませんでした: {review.request_id}")
+            future.add_done_callback(lambda f: threading.Thread(
+                target=save_review_ts, args=(review.request_id, f, digest), daemon=True
+            ).start())
+            return
+        except Exception as e:
+            logger.error(f"レビューのメッセージを投稿できませんでした（後で投稿し直します）: {review.request_id}: {e}")
+            return
         review.ts = response["ts"]
+        review_store.put(review)
+        review_renderer.mark_sent(review.request_id, digest)
     else:
-        # 既存メッセージの更新
-        blocks = build_review_blocks(review)
+        # 既存メッセージの更新。表示が変わらない場合は送信しない
+        # （textは通知用の代替テキストで、表示されるのはブロックなので比べない）
+        blocks, digest = review_renderer.render(review)
+        if not review_renderer.should_send(review.request_id, digest):
+            return
         try:
-            app.client.chat_update(
-                channel=review.channel,
-                ts=review.ts,
+            # 未送信の更新があれば最新の内容にまとめられる
+            future = slack_outbox.update_message(
+                review.channel,
+                review.ts,
                 text="レビュー内容を更新しました",
                 blocks=blocks
             )
-        except Exception as e:
+        except OutboxFull as e:
+            review_renderer.mark_failed(review.request_id, digest)
             logger.error(f"メッセージ更新エラー: {e}")
+            return
+
+        def on_done(f):
+            if f.exception() is not None:
+                review_renderer.mark_failed(review.request_id, digest)
+
+        future.add_done_callback(on_done)
+
+
+def save_review_ts(request_id, future, digest):
+    """時間内に終わらなかったレビューのメッセージの投稿結果を保存する"""
+    try:
+        response = future.result()
+    except Exception as e:
+        logger.error(f"レビューのメッセージの投稿に失敗しました: {request_id}: {e}")
+        return
+    with review_locks.lock_for(request_id):
+        review = review_store.get(request_id)
+        if review is None or review.ts:
+            return
+        review.ts = response["ts"]
+        review_store.put(review)
+        review_renderer.mark_sent(request_id, digest)
+
+
+def repost_unposted_reviews():
+    """
+    メッセージを投稿できなかったレビューを投稿し直す
+    投稿中のものと二重にならないように、作成からREVIEW_REPOST_DELAY秒以上経ったものだけを対象にする
+    """
+    if cluster is not None and not cluster.is_leader():
+        return
+    cutoff = time.time() - REVIEW_REPOST_DELAY
+    for review in review_store.find_unposted():
+        if review.created_ts > cutoff:
+            continue
+        with review_locks.lock_for(review.request_id):
+            review = review_store.get(review.request_id)
+            if review is None or review.ts:
+                continue
+            logger.info(f"レビューのメッセージを投稿し直します: {review.request_id}")
+            update_review_message(review)
+
+
+# 送信キューが満杯で送れなかった通知 (channel, text)。retry_deferred_messages()で送り直す
+deferred_notices = deque()
+
+
+def send_notice(channel, text):
+    """チャンネルに通知を送る（送信キューが満杯の場合は取っておいて後で送り直す）"""
+    try:
+        slack_outbox.call("chat_postMessage", channel=channel, text=text)
+    except OutboxFull as e:
+        logger.error(f"通知を送信できませんでした（後で送り直します）: {e}")
+        deferred_notices.append((channel, text))
+
+
+def retry_deferred_messages():
+    """送れなかった通知とレビューのメッセージを送り直す（掃除役から定期的に呼ぶ）"""
+    for _ in range(len(deferred_notices)):
+        channel, text = deferred_notices.popleft()
+        send_notice(channel, text)
+    repost_unposted_reviews()
 
 
 @app.command("/review")
+@metrics.timed(SLACK_HANDLER_SECONDS, handler="review_command")
 def handle_review_command(ack, body, logger):
     ack()
     user_id = body["user_id"]
     channel_id = body["channel_id"]
     
-    base_url = os.environ.get("BASE_URL", "http://localhost:5000/")
-    
     # JWTトークン付きのURLを生成
     params = {
         "user_id": user_id,
         "channel_id": channel_id
     }
-    review_url = generate_secure_url(base_url, "review_form", params)
+    review_url = generate_secure_url(BASE_URL, "review_form", params)
     
     app.client.chat_postEphemeral(
         channel=channel_id,
@@ -278,79 +1054,129 @@ def handle_review_command(ack, body, logger):
 
 
 @app.event("reaction_added")
+@metrics.timed(SLACK_HANDLER_SECONDS, handler="reaction_added")
+@once_per_event
 def handle_reaction_added(event, logger):
+    if metrics.ENABLED and "event_ts" in event:
+        SLACK_EVENT_LAG_SECONDS.observe(time.time() - float(event["event_ts"]), event="reaction_added")
     reaction = event.get("reaction")
     user = event.get("user")
     item = event.get("item", {})
     ts = item.get("ts")
     channel = item.get("channel")
     
-    # tsに一致するレビューリクエストを探す
-    for request_id, review in review_requests.items():
-        if review.ts == ts and review.channel == channel:
-            if reaction == "review_accept":
-                # レビューが却下済みの場合は何もしない
-                if review.rejected:
-                    return
-                    
-                review.add_approval(user, time.strftime("%Y-%m-%d-%H:%M"))
+    # レビューに関係ないリアクションは検索せずに無視する
+    if reaction not in REVIEW_REACTIONS:
+        return
+
+    # (channel, ts)に一致するレビューリクエストを探す
+    review = review_store.get_by_message(channel, ts)
+    if review is None:
+        return
+
+    approved_now = False
+    rejected_now = False
+    with log_context(review.request_id), metrics.span("reaction_added", review.request_id, reaction=reaction), \
+            review_locks.lock_for(review.request_id):
+        # ロックを取るまでに他のスレッドが変更・削除している可能性があるので読み直す
+        review = review_store.get(review.request_id)
+        if review is None:
+            return
+
+        if reaction == "review_accept":
+            # レビューが却下済みの場合は何もしない
+            if review.rejected:
+                return
                 
-                # 必要な承認数に達した場合すぐに承認
-                if len(review.approvals) >= REQUIRED_APPROVALS and not review.approved:
-                    review.approved = True
-                    
-                    # まずレビューメッセージを更新
-                    update_review_message(review)
-                    
-                    # 次に承認通知を送信
-                    app.client.chat_postMessage(
-                        channel=review.channel,
-                        text=f"<@{review.author}>さんの投稿は必要数のレビュワーによって承認されました。"
-                    )
-                else:
-                    # 承認数が足りない場合は、通常のメッセージ更新のみ
-                    update_review_message(review)
-                    
-            elif reaction == "review_reject":
-                # 即座にリジェクト処理
-                if not review.rejected:
-                    review.rejected = True
-                    review.add_rejection(user, time.strftime("%Y-%m-%d-%H:%M"))
-                    
-                    # リジェクトメッセージを送信
-                    reject_message = f"<@{review.author}>さんの投稿は <@{user}>さんによってリジェクトされました。"
-                    app.client.chat_postMessage(channel=review.channel, text=reject_message)
-                    
-                    # レビューリクエストの削除
-                    del review_requests[request_id]
-            break
+            # 必要な承認数に達した場合すぐに承認（承認済みへの遷移は1回だけ）
+            approved_now = review.try_approve(user, int(time.time()), REQUIRED_APPROVALS)
+            review_store.put(review)
+            if approved_now:
+                # 承認済みのレビューは期限が延びる
+                review_sweeper.track(review)
+            
+            # まずレビューメッセージを更新
+            update_review_message(review)
+                
+        elif reaction == "review_reject":
+            # 即座にリジェクト処理（リジェクト済みへの遷移は1回だけ）
+            rejected_now = review.try_reject(user, int(time.time()))
+            if rejected_now:
+                close_rejected_review(review)
+
+    if approved_now:
+        announce_approval(review)
+    elif rejected_now:
+        announce_rejection(review, user)
+
+
+def close_rejected_review(review):
+    """リジェクトしたレビューを削除し、アーカイブに残す（レビューのロック内で呼ぶこと）"""
+    review_store.delete(review.request_id)
+    review_sweeper.forget(review.request_id)
+    image_store.release(review.images)
+    archive_review(review, "rejected")
+
+
+def announce_approval(review):
+    """承認済みになったことを通知し、予約投稿なら投稿ジョブを追加する"""
+    approval_message = f"<@{review.author}>さんの投稿は必要数のレビュワーによって承認されました。"
+    if review.publish_at:
+        # 予約投稿は指定日時に自動で投稿する
+        enqueue_publish_job(review, review.channel, run_at=review.publish_at)
+        publish_time = datetime.datetime.fromtimestamp(review.publish_at).strftime("%Y-%m-%d %H:%M")
+        approval_message += f"\n{publish_time}に自動で投稿されます。"
+    send_notice(review.channel, approval_message)
+
+
+def announce_rejection(review, user):
+    reject_message = f"<@{review.author}>さんの投稿は <@{user}>さんによってリジェクトされました。"
+    send_notice(review.channel, reject_message)
 
 
 @app.event("reaction_removed")
+@metrics.timed(SLACK_HANDLER_SECONDS, handler="reaction_removed")
+@once_per_event
 def handle_reaction_removed(event, logger):
+    if metrics.ENABLED and "event_ts" in event:
+        SLACK_EVENT_LAG_SECONDS.observe(time.time() - float(event["event_ts"]), event="reaction_removed")
     reaction = event.get("reaction")
     user = event.get("user")
     item = event.get("item", {})
     ts = item.get("ts")
     channel = item.get("channel")
     
-    # tsに一致するレビューリクエストを探す
-    for request_id, review in review_requests.items():
-        if review.ts == ts and review.channel == channel:
-            # リジェクト済みまたは承認済みの場合はリアクション削除の効果を無効化
-            if review.rejected or review.approved:
-                return
+    # レビューに関係ないリアクションは検索せずに無視する
+    if reaction not in REVIEW_REACTIONS:
+        return
+
+    # (channel, ts)に一致するレビューリクエストを探す
+    review = review_store.get_by_message(channel, ts)
+    if review is None:
+        return
+
+    with review_locks.lock_for(review.request_id):
+        review = review_store.get(review.request_id)
+        if review is None:
+            return
 
-            if reaction == "review_accept":
-                review.remove_approval(user)
-                update_review_message(review)
-            elif reaction == "review_reject":
-                review.remove_rejection(user)
-                update_review_message(review)
-            break
+        # リジェクト済みまたは承認済みの場合はリアクション削除の効果を無効化
+        if review.rejected or review.approved:
+            return
+
+        if reaction == "review_accept":
+            removed = review.remove_approval(user)
+        else:
+            removed = review.remove_rejection(user)
+        # 付けていないリアクションの取り消しなどで何も変わらなければ保存も更新もしない
+        if not removed:
+            return
+        review_store.put(review)
+        update_review_message(review)
 
 
 @app.command("/register")
+@metrics.timed(SLACK_HANDLER_SECONDS, handler="register_command")
 def handle_register_command(ack, body, logger):
     ack()
     user_id = body["user_id"]
@@ -378,30 +1204,7 @@ def handle_register_command(ack, body, logger):
 
         logger.debug(f"Try to find Slack user whose display_name, real_name, or name is '{possible_name}'")
         try:
-            all_members = []
-            cursor = None
-            while True:
-                response = app.client.users_list(cursor=cursor)
-                members = response.get("members", [])
-                all_members.extend(members)
-                cursor = response.get("response_metadata", {}).get("next_cursor")
-                if not cursor:
-                    break
-
-            matched_user_id = None
-            for mem in all_members:
-                profile = mem.get("profile", {})
-                display_name = profile.get("display_name", "") or ""
-                real_name = profile.get("real_name", "") or ""
-                slack_name = mem.get("name", "") or ""
-
-                if (
-                    display_name.lower() == possible_name.lower() or
-                    real_name.lower() == possible_name.lower() or
-                    slack_name.lower() == possible_name.lower()
-                ):
-                    matched_user_id = mem.get("id")
-                    break
+            matched_user_id = user_directory.lookup(possible_name)
 
             if matched_user_id:
                 new_reviewer = matched_user_id
@@ -419,55 +1222,365 @@ def handle_register_command(ack, body, logger):
             app.client.chat_postEphemeral(channel=channel_id, user=user_id, text=error_message)
             return
 
-    global REVIEWER_IDS
-    if new_reviewer in REVIEWER_IDS:
+    if not add_reviewer(new_reviewer):
         error_message = f"<@{new_reviewer}> は既にレビュワーに登録されています。"
         app.client.chat_postEphemeral(channel=channel_id, user=user_id, text=error_message)
         return
 
-    REVIEWER_IDS.append(new_reviewer)
-    logger.debug(f"New reviewer added: {new_reviewer}, updated REVIEWER_IDS: {REVIEWER_IDS}")
+    logger.info(f"レビュワーを追加しました: {new_reviewer}（{len(REVIEWER_IDS)}人）")
     app.client.chat_postMessage(
         channel=channel_id,
         text=f"<@{new_reviewer}> をレビュワーに追加しました。"
     )
 
 
+def load_shared_reviewers():
+    """他のレプリカで/registerされたレビュワーを読み込む"""
+    for uid in json.loads(cluster.get_setting("reviewers", "[]")):
+        if uid not in REVIEWER_IDS:
+            REVIEWER_IDS.append(uid)
+
+
+def add_reviewer(user_id):
+    """
+    レビュワーを追加する（クラスタモードでは他のレプリカにも反映する）
+    Returns:
+        bool: 追加した場合はTrue（登録済みの場合はFalse）
+    """
+    if cluster is None:
+        if user_id in REVIEWER_IDS:
+            return False
+        REVIEWER_IDS.append(user_id)
+        return True
+    with cluster.lease("reviewers"):
+        load_shared_reviewers()
+        if user_id in REVIEWER_IDS:
+            return False
+        REVIEWER_IDS.append(user_id)
+        cluster.set_setting("reviewers", json.dumps(REVIEWER_IDS))
+    cluster.publish("reviewers")
+    return True
+
+
+@app.event("user_change")
+def handle_user_change(event, logger):
+    user_directory.upsert(event.get("user", {}))
+
+
+@app.event("team_join")
+def handle_team_join(event, logger):
+    user_directory.upsert(event.get("user", {}))
+
+
+def run_publish_job(job):
+    """
+    投稿ジョブを実行する（ジョブキューのワーカースレッドから呼ばれる）
+    すべてのアカウントへの投稿に成功した場合だけレビューを削除する
+    失敗した場合は例外を送出してジョブを再試行させる（成功済みのアカウントには再投稿されない）
+    """
+    review = review_store.get(job.id)
+    if review is None:
+        # 投稿済みまたは削除済み
+        return
+    
+    with log_context(job.id), metrics.span("publish_job", job.id, attempt=job.attempts):
+        results = review.execute_post().result()
+    failed = [result for result in results if not result.success]
+    if failed:
+        raise PublishError(", ".join(f"{result.account}: {result.error}" for result in failed))
+    
+    with review_locks.lock_for(review.request_id):
+        review_store.delete(review.request_id)
+    review_sweeper.forget(review.request_id)
+    image_store.release(review.images)
+    archive_review(review, "posted")
+    
+    # 投稿成功メッセージを送信
+    send_notice(
+        job.payload["channel"],
+        f"<@{review.author}>さんの投稿が{review.sns}（{review.account}）で実行されました。"
+    )
+
+
+def report_dead_publish_job(job, error):
+    """再試行しても投稿できなかったことをSlackに通知する"""
+    review = review_store.get(job.id)
+    if review is None:
+        return
+    # 投稿失敗メッセージを送信
+    send_notice(
+        job.payload["channel"],
+        f"<@{review.author}>さんの投稿が{review.sns}で失敗しました（{error}）。`/post` で再試行できます。"
+    )
+
+
+def enqueue_publish_job(review, channel_id, run_at=None):
+    """
+    レビューの投稿ジョブを追加する
+    Returns:
+        bool: 追加した場合はTrue（すでに投稿待ちの場合はFalse）
+    """
+    return publish_jobs.enqueue(review.request_id, {"channel": channel_id}, run_at=run_at)
+
+
+# 投稿ジョブのワーカー（ボット起動時に開始する）
+publish_workers = JobWorkerPool(
+    publish_jobs,
+    run_publish_job,
+    workers=PUBLISH_JOB_WORKERS,
+    on_dead=report_dead_publish_job,
+)
+atexit.register(publish_workers.stop)
+
+
+def review_deadline(review):
+    """
+    レビューの期限（エポック秒）
+    予約投稿は投稿日時までは削除しない
+    """
+    ttl = REVIEW_APPROVED_TTL if review.approved else REVIEW_PENDING_TTL
+    if ttl <= 0:
+        return None
+    deadline = review.created_ts + ttl
+    if review.publish_at:
+        deadline = max(deadline, review.publish_at + ttl)
+    return deadline
+
+
+def expire_review(review):
+    """
+    期限切れのレビューを削除し、Slackのメッセージを期限切れの表示に更新する
+    Returns:
+        int: 削除した画像のバイト数（投稿中のため削除しなかった場合はNone）
+    """
+    with review_locks.lock_for(review.request_id):
+        review = review_store.get(review.request_id)
+        if review is None:
+            return 0
+        if publish_jobs.state(review.request_id) == "leased":
+            return None
+        # 実行待ちの投稿ジョブがあれば取り消す
+        publish_jobs.cancel(review.request_id)
+        review_store.delete(review.request_id)
+        review.expired = True
+        if review.ts:
+            update_review_message(review)
+    logger.info(f"期限切れのレビューを削除しました: {review.request_id}")
+    archive_review(review, "expired")
+    return image_store.release(review.images)
+
+
+def collect_garbage():
+    """参照されていない画像と古い完了済みジョブを削除する"""
+    if cluster is not None:
+        # 他のレプリカで作成・削除されたレビューの分も含めて参照数を数え直す
+        image_store.rebuild_refcounts(review_store.all)
+    count, reclaimed = image_store.sweep_orphans()
+    purged = publish_jobs.purge(REVIEW_APPROVED_TTL or 7 * 24 * 3600)
+    if purged:
+        logger.info(f"完了済みの投稿ジョブを{purged}件削除しました")
+    return count, reclaimed
+
+
+def load_saved_reviews():
+    """
+    保存済みのレビューを返し、画像の参照数をまだ数えていなければ数える
+    起動を待たせないように、掃除役とWebサーバーのプロセスのバックグラウンドのスレッドで呼ぶ
+    """
+    if image_store.loaded:
+        return review_store.all()
+    reviews = []
+
+    def load():
+        reviews.extend(review_store.all())
+        return reviews
+
+    start = time.perf_counter()
+    image_store.rebuild_refcounts(load)
+    logger.info(f"画像の参照数を数えました: レビュー{len(reviews)}件（{time.perf_counter() - start:.2f}秒）")
+    return reviews
+
+
+# 期限切れのレビューと孤立した画像の掃除（ボット起動時に開始する）
+review_sweeper = ReviewSweeper(
+    review_store,
+    review_deadline,
+    expire_review,
+    interval=REVIEW_SWEEP_INTERVAL,
+    housekeeping=collect_garbage,
+    active=cluster.is_leader if cluster is not None else None,
+    load=load_saved_reviews,
+    retry=retry_deferred_messages,
+)
+atexit.register(review_sweeper.stop)
+
+
+def on_review_changed(request_id):
+    """他のレプリカでレビューが変更・削除された"""
+    review_store.invalidate(request_id)
+    # 他のレプリカがメッセージを更新しているので、送信済みの内容は当てにならない
+    review_renderer.forget(request_id)
+    if cluster.is_leader():
+        # 期限切れの掃除はリーダーが行うので、他のレプリカで作成・承認されたレビューの期限も管理する
+        review = review_store.get(request_id)
+        if review is None:
+            review_sweeper.forget(request_id)
+        else:
+            review_sweeper.track(review)
+
+
+if cluster is not None:
+    load_shared_reviewers()
+    cluster.subscribe("review", on_review_changed)
+    cluster.subscribe("reviewers", lambda key: load_shared_reviewers())
+    cluster.on_elected(lambda: review_sweeper.rebuild(review_store.all()))
+
+
+def reconcile_review(review, reactions, version):
+    """
+    Slackから取得したリアクションをレビューに反映する（ReactionReconcilerから呼ぶ）
+    リアクションのイベントと同じ規則で、リジェクトが1つでもあればリジェクト済みに、承認が必要数に達していれば承認済みにする
+    承認済みのレビューでは承認の取り消しは反映しない
+    Args:
+        review: 取得前に読み出したレビュー
+        reactions: リアクション名 -> ユーザーIDのリスト
+        version: 取得前のreview.version
+    Returns:
+        str: "approved", "rejected", "updated", "unchanged", "closed", "stale" のいずれか
+    """
+    accepted = reactions.get("review_accept", ())
+    rejecters = reactions.get("review_reject", ())
+    now = int(time.time())
+    approved_now = False
+    with log_context(review.request_id), review_locks.lock_for(review.request_id):
+        review = review_store.get(review.request_id)
+        if review is None:
+            return "closed"
+        if review.version != version:
+            # 取得中にリアクションのイベントで変更された（取得し直す）
+            return "stale"
+
+        if rejecters and not review.rejected:
+            user = rejecters[0]
+            review.try_reject(user, now)
+            close_rejected_review(review)
+            rejected_by = user
+        else:
+            rejected_by = None
+            changed = False
+            if not review.approved:
+                for user in set(review.approvals) - set(accepted):
+                    review.remove_approval(user)
+                    changed = True
+            current = review.approvals
+            for user in accepted:
+                if user not in current:
+                    approved_now |= review.try_approve(user, now, REQUIRED_APPROVALS)
+                    changed = True
+            if not review.approved and not review.rejected and review.approval_count >= REQUIRED_APPROVALS:
+                # REQUIRED_APPROVALSを減らして起動し直した場合
+                review.approved = True
+                review.version += 1
+                approved_now = True
+            if not changed and not approved_now:
+                return "unchanged"
+            review_store.put(review)
+            if approved_now:
+                review_sweeper.track(review)
+            update_review_message(review)
+
+    if rejected_by is not None:
+        announce_rejection(review, rejected_by)
+        return "rejected"
+    if approved_now:
+        announce_approval(review)
+        return "approved"
+    return "updated"
+
+
+# 停止中に付け外しされたリアクションの反映（ボット起動時、クラスタモードではリーダーになったときに実行する）
+reaction_reconciler = ReactionReconciler(
+    lambda: app.client,
+    review_store.get,
+    reconcile_review,
+    concurrency=RECONCILE_CONCURRENCY,
+    rate=RECONCILE_RATE,
+    burst=RECONCILE_BURST,
+)
+atexit.register(reaction_reconciler.stop)
+
+
+def start_reconciler():
+    if RECONCILE_ON_START:
+        reaction_reconciler.start(review_store.all)
+
+
+if cluster is not None:
+    cluster.on_elected(start_reconciler)
+
+def format_review_summary(review):
+    """/postの一覧表示用の1行"""
+    text = review.text.replace("\n", " ")
+    if len(text) > 30:
+        text = text[:30] + "…"
+    line = f"• `{review.request_id[:8]}` {review.sns}（{review.account}）: {text}"
+    if publish_jobs.state(review.request_id) in ("queued", "leased"):
+        line += " [投稿待ち]"
+    return line
+
+
 @app.command("/post")
+@metrics.timed(SLACK_HANDLER_SECONDS, handler="post_command")
 def handle_post_command(ack, body, logger):
+    """
+    承認済みの投稿を実行する
+    /post            承認済みの投稿が1件ならそれを投稿、複数なら一覧を表示
+    /post <ID>       指定した投稿を実行（IDは一覧に表示される先頭8文字でよい）
+    /post list       承認済みの投稿を一覧表示
+    /post all        承認済みの投稿をすべて実行
+    """
     ack()
     user_id = body["user_id"]
     channel_id = body["channel_id"]
+    arg = body.get("text", "").strip()
 
-    # ユーザーが承認済みの投稿リクエストを探す
-    for request_id, review in list(review_requests.items()):
-        if review.author == user_id and review.approved:
-            # SNSへの投稿を実行
-            success = review.execute_post()
-            
-            if success:
-                # 投稿成功メッセージを送信
-                app.client.chat_postMessage(
-                    channel=channel_id,
-                    text=f"<@{user_id}>さんの投稿が{review.sns}で実行されました。"
-                )
-            else:
-                # 投稿失敗メッセージを送信
-                app.client.chat_postMessage(
-                    channel=channel_id,
-                    text=f"<@{user_id}>さんの投稿が{review.sns}で失敗しました。"
-                )
-            
-            # 投稿後、レビューリクエストを削除
-            del review_requests[request_id]
+    def reply(text):
+        app.client.chat_postEphemeral(channel=channel_id, user=user_id, text=text)
+
+    # ユーザーの承認済みの投稿リクエスト（投稿者ごとのインデックスから取得）
+    approved_reviews = review_store.find_approved_by_author(user_id)
+    if not approved_reviews:
+        reply("該当する承認済みの投稿が見つかりません。")
+        return
+
+    if arg == "list" or (not arg and len(approved_reviews) > 1):
+        lines = [format_review_summary(review) for review in approved_reviews]
+        reply(
+            "承認済みの投稿:\n" + "\n".join(lines)
+            + "\n\n`/post <ID>` で指定した投稿を、`/post all` ですべての投稿を実行します。"
+        )
+        return
+
+    if arg == "all" or not arg:
+        targets = approved_reviews
+    else:
+        targets = [review for review in approved_reviews if review.request_id.startswith(arg)]
+        if not targets:
+            reply(f"ID `{arg}` に該当する承認済みの投稿が見つかりません。`/post list` で一覧を確認できます。")
             return
-    
-    # 該当する承認済み投稿がない場合
-    app.client.chat_postEphemeral(
-        channel=channel_id,
-        user=user_id,
-        text="該当する承認済みの投稿が見つかりません。"
-    )
+        if len(targets) > 1:
+            reply(f"ID `{arg}` に該当する投稿が複数あります。もう少し長くIDを指定してください。")
+            return
+
+    # 投稿ジョブを追加する（投稿待ちのものは重複して追加されない）
+    accepted = [review for review in targets if enqueue_publish_job(review, channel_id)]
+    if accepted:
+        names = "、".join(f"{review.sns}（{review.account}）" for review in accepted)
+        reply(f"{names}への投稿を受け付けました。完了したらお知らせします。")
+    elif len(targets) == 1:
+        reply("この投稿はすでに投稿待ちです。")
+    else:
+        reply("承認済みの投稿はすべて投稿待ちです。")
 
 
 # JWTトークンの検証を行うデコレータ
@@ -480,24 +1593,25 @@ def require_jwt_auth(f):
         if not token:
             return "認証が必要です", 401
         
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            # 毎回新しいjwt_dataオブジェクトを作成する
-            request.jwt_data = {}
-            for key, value in payload.items():
-                if key != 'exp':  # expは有効期限なので除外
-                    request.jwt_data[key] = value
-            
-            return f(*args, **kwargs)
-        except jwt.ExpiredSignatureError:
-            logger.error("JWTトークンの有効期限が切れています")
-            return "トークンの有効期限が切れています", 401
-        except jwt.InvalidTokenError as e:
-            logger.error(f"無効なJWTトークンです: {e}")
-            return "無効なトークンです", 401
-        except Exception as e:
-            logger.error(f"JWT検証中のエラー: {e}")
-            return "認証エラーが発生しました", 401
+        # 検証済みのトークンなら署名の検証を省略する
+        jwt_data = verified_token_cache.get(token)
+        if jwt_data is None:
+            try:
+                payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+            except jwt.ExpiredSignatureError:
+                logger.error("JWTトークンの有効期限が切れています")
+                return "トークンの有効期限が切れています", 401
+            except jwt.InvalidTokenError as e:
+                logger.error(f"無効なJWTトークンです: {e}")
+                return "無効なトークンです", 401
+            except Exception as e:
+                logger.error(f"JWT検証中のエラー: {e}")
+                return "認証エラーが発生しました", 401
+            jwt_data = verified_token_cache.put(token, payload)
+        
+        # キャッシュと共有する読み取り専用のペイロード（expは除外済み）
+        request.jwt_data = jwt_data
+        return f(*args, **kwargs)
     
     # FlaskでデコレータをMETHOD名に合わせて設定
     decorated_function.__name__ = f.__name__
@@ -514,73 +1628,108 @@ def review_form():
     if not user_id or not channel_id:
         return "Invalid parameters", 400
     
-    # SNSアカウント情報を取得してテンプレートに渡す
-    return render_template("review_form.html", 
-                           user_id=user_id, 
-                           channel_id=channel_id,
-                           sns_accounts=SNS_ACCOUNTS)
+    # フォームはユーザーによらず同じ内容なので描画結果を使い回す
+    # （送信先のトークンはページのURLから、ユーザーとチャンネルはトークンから取得する）
+    # エラーメッセージを表示する場合だけ描画し直す
+    # （SNSアカウント設定が変わったら描画し直す）
+    accounts = sns_registry.snapshot
+    if get_flashed_messages():
+        return render_template("review_form.html", sns_accounts=accounts.form_accounts())
+    return render_cache.get_or_render(
+        "review_form",
+        accounts.version,
+        lambda: render_template("review_form.html", sns_accounts=accounts.form_accounts()),
+    )
 
 
 @flask_app.route("/submit_review", methods=["POST"])
 @require_jwt_auth
 def submit_review():
-    global review_requests
-    
-    user_id = request.form.get("user_id")
-    channel_id = request.form.get("channel_id")
+    # 申請者と投稿先のチャンネルはフォームの値ではなくトークンから取得する
+    user_id = request.jwt_data.get("user_id")
+    channel_id = request.jwt_data.get("channel_id")
+    form_url = url_for("review_form", token=request.args.get("token"))
     sns = request.form.get("sns")
-    account = request.form.get("account")
+    accounts = request.form.getlist("account")
     post_text = request.form.get("post_text")
+    publish_at_text = request.form.get("publish_at", "").strip()
     
-    # 指定されたSNSが存在するか確認
-    if sns not in SNS_ACCOUNTS:
+    # 指定されたSNSが存在するか確認（検証中に設定が差し替わっても同じスナップショットで確認する）
+    sns_accounts = sns_registry.snapshot
+    if not sns_accounts.has_sns(sns):
         flash(f"指定されたSNS({sns})は設定されていません。")
-        return redirect(url_for("review_form", user_id=user_id, channel_id=channel_id))
+        return redirect(form_url)
     
     # アカウントが正しいか確認
-    if account not in SNS_ACCOUNTS.get(sns, []):
-        flash(f"指定されたアカウント({account})は、{sns}の設定と一致しません。")
-        return redirect(url_for("review_form", user_id=user_id, channel_id=channel_id))
+    for account in accounts:
+        if not sns_accounts.has_account(sns, account):
+            flash(f"指定されたアカウント({account})は、{sns}の設定と一致しません。")
+            return redirect(form_url)
     
-    if not all([user_id, channel_id, sns, account, post_text]):
+    if not all([user_id, channel_id, sns, accounts, post_text]):
         flash("すべての必須フィールドを入力してください。")
-        return redirect(url_for("review_form", user_id=user_id, channel_id=channel_id))
+        return redirect(form_url)
+    
+    # 予約投稿の日時（任意、サーバーのローカル時刻として解釈する）
+    publish_at = None
+    if publish_at_text:
+        try:
+            publish_at = datetime.datetime.fromisoformat(publish_at_text).timestamp()
+        except ValueError:
+            flash(f"予約投稿の日時({publish_at_text})が正しくありません。")
+            return redirect(form_url)
     
     # 新しいレビューリクエストの作成
     review = ReviewRequest(
         author=user_id,
         sns=sns,
-        account=account,
+        account=", ".join(accounts),
         text=post_text,
-        channel=channel_id
+        channel=channel_id,
+        accounts=accounts
     )
+    review.publish_at = publish_at
     
     # アップロードされた画像の処理
-    files = request.files.getlist("images")
+    files = [file for file in request.files.getlist("images") if file and file.filename]
+    if len(files) > MAX_IMAGES:
+        flash(f"画像は最大{MAX_IMAGES}枚までアップロードできます。")
+        return redirect(form_url)
     
+    remaining_bytes = MAX_UPLOAD_BYTES
     for file in files:
-        if file and file.filename:
-            try:
-                # 一意のファイル名を生成
-                filename = f"{review.request_id}_{uuid.uuid4()}_{file.filename}"
-                file_path = os.path.join(uploads_dir, filename)
-                
-                # ファイルを保存
-                file.save(file_path)
-                logger.debug(f"画像ファイルを保存しました: {file_path}")
-                
-                # レビューリクエストに画像を追加
-                review.add_image(filename)
-                
-            except Exception as e:
-                logger.error(f"画像の保存に失敗しました: {e}")
-                flash(f"画像 {file.filename} のアップロードに失敗しました。")
+        try:
+            # チャンクごとにディスクへ書き込みながらハッシュを計算して保存（同じ画像は1つだけ保存される）
+            filename, size = image_store.save_stream(file.stream, max_bytes=remaining_bytes)
+            remaining_bytes -= size
+            logger.debug(f"画像ファイルを保存しました: {filename} ({size}バイト)")
+            
+            # レビューリクエストに画像を追加
+            review.add_image(filename)
+
+            if thumbnail_cache is not None and THUMBNAIL_PREGENERATE:
+                # プレビューで使う大きさのサムネイルを先に作っておく
+                for fmt in ("webp", "jpeg"):
+                    thumbnail_executor.submit(
+                        thumbnail_cache.get, image_store.path(filename), os.path.splitext(filename)[0],
+                        PREVIEW_THUMBNAIL_WIDTH, fmt
+                    )
+            
+        except UploadRejected as e:
+            logger.info(f"画像のアップロードを拒否しました: {file.filename}: {e}")
+            flash(f"画像 {file.filename} は受け付けられませんでした: {e}")
+        except Exception as e:
+            logger.error(f"画像の保存に失敗しました: {e}")
+            flash(f"画像 {file.filename} のアップロードに失敗しました。")
     
-    # レビューリクエストを保存
-    review_requests[review.request_id] = review
+    UPLOAD_BYTES.observe(MAX_UPLOAD_BYTES - remaining_bytes)
     
-    # Slackにメッセージを投稿
-    update_review_message(review)
+    # レビューリクエストを保存し、Slackにメッセージを投稿
+    with log_context(review.request_id), metrics.span("submit_review", review.request_id, images=len(review.images)), \
+            review_locks.lock_for(review.request_id):
+        review_store.put(review)
+        update_review_message(review)
+    review_sweeper.track(review)
     
     # 送信完了画面に遷移
     return render_template("submission_success.html")
@@ -594,37 +1743,109 @@ def preview_post(request_id):
     if token_request_id != request_id:
         return "不正なアクセスです", 403
         
-    if request_id not in review_requests:
+    review = review_store.get(request_id)
+    if review is None:
         return "投稿が見つかりません", 404
     
-    review = review_requests[request_id]
-    
-    # 画像取得用の新しいトークンを生成（request_idを含める）
-    image_token = generate_jwt_token({"request_id": request_id})
-    
-    return render_template("preview.html", 
-                          review=review,
-                          request_id=request_id,
-                          image_token=image_token)
+    # 内容が変わるまでは描画結果を使い回す
+    return render_cache.get_or_render(
+        request_id,
+        review.version,
+        lambda: render_template("preview.html", review=review, request_id=request_id),
+    )
 
 @flask_app.route("/image/<request_id>/<filename>")
 def get_image(request_id, filename):
-    """画像をダウンロードするエンドポイント"""
-    if request_id not in review_requests:
+    """画像をダウンロードするエンドポイント（条件付きGETとRangeに対応）"""
+    review = review_store.get(request_id)
+    if review is None:
         return "投稿が見つかりません", 404
     
-    review = review_requests[request_id]
-    
     # リクエストに関連する画像か確認
     if filename not in review.images:
         return "画像が見つかりません", 404
     
-    file_path = os.path.join(uploads_dir, filename)
-    if not os.path.exists(file_path):
+    # ファイル名が内容のハッシュなので、そのまま強いETagとして使える
+    etag = os.path.splitext(filename)[0]
+    stat = image_store.stat(filename)
+    if stat is None:
         return "ファイルが見つかりません", 404
     
-    return send_file(file_path)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if request.if_none_match.contains(etag):
+        # キャッシュが有効ならファイルを開かずに304を返す
+        response = flask_app.response_class(status=304)
+    elif IMAGE_ACCEL_REDIRECT:
+        # フロントのプロキシ（nginx等）にファイルの送信を任せる
+        response = flask_app.response_class(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = IMAGE_ACCEL_REDIRECT + filename
+    else:
+        try:
+            f = open(image_store.path(filename), "rb")
+        except FileNotFoundError:
+            image_store.forget_stat(filename)
+            return "ファイルが見つかりません", 404
+        # サーバーがwsgi.file_wrapperを提供していればsendfileで送信される
+        response = flask_app.response_class(
+            wrap_file(request.environ, f), mimetype=mimetype, direct_passthrough=True
+        )
+        response.content_length = stat.size
+    
+    response.set_etag(etag)
+    response.last_modified = stat.mtime
+    response.cache_control.private = True
+    response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    if response.status_code == 304 or IMAGE_ACCEL_REDIRECT:
+        return response
+    return response.make_conditional(request, accept_ranges=True, complete_length=stat.size)
+    
+
+
+@flask_app.route("/thumbnail/<request_id>/<filename>")
+def get_thumbnail(request_id, filename):
+    """縮小画像を返すエンドポイント（?w=で幅を指定）"""
+    review = review_store.get(request_id)
+    if review is None:
+        return "投稿が見つかりません", 404
+    
+    if filename not in review.images:
+        return "画像が見つかりません", 404
+    
+    if thumbnail_cache is None:
+        return redirect(url_for("get_image", request_id=request_id, filename=filename))
+    
+    width = thumbnails.normalize_width(request.args.get("w", PREVIEW_THUMBNAIL_WIDTH, type=int))
+    fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    key = thumbnails.ThumbnailCache.key(os.path.splitext(filename)[0], width, fmt)
+    
+    # 手元にキャッシュがあればサムネイルを読まずに304を返す
+    if key in request.if_none_match:
+        response = flask_app.response_class(status=304)
+    else:
+        source_path = image_store.path(filename)
+        if not os.path.exists(source_path):
+            return "ファイルが見つかりません", 404
+        try:
+            path, key = thumbnail_cache.get(source_path, os.path.splitext(filename)[0], width, fmt)
+            response = send_file(path, mimetype=thumbnails.FORMATS[fmt][1], conditional=False, max_age=IMAGE_CACHE_MAX_AGE)
+        except Exception as e:
+            logger.error(f"サムネイルの生成に失敗しました: {filename}: {e}")
+            return redirect(url_for("get_image", request_id=request_id, filename=filename))
     
+    response.set_etag(key)
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    response.vary.add("Accept")
+    return response
+
+
+@flask_app.errorhandler(413)
+def request_entity_too_large(e):
+    return f"アップロードできるのは合計{MAX_UPLOAD_BYTES // (1024 * 1024)}MBまでです", 413
 
 
 @flask_app.route("/")
@@ -632,43 +1853,295 @@ def index():
     return "Slack Review System"
 
 
+if metrics.ENABLED:
+    @flask_app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @flask_app.after_request
+    def record_request_time(response):
+        started = g.get("request_started")
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                endpoint=request.endpoint or "unknown",
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
+
+    REVIEWS_OPEN.set_function(review_store.count)
+    SLACK_OUTBOX_DEPTH.set_function(lambda: slack_outbox.stats()["queue_depth"])
+    PUBLISH_JOBS.set_function(lambda: {(state,): count for state, count in publish_jobs.counts().items()})
+
+
+@flask_app.route("/metrics")
+def metrics_endpoint():
+    """Prometheusのテキスト形式でメトリクスを返す（METRICS_ENABLED=trueの場合のみ）"""
+    if not metrics.ENABLED:
+        return "メトリクスは無効です", 404
+    return flask_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@flask_app.route("/healthz")
+def healthz():
+    """生存確認（プロセスが応答できればよい）"""
+    return "ok"
+
+
+@flask_app.route("/readyz")
+def readyz():
+    """リクエストを受け付けられるか（停止処理中やレビューの保存先に接続できない場合は503）"""
+    if WEB_DRAIN_FILE and os.path.exists(WEB_DRAIN_FILE):
+        return "停止処理中です", 503
+    try:
+        review_store.get("readyz")
+    except Exception as e:
+        logger.error(f"レビューの保存先に接続できません: {e}")
+        return "レビューの保存先に接続できません", 503
+    return "ok"
+
+
+def compile_templates():
+    """テンプレートをすべてコンパイルしておく（最初のリクエストでコンパイルしない）"""
+    for template_name in flask_app.jinja_env.list_templates():
+        flask_app.jinja_env.get_template(template_name)
+
+
+def start_web_services():
+    """Webサーバーのプロセスで使うバックグラウンド処理を開始する"""
+    compile_templates()
+    sns_registry.start()
+    threading.Thread(target=load_saved_reviews, name="image-refcounts", daemon=True).start()
+    if cluster is not None:
+        # Webサーバーのプロセスは他のレプリカの変更を受け取るだけで、リーダーにはならない
+        # （期限切れの掃除や突き合わせは、Slackに接続して掃除役を動かしているプロセスが担当する）
+        cluster.start(elect=False)
+
+
 def run_flask():
-    port = int(os.environ.get("PORT", 7700))
+    start_web_services()
     try:
-        print(f"Flaskサーバーを開始: http://localhost:{port}/")
-        flask_app.run(host="0.0.0.0", port=port, debug=False)
+        print(f"Flaskサーバーを開始: http://localhost:{PORT}/")
+        flask_app.run(host="0.0.0.0", port=PORT, debug=False)
     except Exception as e:
         print(f"Flaskサーバー起動エラー: {e}")
         raise
 
 
 def run_slack():
+    # SIGTERMでも終了時の処理（送信待ちのメッセージの送信など）を行ってから終了する
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    user_directory.start()
+    publish_workers.start()
+    review_sweeper.start()
+    sns_registry.start()
+    if cluster is not None:
+        cluster.start()
+    else:
+        start_reconciler()
     handler = SocketModeHandler(app, SLACK_APP_TOKEN)
     handler.start()
 
 
+def gunicorn_command(port, workers=None, threads=None):
+    """wsgi.pyのアプリケーションをgunicornで起動するコマンド"""
+    return [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"0.0.0.0:{port}",
+        "--worker-class", "gthread",
+        "--workers", str(workers or WEB_WORKERS),
+        "--threads", str(threads or WEB_THREADS),
+        "--keep-alive", str(WEB_KEEPALIVE),
+        "--graceful-timeout", str(WEB_GRACEFUL_TIMEOUT),
+        "--timeout", str(max(60, WEB_GRACEFUL_TIMEOUT)),
+        "--chdir", current_dir,
+        "wsgi:application",
+    ]
+
+
+def serve_prod():
+    """
+    本番モード
+    Webはgunicorn（複数のワーカープロセス×スレッド）、Slackボットは別のプロセスで動かし、異常終了したら起動し直す
+    SIGTERMを受け取ると/readyzを503にし、WEB_DRAIN_DELAY秒待ってから各プロセスを停止する（処理中のリクエストは待つ）
+    """
+    import importlib.util
+    import tempfile
+    from supervisor import ProcessSupervisor
+
+    if importlib.util.find_spec("gunicorn") is None:
+        print("本番モードにはgunicornが必要です（pip install gunicorn）")
+        sys.exit(1)
+    if REVIEW_STORE_BACKEND == "memory":
+        print("本番モードではWebとSlackボットが別のプロセスになるため、REVIEW_STORE=sqliteを使ってください")
+        sys.exit(1)
+
+    drain_file = WEB_DRAIN_FILE or os.path.join(tempfile.gettempdir(), f"snsbot-drain-{os.getpid()}")
+    if os.path.exists(drain_file):
+        os.remove(drain_file)
+    # WebのワーカーとSlackボットでレビューを共有するので、どのプロセスもクラスタモードで動かす
+    env = dict(os.environ, CLUSTER_ENABLED="true", WEB_DRAIN_FILE=drain_file)
+    processes = [
+        ProcessSupervisor("Webサーバー", gunicorn_command(PORT), env=env, cwd=current_dir),
+        ProcessSupervisor("Slackボット", [sys.executable, os.path.abspath(__file__), "--slack-only"], env=env,
+                          cwd=current_dir),
+    ]
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    for process in processes:
+        process.start()
+    print(f"本番モードで起動しました: http://localhost:{PORT}/（ワーカー {WEB_WORKERS} × スレッド {WEB_THREADS}）")
+    while not stop.wait(1):
+        pass
+
+    print("停止しています...")
+    open(drain_file, "w").close()
+    # ロードバランサーが/readyzの503を見て振り分けをやめるのを待つ
+    time.sleep(WEB_DRAIN_DELAY)
+    stoppers = [threading.Thread(target=process.stop, args=(WEB_GRACEFUL_TIMEOUT + 5,)) for process in processes]
+    for stopper in stoppers:
+        stopper.start()
+    for stopper in stoppers:
+        stopper.join()
+    os.remove(drain_file)
+
+
+def build_async_app():
+    """
+    AsyncAppに同期版と同じハンドラを登録する
+    ハンドラは非同期に書き直しておらず、同期版のハンドラをasyncio.to_threadでスレッドに渡して実行するだけ
+    （レビューのロック・SQLite・クラスタのリース・送信キューの空きを待つ間もイベントループを止めないようにするため）
+    Slackへの送信は同期版と同じくapp.client（WebClient）と送信キューを使い、AsyncAppのクライアントはイベントの受信とack()にだけ使う
+    """
+    import asyncio
+    from slack_bolt.async_app import AsyncApp
+    from slack_sdk.web.async_client import AsyncWebClient
+
+    if SLACK_API_URL:
+        async_app = AsyncApp(client=AsyncWebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL),
+                             signing_secret=SIGNING_SECRET)
+    else:
+        async_app = AsyncApp(token=SLACK_BOT_TOKEN, signing_secret=SIGNING_SECRET)
+
+    def noop_ack(*args, **kwargs):
+        pass
+
+    @async_app.event("reaction_added")
+    async def async_reaction_added(event, logger):
+        await asyncio.to_thread(handle_reaction_added, event, logger)
+
+    @async_app.event("reaction_removed")
+    async def async_reaction_removed(event, logger):
+        await asyncio.to_thread(handle_reaction_removed, event, logger)
+
+    @async_app.event("user_change")
+    async def async_user_change(event, logger):
+        handle_user_change(event, logger)
+
+    @async_app.event("team_join")
+    async def async_team_join(event, logger):
+        handle_team_join(event, logger)
+
+    @async_app.command("/review")
+    async def async_review_command(ack, body, logger):
+        await ack()
+        await asyncio.to_thread(handle_review_command, noop_ack, body, logger)
+
+    @async_app.command("/register")
+    async def async_register_command(ack, body, logger):
+        await ack()
+        await asyncio.to_thread(handle_register_command, noop_ack, body, logger)
+
+    @async_app.command("/post")
+    async def async_post_command(ack, body, logger):
+        await ack()
+        await asyncio.to_thread(handle_post_command, noop_ack, body, logger)
+
+    return async_app
+
+
+async def serve_async():
+    """
+    Slack（AsyncSocketModeHandler）とWebサーバー（uvicorn）を1つのイベントループで動かす
+    FlaskのルートはASGIに変換して提供し、接続の待ち受けはイベントループが受け持つ
+    リクエストの処理だけが固定数のワーカースレッドで実行されるので、接続ごとにスレッドは作られない
+    """
+    import asyncio
+    import uvicorn
+    from a2wsgi import WSGIMiddleware
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+    workers = int(os.environ.get("ASYNC_WEB_WORKERS", "16"))
+
+    asgi_app = WSGIMiddleware(flask_app, workers=workers)
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="0.0.0.0", port=PORT, log_level="info"))
+    handler = AsyncSocketModeHandler(build_async_app(), SLACK_APP_TOKEN)
+
+    user_directory.start()
+    publish_workers.start()
+    review_sweeper.start()
+    compile_templates()
+    sns_registry.start()
+    if cluster is not None:
+        cluster.start()
+    else:
+        start_reconciler()
+    print(f"ASGIサーバーを開始: http://localhost:{PORT}/")
+    slack_task = asyncio.create_task(handler.start_async())
+    try:
+        # uvicornがSIGINT/SIGTERMを受け取るとserve()が終了する
+        await server.serve()
+    finally:
+        slack_task.cancel()
+        await handler.close_async()
+
+
+def run_async():
+    import asyncio
+    try:
+        asyncio.run(serve_async())
+    except ImportError as e:
+        print(f"非同期モードに必要なパッケージがありません（uvicorn, a2wsgi, aiohttp）: {e}")
+        raise
+
+
+startup_profile.mark("ハンドラ・ルートの登録とその他の初期化")
+if startup_profile.ENABLED:
+    startup_profile.report()
+
+
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 7700))
-    base_url = os.environ.get("BASE_URL", f"http://localhost:{port}/")
-    
+    if "--profile-startup" in sys.argv:
+        sys.exit(0)
+
     print(f"=== 設定情報 ===")
-    print(f"ポート番号: {port}")
-    print(f"ベースURL: {base_url}")
-    print(f"レビューフォームURL: {base_url}review_form")
+    print(f"ポート番号: {PORT}")
+    print(f"ベースURL: {BASE_URL}")
+    print(f"レビューフォームURL: {BASE_URL}review_form")
     print(f"レビュワー: {REVIEWER_IDS}")
     print(f"必要承認数: {REQUIRED_APPROVALS}")
-    print(f"利用可能なSNS: {list(SNS_ACCOUNTS.keys())}")
+    print(f"利用可能なSNS: {list(sns_registry.snapshot.accounts)}")
     print(f"JWT有効期限: {JWT_EXPIRES_IN}秒")
+    if cluster is not None:
+        print(f"クラスタ: {cluster.node_id}（{cluster_db_path}）")
     print(f"===============")
     
-    import sys
-    
     if len(sys.argv) > 1 and sys.argv[1] == "--flask-only":
         print("Flaskサーバーのみを起動します...")
         run_flask()
     elif len(sys.argv) > 1 and sys.argv[1] == "--slack-only":
         print("Slackボットのみを起動します...")
         run_slack()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--serve=prod":
+        print("本番モードで起動します...")
+        serve_prod()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--async":
+        print("非同期モードで起動します...")
+        run_async()
     else:
         flask_thread = threading.Thread(target=run_flask)
         flask_thread.daemon = True
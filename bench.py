@@ -0,0 +1,1793 @@
+"""
+ベンチマーク・負荷再現用のスクリプト
+
+偽のSlack Web APIサーバーを立ち上げ、Socket Modeの代わりにイベントやコマンドをボルトのアプリに直接渡して、
+リアクション・申請・/post・プレビューの処理性能を計測する
+本物のワークスペースには接続しない
+
+使い方:
+    python bench.py                       # すべてのシナリオを実行
+    python bench.py reactions post        # シナリオを指定して実行
+    python bench.py reactions reactions-async   # 同期版と--asyncのAsyncAppでリアクションのレイテンシを比べる
+    python bench.py outbox                # chat_updateが溜まって429で止まっている間のchat_postMessageの待ち時間
+    python bench.py publish               # 偽のSNSの投稿APIに対して複数アカウントへ投稿する（429・5xx・タイムアウトを含む）
+    python bench.py --store sqlite large-store   # 10万件のレビューを保存した状態でのリアクションと申請の処理時間
+    python bench.py images                # /imageと/thumbnailの配信（条件付きGET・Rangeを含む）の件数/秒と転送量
+    python bench.py auth                  # トークンの検証（jwt.decodeと検証済みキャッシュ）とプレビューURLの生成の1回あたりの時間
+    python bench.py uploads               # 20MBの画像付き申請（同じ画像の再申請を含む）の転送速度・保存量・メモリ
+    python bench.py render                # プレビューとレビューフォームの描画（キャッシュあり・なし）とテンプレートのコンパイルの時間
+    python bench.py approvals             # 同時に届いた承認（再送を含む）で承認の通知が1件だけ送られるか確認する
+    python bench.py --store sqlite --reviews 1000 --reviewers 10
+    LOG_LEVEL=DEBUG python bench.py reactions   # ログの設定による違いを比べる
+    python bench.py logging-baseline logging-queued   # 以前のbasicConfig(DEBUG)とキュー経由のログでリアクションの処理を比べる
+    python bench.py memory --memory-sizes 10000,100000,1000000   # レビュー1件あたりのメモリ使用量
+    python bench.py --store sqlite web-dev web-prod   # 開発用サーバーとgunicornのプレビューの負荷を比べる
+    python bench.py startup --startup-target-ms 1000   # 起動から最初のイベントを処理するまでの時間
+    python bench.py reconcile --reconcile-reviews 5000   # 停止中に付いたリアクションを起動時にまとめて反映する
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SCENARIOS = ("reactions", "submissions", "post", "preview")
+# 指定した場合のみ実行するシナリオ
+EXTRA_SCENARIOS = ("reactions-async", "outbox", "approvals", "publish", "large-store", "images", "auth", "uploads", "render",
+                   "logging-baseline", "logging-queued", "memory", "web-dev", "web-prod", "startup", "reconcile")
+
+# startupシナリオで起動するプロセスの中身（app.pyを読み込んで最初のイベントを処理するまでを計測する）
+STARTUP_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+from slack_bolt.request import BoltRequest
+imported = time.perf_counter()
+# run_slack()と同じく、保存済みのレビューの読み込みと画像の参照数の計算をバックグラウンドで始める
+app.review_sweeper.start()
+app.app.listener_runner.process_before_response = True
+body = json.loads(sys.argv[2])
+response = app.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+handled = time.perf_counter()
+print(json.dumps({
+    "status": response.status,
+    "import_ms": (imported - started) * 1000,
+    "first_event_ms": (handled - started) * 1000,
+}), flush=True)
+# 終了処理（バックグラウンドの読み込みの終了待ちなど）は計測に含めない
+os._exit(0)
+"""
+
+
+class ScenarioSkipped(Exception):
+    """この環境では実行できないシナリオ"""
+
+
+class FakeSlackAPI:
+    """
+    Slack Web APIの代わりをするローカルのHTTPサーバー
+    メソッドごとの呼び出し回数を数え、指定した遅延を入れて成功を返す
+    reactions.getには set_reactions() で設定したリアクションを返す
+    throttle(method, every) で、指定したメソッドをevery回ごとに429にする
+    """
+
+    def __init__(self, latency=0.0, members=()):
+        self.latency = latency
+        self.members = list(members)
+        self.calls = Counter()
+        self.posted = Counter()  # chat.postMessageで投稿されたテキスト -> 回数
+        self.messages = set()  # 投稿済みのメッセージの (channel, ts)
+        self.reactions = {}  # (channel, ts) -> リアクション名 -> ユーザーIDのリスト
+        self.throttle_every = {}  # メソッド名 -> この回数ごとに429にする
+        self.retry_after = "0.05"  # 429で返すRetry-After（秒）
+        self.retry_after_header = "Retry-After"  # ヘッダー名（大文字・小文字の違いを試す）
+        self.rate_limited = Counter()
+        self._throttle_seq = Counter()
+        self._ts = 1700000000.0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-slack", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def next_ts(self):
+        with self._lock:
+            self._ts += 0.0001
+            return f"{self._ts:.6f}"
+
+    def set_reactions(self, channel, ts, reactions):
+        with self._lock:
+            self.reactions[(channel, ts)] = reactions
+
+    def delete_message(self, channel, ts):
+        with self._lock:
+            self.messages.discard((channel, ts))
+
+    def throttle(self, method, every):
+        """methodをevery回ごとに429にする（0で止める）"""
+        with self._lock:
+            if every:
+                self.throttle_every[method] = every
+            else:
+                self.throttle_every.pop(method, None)
+
+    def throttled(self, method):
+        """429を返すかどうか"""
+        with self._lock:
+            every = self.throttle_every.get(method)
+            if not every:
+                return False
+            self._throttle_seq[method] += 1
+            if self._throttle_seq[method] % every:
+                return False
+            self.rate_limited[method] += 1
+            return True
+
+    def respond(self, method, params):
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "auth.test":
+            return {"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "TBENCH", "team": "bench",
+                    "url": "https://bench.slack.com/"}
+        if method == "chat.postMessage":
+            ts = self.next_ts()
+            with self._lock:
+                self.messages.add((params.get("channel"), ts))
+                self.posted[params.get("text")] += 1
+            return {"ok": True, "channel": params.get("channel"), "ts": ts}
+        if method == "reactions.get":
+            key = (params.get("channel"), params.get("timestamp"))
+            with self._lock:
+                if key not in self.messages:
+                    return {"ok": False, "error": "message_not_found"}
+                reactions = self.reactions.get(key, {})
+                return {"ok": True, "type": "message", "channel": key[0], "message": {
+                    "type": "message", "ts": key[1],
+                    "reactions": [{"name": name, "users": list(users), "count": len(users)}
+                                  for name, users in reactions.items() if users],
+                }}
+        if method == "chat.update":
+            return {"ok": True, "channel": params.get("channel"), "ts": params.get("ts")}
+        if method == "chat.postEphemeral":
+            return {"ok": True, "message_ts": self.next_ts()}
+        if method == "users.list":
+            return {"ok": True, "members": self.members, "response_metadata": {"next_cursor": ""}}
+        return {"ok": True}
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.calls)
+
+    def snapshot_posted(self):
+        with self._lock:
+            return Counter(self.posted)
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        params.update(json.loads(body))
+                    else:
+                        params.update({key: values[0] for key, values in parse_qs(body).items()})
+                if api.throttled(method):
+                    data = json.dumps({"ok": False, "error": "ratelimited"}).encode()
+                    self.send_response(429)
+                    self.send_header(api.retry_after_header, api.retry_after)
+                else:
+                    data = json.dumps(api.respond(method, params)).encode()
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class FakePlatformServer:
+    """
+    SNSの投稿APIの代わりをするローカルのHTTPサーバー（/<SNS名> にPOSTする）
+    アカウント名の先頭で応答を変える（同じIdempotency-Keyの試行回数で数える）:
+        ok-*: 成功する
+        429-*: 1回目は429
+        5xx-*: 2回目までは503
+        timeout-*: 1回目はクライアントのタイムアウトより長く待ってから投稿する（再送は同じIDを返す）
+        reject-*: 400（再試行できない失敗）
+    SNSごとの同時に処理している数の最大と、リクエストの時刻を記録する
+    """
+
+    def __init__(self, latency=0.0, timeout_delay=0.5):
+        self.latency = latency
+        self.timeout_delay = timeout_delay
+        self.attempts = Counter()  # Idempotency-Key -> 試行回数
+        self.posted = {}  # Idempotency-Key -> 投稿ID
+        self.replayed = 0  # 投稿済みのIdempotency-Keyで再送された回数
+        self.requests = {}  # SNS名 -> リクエストの時刻のリスト
+        self.max_in_flight = Counter()
+        self._in_flight = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-platform", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def max_per_second(self, sns):
+        """1秒間のリクエスト数の最大"""
+        with self._lock:
+            times = sorted(self.requests.get(sns, ()))
+        best = start = 0
+        for end, t in enumerate(times):
+            while t - times[start] >= 1.0:
+                start += 1
+            best = max(best, end - start + 1)
+        return best
+
+    def respond(self, sns, key, account):
+        """(ステータス, 応答) を返す。タイムアウトさせる場合は投稿してから待つ"""
+        with self._lock:
+            self.requests.setdefault(sns, []).append(time.monotonic())
+            self.attempts[key] += 1
+            attempt = self.attempts[key]
+            self._in_flight[sns] += 1
+            self.max_in_flight[sns] = max(self.max_in_flight[sns], self._in_flight[sns])
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            kind = account.split("-", 1)[0]
+            if kind == "429" and attempt == 1:
+                return 429, {"error": "rate_limited"}
+            if kind == "5xx" and attempt <= 2:
+                return 503, {"error": "unavailable"}
+            if kind == "reject":
+                return 400, {"error": "invalid"}
+            with self._lock:
+                if key in self.posted:
+                    self.replayed += 1
+                else:
+                    self.posted[key] = f"post-{len(self.posted)}"
+                post_id = self.posted[key]
+        finally:
+            with self._lock:
+                self._in_flight[sns] -= 1
+        if kind == "timeout" and attempt == 1:
+            # 投稿は済んでいるがクライアントには応答が届かない
+            time.sleep(self.timeout_delay)
+        return 200, {"id": post_id}
+
+    def _handler_class(self):
+        platform = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                status, response = platform.respond(
+                    self.path.strip("/"), self.headers.get("Idempotency-Key"), body.get("account", "")
+                )
+                data = json.dumps(response).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except OSError:
+                    # タイムアウトしたクライアントは切断している
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def rss_mb():
+    """現在の常駐メモリ（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Bench:
+    def __init__(self, args, api):
+        import app
+        from slack_bolt.request import BoltRequest
+
+        self.args = args
+        self.api = api
+        self.app = app
+        self.BoltRequest = BoltRequest
+        self.random = random.Random(args.seed)
+        self.reviewers = [f"UREV{i:03d}" for i in range(args.reviewers)]
+        self.authors = [f"UAUTH{i:03d}" for i in range(args.authors)]
+        self.channel = "CBENCH"
+        self._event_seq = 0
+        self.servers = []
+        self.extra = {}  # シナリオごとの追加の計測結果
+        self.finish = None  # 計測する処理の直後に呼ぶ関数（シナリオごとの追加の計測結果を集める）
+        self._async_app = None
+        self._loop = None
+
+        # SocketModeHandlerと同じくワーカースレッドからdispatchし、リスナーの完了までを計測するために同期実行にする
+        app.app.listener_runner.process_before_response = True
+        # ボットの起動時に掃除役が行う画像の参照数の計算を済ませておく（数えるまでは参照されなくなった画像を削除しない）
+        app.load_saved_reviews()
+        # 偽のサーバーはレート制限しないので、送信キューが計測の待ち時間にならないようにする
+        for method in ("chat_postMessage", "chat_update", "chat_postEphemeral"):
+            app.slack_outbox.set_rate_limit(method, 10000.0, 10000)
+        app.reaction_reconciler.concurrency = args.workers
+        app.reaction_reconciler.set_rate_limit(args.reconcile_rate or 10000.0, max(1, args.workers))
+        for sns in app.sns_registry.snapshot.accounts:
+            app.publisher.set_limits(sns, args.workers, 10000.0, 10000)
+
+    # --- Socket Modeの代わり ---
+
+    def _envelope(self, event):
+        self._event_seq += 1
+        return {
+            "token": "bench",
+            "team_id": "TBENCH",
+            "api_app_id": "ABENCH",
+            "type": "event_callback",
+            "event_id": f"Ev{self._event_seq:08d}",
+            "event_time": int(time.time()),
+            "event": event,
+            "authorizations": [{"team_id": "TBENCH", "user_id": "UBOT", "is_bot": True}],
+        }
+
+    def reaction_event(self, kind, user, reaction, ts, author):
+        return self._envelope({
+            "type": kind,
+            "user": user,
+            "reaction": reaction,
+            "item": {"type": "message", "channel": self.channel, "ts": ts},
+            "item_user": author,
+            "event_ts": f"{time.time():.6f}",
+        })
+
+    def command(self, name, user, text=""):
+        return {
+            "token": "bench",
+            "team_id": "TBENCH",
+            "api_app_id": "ABENCH",
+            "command": name,
+            "text": text,
+            "user_id": user,
+            "channel_id": self.channel,
+            "trigger_id": uuid.uuid4().hex,
+            "response_url": self.api.url + "response",
+        }
+
+    def dispatch(self, body):
+        response = self.app.app.dispatch(self.BoltRequest(body=body, mode="socket_mode"))
+        if response.status != 200:
+            raise RuntimeError(f"dispatchに失敗しました: {response.status} {response.body}")
+
+    def start_async_app(self):
+        """--asyncと同じAsyncAppを、別スレッドのイベントループで動かす"""
+        if self._loop is not None:
+            return
+        import asyncio
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="bench-loop", daemon=True).start()
+        self._async_app = self.app.build_async_app()
+        # 同期版と同じく、リスナーの完了までを計測する
+        self._async_app.listener_runner.process_before_response = True
+
+    def dispatch_async(self, body):
+        import asyncio
+        from slack_bolt.request.async_request import AsyncBoltRequest
+        request = AsyncBoltRequest(body=body, mode="socket_mode")
+        response = asyncio.run_coroutine_threadsafe(self._async_app.async_dispatch(request), self._loop).result()
+        if response.status != 200:
+            raise RuntimeError(f"dispatchに失敗しました: {response.status} {response.body}")
+
+    def probe_loop_lag(self, interval=0.01):
+        """
+        イベントループが10msごとのタイマーをどれだけ遅れて実行したかを記録する
+        ハンドラがループを止めると、他のイベントやWebリクエストもこの分だけ待たされる
+        Returns:
+            tuple: (遅れのリスト, 記録を止める関数)
+        """
+        import asyncio
+        lags = []
+        stopped = threading.Event()
+
+        async def probe():
+            while not stopped.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(interval)
+                lags.append(max(0.0, time.perf_counter() - start - interval))
+
+        future = asyncio.run_coroutine_threadsafe(probe(), self._loop)
+
+        def stop():
+            stopped.set()
+            future.result()
+
+        return lags, stop
+
+    # --- 準備 ---
+
+    def create_reviews(self, count, approved=False, authors=None):
+        """レビューを作成してメッセージを投稿する（投稿を待つので複数のスレッドで作成する）"""
+        snapshot = self.app.sns_registry.snapshot
+        sns = next(iter(snapshot.accounts))
+        authors = authors or [self.random.choice(self.authors) for _ in range(count)]
+
+        def create(i):
+            review = self.app.ReviewRequest(
+                author=authors[i],
+                sns=sns,
+                account=snapshot.accounts[sns][0],
+                text=f"ベンチマーク用の投稿 {i}",
+                channel=self.channel,
+            )
+            if approved:
+                review.approved = True
+            self.app.review_store.put(review)
+            self.app.update_review_message(review)
+            return review
+
+        with ThreadPoolExecutor(max_workers=self.args.workers) as executor:
+            return list(executor.map(create, range(count)))
+
+    def image_bytes(self):
+        return b"\x89PNG\r\n\x1a\n" + os.urandom(self.args.image_kb * 1024)
+
+    def drain(self, timeout=120.0):
+        """送信キューと投稿ジョブが空になるまで待つ"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            stats = self.app.slack_outbox.stats()
+            jobs = self.app.publish_jobs.counts()
+            if not stats["queue_depth"] and not stats["pending_updates"] and not jobs.get("queued") \
+                    and not jobs.get("leased"):
+                return
+            time.sleep(0.05)
+        print("警告: 送信キューまたは投稿ジョブが時間内に空になりませんでした", file=sys.stderr)
+
+    def run_ops(self, ops):
+        """(関数, 引数) のリストをワーカースレッドで実行し、1件ごとの処理時間を返す"""
+        latencies = []
+        lock = threading.Lock()
+        errors = []
+
+        def run(op):
+            func, arg = op
+            start = time.perf_counter()
+            try:
+                func(arg)
+            except Exception as e:
+                errors.append(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+        with ThreadPoolExecutor(max_workers=self.args.workers) as executor:
+            list(executor.map(run, ops))
+        if errors:
+            print(f"警告: {len(errors)}件の処理が失敗しました（最初のエラー: {errors[0]!r}）", file=sys.stderr)
+        return latencies
+
+    # --- シナリオ（準備をしてから、計測する処理の (関数, 引数) のリストを返す） ---
+
+    def scenario_reactions(self):
+        """N件のレビューにM人のレビュワーがリアクションを付け外しする"""
+        return [(self.dispatch, event) for event in self.reaction_events()]
+
+    def scenario_reactions_async(self):
+        """reactionsと同じイベントを--asyncのAsyncAppで処理し、イベントループの遅れも計測する"""
+        self.start_async_app()
+        events = self.reaction_events()
+        lags, stop = self.probe_loop_lag()
+
+        def finish():
+            stop()
+            self.extra["loop_lag"] = {
+                "p50_ms": percentile(lags, 0.5) * 1000,
+                "p99_ms": percentile(lags, 0.99) * 1000,
+                "max_ms": max(lags, default=0.0) * 1000,
+            }
+
+        self.finish = finish
+        return [(self.dispatch_async, event) for event in events]
+
+    def scenario_logging_baseline(self):
+        """reactionsと同じイベントを、以前の設定（basicConfig(level=DEBUG)で同期的に書き込む）で処理する"""
+        return self.scenario_logging("baseline")
+
+    def scenario_logging_queued(self):
+        """reactionsと同じイベントを、アプリの既定の設定（INFO・JSON・キュー経由で書き込む）で処理する"""
+        return self.scenario_logging("queued")
+
+    def scenario_logging(self, kind):
+        """
+        ログの設定を差し替えてreactionsと同じイベントを処理する
+        どちらも作業用ディレクトリのファイルに書き込み、書き込んだ行数とバイト数も記録する
+        キュー経由の場合は、処理の後に残りのログを書き終えるまでの時間と捨てた件数も記録する
+        """
+        import logging
+        from logging_setup import DEFAULT_LEVELS, setup_logging
+
+        events = self.reaction_events()
+        root = logging.getLogger()
+        saved_handlers, saved_level = list(root.handlers), root.level
+        # ボルトのAppのロガーは作成時のルートのレベルが設定されているので、以前と同じくDEBUGにするために外す
+        names = list(DEFAULT_LEVELS) + [name for name in logging.root.manager.loggerDict if name.startswith("slack_bolt.")]
+        saved_levels = {name: logging.getLogger(name).level for name in names}
+        path = os.path.join(os.path.dirname(os.environ["REVIEW_DB_PATH"]), f"bench-{kind}.log")
+        stream = open(path, "w", encoding="utf-8")
+        for handler in saved_handlers:
+            root.removeHandler(handler)
+        listener = None
+        if kind == "baseline":
+            for name in names:
+                logging.getLogger(name).setLevel(logging.NOTSET)
+            logging.basicConfig(level=logging.DEBUG, stream=stream)
+        else:
+            listener = setup_logging(level="INFO", fmt="json", stream=stream)
+        handler = root.handlers[0]
+
+        def finish():
+            # 送信キューのAPI呼び出しのログも含める
+            self.drain()
+            start = time.perf_counter()
+            if listener is not None:
+                listener.stop()
+            flushed = time.perf_counter() - start
+            root.removeHandler(handler)
+            for saved in saved_handlers:
+                root.addHandler(saved)
+            root.setLevel(saved_level)
+            for name, level in saved_levels.items():
+                logging.getLogger(name).setLevel(level)
+            stream.close()
+            with open(path, "rb") as f:
+                lines = sum(1 for _ in f)
+            self.extra["logging"] = {
+                "lines": lines,
+                "bytes": os.path.getsize(path),
+                "flush_seconds": flushed,
+                "dropped": getattr(handler, "dropped", 0),
+            }
+
+        self.finish = finish
+        return [(self.dispatch, event) for event in events]
+
+    def reaction_events(self):
+        reviews = self.create_reviews(self.args.reviews)
+        events = []
+        for review in reviews:
+            for reviewer in self.reviewers:
+                events.append(self.reaction_event("reaction_added", reviewer, "review_accept", review.ts, review.author))
+                roll = self.random.random()
+                if roll < 0.1:
+                    events.append(self.reaction_event("reaction_removed", reviewer, "review_accept", review.ts,
+                                                      review.author))
+                elif roll < 0.3:
+                    # レビューに関係ないリアクション
+                    events.append(self.reaction_event("reaction_added", reviewer, "eyes", review.ts, review.author))
+                elif roll < 0.4:
+                    # 表示の変わらないリアクション（承認済みのレビュワーの付け直し・付けていないリジェクトの取り消し）
+                    events.append(self.reaction_event("reaction_added", reviewer, "review_accept", review.ts,
+                                                      review.author))
+                    events.append(self.reaction_event("reaction_removed", reviewer, "review_reject", review.ts,
+                                                      review.author))
+            if self.random.random() < 0.02:
+                events.append(self.reaction_event("reaction_added", self.reviewers[0], "review_reject", review.ts,
+                                                  review.author))
+        self.random.shuffle(events)
+        return events
+
+    def scenario_approvals(self):
+        """
+        すべてのレビュワーが同時に承認し、一部のイベントは再送されたものとして2回届く
+        必要数を超えて承認されても、承認の通知がレビューごとにちょうど1件だけ送られることを確認する
+        （通知のテキストでレビューを区別できるように、レビューごとに別の申請者にする）
+        """
+        count = self.args.approval_reviews
+        authors = [f"UAPPROVE{i:05d}" for i in range(count)]
+        reviews = self.create_reviews(count, authors=authors)
+        events = []
+        for review in reviews:
+            for reviewer in self.reviewers:
+                event = self.reaction_event("reaction_added", reviewer, "review_accept", review.ts, review.author)
+                events.append(event)
+                if self.random.random() < 0.3:
+                    events.append(event)
+        self.random.shuffle(events)
+
+        def finish():
+            self.drain()
+            notices = Counter()
+            for text, posted in self.api.snapshot_posted().items():
+                if text and "承認されました" in text:
+                    notices[text.split(">", 1)[0].lstrip("<@")] += posted
+            wrong = {author: notices[author] for author in authors if notices[author] != 1}
+            not_approved = [review.request_id for review in reviews
+                            if not (self.app.review_store.get(review.request_id) or review).approved]
+            self.extra["approvals"] = {
+                "reviews": count,
+                "notices": sum(notices[author] for author in authors),
+                "duplicated": sum(1 for posted in wrong.values() if posted > 1),
+                "missing": sum(1 for posted in wrong.values() if posted == 0),
+                "not_approved": len(not_approved),
+            }
+            if wrong or not_approved:
+                raise RuntimeError(
+                    f"承認の通知がレビューごとに1件になっていません: {len(wrong)}件、未承認 {len(not_approved)}件"
+                )
+
+        self.finish = finish
+        return [(self.dispatch, event) for event in events]
+
+    def scenario_publish(self):
+        """
+        偽のSNSの投稿APIを2つ用意し、sns.jsonと同じ形式の設定（投稿制限とエンドポイント）で登録して、
+        1件の告知を複数のアカウントに投稿する処理を繰り返す
+        429・5xx・タイムアウト・再試行できない失敗を混ぜ、次のことを確認する
+        - アカウントごとの結果と試行回数が期待どおりで、タイムアウトした投稿の再送以外に同じ投稿が届かない
+        - SNSごとの同時投稿数と1秒あたりの投稿数が設定を超えない
+        - 設定から消したSNSの投稿制限とエンドポイントが外れる
+        """
+        from sns_accounts import AccountSnapshot
+
+        platform = FakePlatformServer(latency=self.args.api_latency / 1000)
+        platform.start()
+        concurrency, rate, burst = 2, self.args.publish_rate, 4
+        accounts = ["ok-0", "ok-1", "429-2", "5xx-3", "timeout-4", "reject-5"]
+        expected = {"ok": (True, 1), "429": (True, 2), "5xx": (True, 3), "timeout": (True, 2), "reject": (False, 1)}
+        config = {
+            sns: {"accounts": accounts, "endpoint": platform.url + sns,
+                  "limits": {"concurrency": concurrency, "rate": rate, "burst": burst}}
+            for sns in ("BenchA", "BenchB")
+        }
+        publisher = self.app.publisher
+        self.app.apply_sns_accounts(AccountSnapshot(config))
+        for sns in config:
+            publisher.adapters()[sns].timeout = platform.timeout_delay / 2
+        base_delay, publisher.base_delay = publisher.base_delay, 0.01
+        targets = [(sns, account) for sns in config for account in accounts]
+        results = []
+
+        def publish(i):
+            results.extend(publisher.publish(targets, f"ベンチマーク用の告知 {i}", [], idempotency_key=uuid.uuid4().hex))
+
+        def finish():
+            publisher.base_delay = base_delay
+            errors = [
+                f"{result.sns}/{result.account}: {result.success} {result.attempts}回"
+                for result in results
+                if (result.success, result.attempts) != expected[result.account.split("-", 1)[0]]
+            ]
+            timeouts = sum(1 for result in results if result.account.startswith("timeout-"))
+            if platform.replayed != timeouts:
+                errors.append(f"同じ投稿が{platform.replayed}回再送されました（タイムアウトは{timeouts}回）")
+            for sns in config:
+                if platform.max_in_flight[sns] > concurrency:
+                    errors.append(f"{sns}の同時投稿数が{platform.max_in_flight[sns]}になりました")
+                # サーバーに届く時刻は送信した時刻から同時投稿数の分だけずれることがある
+                if platform.max_per_second(sns) > rate + burst + concurrency:
+                    errors.append(f"{sns}の1秒あたりの投稿数が{platform.max_per_second(sns)}になりました")
+
+            # 設定からBenchBを消すと投稿制限とエンドポイントが外れ、元の設定に戻すと両方とも外れる
+            self.app.apply_sns_accounts(AccountSnapshot({"BenchA": config["BenchA"]}))
+            if "BenchB" in publisher.limits() or "BenchB" in publisher.adapters():
+                errors.append("設定から消したBenchBの投稿制限またはエンドポイントが残っています")
+            self.app.apply_sns_accounts(self.app.sns_registry.snapshot)
+            if {"BenchA", "BenchB"} & (publisher.limits().keys() | publisher.adapters().keys()):
+                errors.append("元の設定に戻してもBenchAの投稿制限またはエンドポイントが残っています")
+            for sns in self.app.sns_registry.snapshot.accounts:
+                publisher.set_limits(sns, self.args.workers, 10000.0, 10000)
+            platform.stop()
+
+            self.extra["publish"] = {
+                "targets": len(results),
+                "requests": sum(platform.attempts.values()),
+                "posted": len(platform.posted),
+                "replayed": platform.replayed,
+                "max_in_flight": max(platform.max_in_flight.values(), default=0),
+                "max_per_second": max(platform.max_per_second(sns) for sns in config),
+                "concurrency": concurrency,
+                "rate": rate,
+                "errors": len(errors),
+            }
+            if errors:
+                raise RuntimeError(f"投稿の結果が期待と異なります: {len(errors)}件（例: {errors[0]}）")
+
+        self.finish = finish
+        return [(publish, i) for i in range(self.args.publishes)]
+
+    def seed_reviews(self, count):
+        """メッセージを投稿せずにレビューを保存する（大量の保存済みレビューがある状態を作る）"""
+        snapshot = self.app.sns_registry.snapshot
+        sns = next(iter(snapshot.accounts))
+        for i in range(count):
+            review = self.app.ReviewRequest(
+                author=self.random.choice(self.authors),
+                sns=sns,
+                account=snapshot.accounts[sns][0],
+                text=f"保存済みのレビュー {i}",
+                channel=self.channel,
+            )
+            review.ts = f"1600000000.{i:06d}"
+            for reviewer in self.random.sample(self.reviewers, self.random.randint(0, len(self.reviewers))):
+                review.add_approval(reviewer)
+            review.approved = len(review.approvals) >= self.app.REQUIRED_APPROVALS
+            self.app.review_store.put(review)
+        self.app.review_store.flush()
+
+    def scenario_large_store(self):
+        """
+        --seed-reviews件（既定は10万件）のレビューを保存した状態で、reactionsとsubmissionsと同じ処理を混ぜて実行し、
+        リアクション1件・申請1件あたりの処理時間を別々に計測する
+        """
+        if self.app.review_store.count() < self.args.seed_reviews:
+            start = time.perf_counter()
+            self.seed_reviews(self.args.seed_reviews - self.app.review_store.count())
+            self.extra["seed_seconds"] = time.perf_counter() - start
+        latencies = {"reaction": [], "submit": []}
+        lock = threading.Lock()
+
+        def timed(kind, func):
+            def run(arg):
+                start = time.perf_counter()
+                func(arg)
+                with lock:
+                    latencies[kind].append(time.perf_counter() - start)
+            return run
+
+        reactions = [(timed("reaction", func), arg) for func, arg in self.scenario_reactions()]
+        submissions = [(timed("submit", func), arg) for func, arg in self.scenario_submissions()]
+        ops = reactions + submissions
+        self.random.shuffle(ops)
+
+        def finish():
+            self.extra["large_store"] = {
+                "stored": self.app.review_store.count(),
+                "seed_seconds": self.extra.pop("seed_seconds", 0.0),
+                **{f"{kind}_{name}_ms": percentile(values, p) * 1000
+                   for kind, values in latencies.items() for name, p in (("p50", 0.5), ("p99", 0.99))},
+            }
+
+        self.finish = finish
+        return ops
+
+    def scenario_images(self):
+        """
+        プレビューを開いたときの画像の読み込みを繰り返す
+        全体の取得・If-None-Matchでの再読み込み（304）・Rangeでの途中からの取得・サムネイル（生成済み）とその再読み込みを混ぜ、
+        種類ごとの件数・処理時間・転送したバイト数を計測する（応答のステータスと長さも確認する）
+        """
+        import io
+        import thumbnails
+
+        if thumbnails.available():
+            from PIL import Image
+            side = max(16, int((self.args.image_kb * 1024 / 3) ** 0.5))
+
+            def make_image():
+                image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+                out = io.BytesIO()
+                image.save(out, format="PNG")
+                return out.getvalue()
+        else:
+            make_image = self.image_bytes
+        reviews = self.create_reviews(max(1, self.args.reviews // 10))
+        for review in reviews:
+            for _ in range(max(1, self.args.images)):
+                filename, _ = self.app.image_store.save_stream(io.BytesIO(make_image()))
+                review.add_image(filename)
+            self.app.review_store.put(review)
+
+        client = self.app.flask_app.test_client()
+        thumbnail_etags = {}
+        if self.app.thumbnail_cache is not None:
+            # サムネイルの生成は計測に含めない
+            for review in reviews:
+                for filename in review.images:
+                    response = client.get(f"/thumbnail/{review.request_id}/{filename}", headers={"Accept": "image/webp"})
+                    thumbnail_etags[filename] = response.get_etag()[0]
+        kinds = ["full", "conditional", "range"] + (["thumbnail", "thumbnail-conditional"] if thumbnail_etags else [])
+        weights = [2, 4, 1] + ([2, 1] if thumbnail_etags else [])
+        stats = {kind: {"count": 0, "bytes": 0, "latencies": []} for kind in kinds}
+        lock = threading.Lock()
+        local = threading.local()
+
+        def load(op):
+            kind, review, filename = op
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = self.app.flask_app.test_client()
+            size = self.app.image_store.stat(filename).size
+            url = f"/image/{review.request_id}/{filename}"
+            headers, expected = {}, (200, size)
+            if kind == "conditional":
+                headers["If-None-Match"] = f'"{os.path.splitext(filename)[0]}"'
+                expected = (304, 0)
+            elif kind == "range":
+                start = size // 2
+                headers["Range"] = f"bytes={start}-"
+                expected = (206, size - start)
+            elif kind.startswith("thumbnail"):
+                url = f"/thumbnail/{review.request_id}/{filename}"
+                headers["Accept"] = "image/webp"
+                expected = (200, None)
+                if kind == "thumbnail-conditional":
+                    headers["If-None-Match"] = f'"{thumbnail_etags[filename]}"'
+                    expected = (304, 0)
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            body = response.get_data()
+            elapsed = time.perf_counter() - start
+            if response.status_code != expected[0] or expected[1] is not None and len(body) != expected[1]:
+                raise RuntimeError(f"{kind}の応答が正しくありません: {response.status_code} {len(body)}バイト")
+            with lock:
+                stats[kind]["count"] += 1
+                stats[kind]["bytes"] += len(body)
+                stats[kind]["latencies"].append(elapsed)
+
+        def finish():
+            self.extra["images"] = {
+                kind: {
+                    "count": values["count"],
+                    "bytes": values["bytes"],
+                    "p50_ms": percentile(values["latencies"], 0.5) * 1000,
+                    "p99_ms": percentile(values["latencies"], 0.99) * 1000,
+                }
+                for kind, values in stats.items()
+            }
+
+        self.finish = finish
+        ops = []
+        for _ in range(self.args.previews):
+            review = self.random.choice(reviews)
+            kind = self.random.choices(kinds, weights)[0]
+            ops.append((load, (kind, review, self.random.choice(review.images))))
+        return ops
+
+    def scenario_uploads(self):
+        """
+        1件あたり--upload-mb（既定は20MB）の画像付き申請を送信する
+        画像の組は--upload-sets通りだけ用意し、同じ組は同じポスターを出し直したものとして何度も送る
+        転送速度、uploadsに増えたバイト数（重複を除いて保存されているか）、処理中の常駐メモリのピークを記録する
+        申請のリクエストは組ごとに一度だけ組み立てて使い回す（送る側のメモリを計測に含めないため）
+        """
+        snapshot = self.app.sns_registry.snapshot
+        sns = next(iter(snapshot.accounts))
+        count = min(self.args.upload_images, self.app.MAX_IMAGES)
+        image_size = self.args.upload_mb * 1024 * 1024 // count
+        if image_size > self.app.MAX_IMAGE_BYTES or image_size * count > self.app.MAX_UPLOAD_BYTES:
+            raise ScenarioSkipped("画像の大きさがMAX_IMAGE_BYTESまたはMAX_UPLOAD_BYTESを超えます")
+        boundary = uuid.uuid4().hex
+        fields = {"sns": sns, "account": snapshot.accounts[sns][0], "post_text": "ベンチマーク用の申請（大きな画像）"}
+        bodies = []
+        for _ in range(self.args.upload_sets):
+            parts = [
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+                for name, value in fields.items()
+            ]
+            for i in range(count):
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="images"; filename="poster{i}.png"\r\n'
+                    f"Content-Type: image/png\r\n\r\n".encode()
+                    + b"\x89PNG\r\n\x1a\n" + os.urandom(image_size - 8) + b"\r\n"
+                )
+            parts.append(f"--{boundary}--\r\n".encode())
+            bodies.append(b"".join(parts))
+        del parts
+        uploads_dir = self.app.image_store.directory
+
+        def stored_bytes():
+            return sum(entry.stat().st_size for entry in os.scandir(uploads_dir) if entry.is_file())
+
+        def submit(body):
+            client = self.app.flask_app.test_client()
+            token = self.app.generate_jwt_token({"user_id": self.random.choice(self.authors), "channel_id": self.channel})
+            response = client.post(f"/submit_review?token={token}", data=body,
+                                   content_type=f"multipart/form-data; boundary={boundary}")
+            if response.status_code != 200:
+                raise RuntimeError(f"申請に失敗しました: {response.status_code}")
+
+        stored_before = stored_bytes()
+        rss_before = rss_mb()
+        peak = [rss_before]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(0.01):
+                peak[0] = max(peak[0], rss_mb())
+
+        sampler = threading.Thread(target=sample, name="bench-rss", daemon=True)
+        sampler.start()
+        ops = [(submit, self.random.choice(bodies)) for _ in range(self.args.uploads)]
+
+        def finish():
+            sampling.set()
+            sampler.join()
+            self.extra["uploads"] = {
+                "submitted_bytes": sum(len(body) for _, body in ops),
+                "stored_bytes": stored_bytes() - stored_before,
+                "distinct_bytes": image_size * count * len(bodies),
+                "peak_rss_delta_mb": peak[0] - rss_before,
+            }
+
+        self.finish = finish
+        return ops
+
+    def scenario_submissions(self):
+        """画像付きの申請をフォームから送信する"""
+        snapshot = self.app.sns_registry.snapshot
+        sns = next(iter(snapshot.accounts))
+        images = [self.image_bytes() for _ in range(max(1, self.args.images))]
+
+        def submit(author):
+            import io
+            client = self.app.flask_app.test_client()
+            token = self.app.generate_jwt_token({"user_id": author, "channel_id": self.channel})
+            data = {
+                "sns": sns,
+                "account": snapshot.accounts[sns][0],
+                "post_text": "ベンチマーク用の申請",
+                "images": [(io.BytesIO(image), f"image{i}.png") for i, image in enumerate(images[:self.args.images])],
+            }
+            response = client.post(f"/submit_review?token={token}", data=data, content_type="multipart/form-data")
+            if response.status_code != 200:
+                raise RuntimeError(f"申請に失敗しました: {response.status_code}")
+
+        authors = [self.random.choice(self.authors) for _ in range(self.args.submissions)]
+        return [(submit, author) for author in authors]
+
+    def scenario_post(self):
+        """承認済みのレビューを/postで一覧表示・投稿する"""
+        self.create_reviews(self.args.posts, approved=True)
+        self.app.publish_workers.poll_interval = 0.05
+        self.app.publish_workers.start()
+        ops = []
+        for author in self.authors:
+            ops.append((self.dispatch, self.command("/post", author, "list")))
+            ops.append((self.dispatch, self.command("/post", author, "all")))
+        return ops
+
+    def scenario_preview(self):
+        """レビュワーがプレビューページを繰り返し開く"""
+        reviews = self.create_reviews(max(1, self.args.reviews // 10))
+        tokens = {review.request_id: self.app.generate_jwt_token({"request_id": review.request_id})
+                  for review in reviews}
+        local = threading.local()
+
+        def view(review):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = self.app.flask_app.test_client()
+            response = client.get(f"/preview/{review.request_id}?token={tokens[review.request_id]}")
+            if response.status_code != 200:
+                raise RuntimeError(f"プレビューの表示に失敗しました: {response.status_code}")
+
+        return [(view, self.random.choice(reviews)) for _ in range(self.args.previews)]
+
+    def scenario_outbox(self):
+        """
+        別々のメッセージへのchat_updateを溜め、偽のAPIがその一部を429（ヘッダー名は大文字のRETRY-AFTER）にしている間に、
+        chat_postMessageを送信して完了までの時間を計測する
+        chat_updateの送信が止まっていてもchat_postMessageが待たされないこと、429の後にすべて送信できることを確認する
+        """
+        outbox = self.app.slack_outbox
+        stats_before = outbox.stats()
+        self.api.throttle("chat.update", self.args.outbox_throttle_every)
+        self.api.retry_after = "0.2"
+        self.api.retry_after_header = "RETRY-AFTER"
+        started = time.perf_counter()
+        updates = [
+            outbox.update_message(self.channel, self.api.next_ts(), text="ベンチマーク用の更新", blocks=[])
+            for _ in range(self.args.outbox_updates)
+        ]
+
+        def post(i):
+            outbox.call("chat_postMessage", channel=self.channel, text=f"ベンチマーク用の投稿 {i}").result(timeout=30)
+
+        def finish():
+            failed = 0
+            for future in updates:
+                try:
+                    future.result(timeout=120)
+                except Exception:
+                    failed += 1
+            self.api.throttle("chat.update", 0)
+            self.api.retry_after = "0.05"
+            self.api.retry_after_header = "Retry-After"
+            stats = outbox.stats()
+            self.extra["outbox"] = {
+                "updates": len(updates),
+                "update_seconds": time.perf_counter() - started,
+                "update_failed": failed,
+                "rate_limited": stats["rate_limited"] - stats_before["rate_limited"],
+            }
+            if failed:
+                raise RuntimeError(f"chat_updateの送信に失敗しました: {failed}件")
+
+        self.finish = finish
+        return [(post, i) for i in range(self.args.outbox_posts)]
+
+    def scenario_reconcile(self):
+        """
+        ボットの停止中にリアクションが付け外しされた状態を作り、起動時の突き合わせでまとめて反映する
+        偽のAPIのリアクションから期待する結果を計算し、突き合わせ後のレビューと一致するか確認する
+        """
+        required = self.app.REQUIRED_APPROVALS
+        reviews = self.create_reviews(self.args.reconcile_reviews)
+        expected = {}  # request_id -> ("pending" / "approved" / "rejected", 承認したユーザーの集合)
+        for review in reviews:
+            # 停止前に付いていた承認（必要数には達していない）
+            before = self.random.sample(self.reviewers, self.random.randint(0, min(required - 1, len(self.reviewers))))
+            for user in before:
+                review.add_approval(user)
+            self.app.review_store.put(review)
+            # 停止中に一部の承認が外され、別のレビュワーが承認した
+            accepted = [user for user in before if self.random.random() >= 0.2]
+            accepted += [user for user in self.reviewers if user not in before and self.random.random() < 0.3]
+            roll = self.random.random()
+            if roll < 0.01:
+                # メッセージが削除された（状態はそのまま）
+                self.api.delete_message(self.channel, review.ts)
+                expected[review.request_id] = ("pending", set(before))
+                continue
+            reactions = {"review_accept": accepted, "eyes": self.reviewers[:1]}
+            if roll < 0.04:
+                reactions["review_reject"] = [self.random.choice(self.reviewers)]
+                expected[review.request_id] = ("rejected", None)
+            elif len(accepted) >= required:
+                expected[review.request_id] = ("approved", set(accepted))
+            else:
+                expected[review.request_id] = ("pending", set(accepted))
+            self.api.set_reactions(self.channel, review.ts, reactions)
+        self.api.throttle("reactions.get", self.args.reconcile_throttle_every)
+        # 429のヘッダー名は小文字で返す（大文字・小文字によらずRetry-Afterに従うか）
+        self.api.retry_after_header = "retry-after"
+
+        def reconcile(_):
+            stats = self.app.reaction_reconciler.run(self.app.review_store.all())
+            self.api.throttle("reactions.get", 0)
+            self.api.retry_after_header = "Retry-After"
+            mismatches = []
+            for request_id, (state, approvals) in expected.items():
+                review = self.app.review_store.get(request_id)
+                actual = "rejected" if review is None else "approved" if review.approved else "pending"
+                if actual != state or (review is not None and set(review.approvals) != approvals):
+                    mismatches.append(request_id)
+            stats["mismatches"] = len(mismatches)
+            self.extra["reconcile"] = stats
+            if mismatches:
+                raise RuntimeError(f"突き合わせの結果が期待と異なります: {len(mismatches)}件（例: {mismatches[0]}）")
+
+        return [(reconcile, None)]
+
+    def start_server(self, kind):
+        """Webサーバーを別のプロセスで起動し、/healthzが応答するまで待つ"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        env = dict(os.environ, PORT=str(port))
+        if kind == "dev":
+            argv = [sys.executable, os.path.abspath(self.app.__file__), "--flask-only"]
+        else:
+            env["CLUSTER_ENABLED"] = "true"
+            argv = self.app.gunicorn_command(port, workers=self.args.web_workers, threads=self.args.web_threads)
+        process = subprocess.Popen(argv, env=env, cwd=os.path.dirname(os.path.abspath(self.app.__file__)),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.servers.append(process)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Webサーバーが起動できませんでした（終了コード {process.returncode}）")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/healthz")
+                if conn.getresponse().status == 200:
+                    return port
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Webサーバーが30秒以内に応答しませんでした")
+
+    def scenario_web(self, kind):
+        """別のプロセスで起動したWebサーバーのプレビューページにKeep-Aliveで接続して繰り返し開く"""
+        if self.args.store != "sqlite":
+            raise ScenarioSkipped("Webサーバーとレビューを共有するため --store sqlite を指定してください")
+        if kind == "prod" and importlib.util.find_spec("gunicorn") is None:
+            raise ScenarioSkipped("gunicornがインストールされていません")
+        reviews = self.create_reviews(max(1, self.args.reviews // 10))
+        self.app.review_store.flush()
+        tokens = {review.request_id: self.app.generate_jwt_token({"request_id": review.request_id})
+                  for review in reviews}
+        port = self.start_server(kind)
+        local = threading.local()
+
+        def view(review):
+            path = f"/preview/{review.request_id}?token={tokens[review.request_id]}"
+            for attempt in range(2):
+                conn = getattr(local, "conn", None)
+                if conn is None:
+                    conn = local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                try:
+                    conn.request("GET", path)
+                    response = conn.getresponse()
+                    response.read()
+                    break
+                except (http.client.HTTPException, OSError):
+                    # サーバーがKeep-Aliveの接続を閉じていたら接続し直す
+                    conn.close()
+                    local.conn = None
+                    if attempt:
+                        raise
+            if response.status != 200:
+                raise RuntimeError(f"プレビューの表示に失敗しました: {response.status}")
+
+        return [(view, self.random.choice(reviews)) for _ in range(self.args.previews)]
+
+    def scenario_web_dev(self):
+        """開発用サーバー（python app.py --flask-only）"""
+        return self.scenario_web("dev")
+
+    def scenario_web_prod(self):
+        """本番モードと同じgunicornの設定"""
+        return self.scenario_web("prod")
+
+    def close(self):
+        for process in self.servers:
+            process.terminate()
+        for process in self.servers:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        # 作業用ディレクトリを削除する前に、閉じたレビューのアーカイブを書き出しておく
+        if self.app.review_archive is not None:
+            self.app.review_archive.close()
+
+    def run(self, name):
+        self.extra = {}
+        self.finish = None
+        ops = getattr(self, f"scenario_{name.replace('-', '_')}")()
+        self.drain()
+        calls_before = self.api.snapshot()
+        updates_before = self.app.review_renderer.stats()
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        latencies = self.run_ops(ops)
+        elapsed = time.perf_counter() - start
+        if self.finish is not None:
+            self.finish()
+        self.drain()
+        drained = time.perf_counter() - start
+        calls = self.api.snapshot() - calls_before
+        updates = self.app.review_renderer.stats()
+        return {
+            **self.extra,
+            "message_updates": {key: updates[key] - updates_before[key] for key in ("sent", "suppressed")},
+            "scenario": name,
+            "ops": len(latencies),
+            "seconds": elapsed,
+            "drained_seconds": drained,
+            "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies, default=0.0) * 1000,
+            "rss_mb": rss_mb(),
+            "rss_delta_mb": rss_mb() - rss_before,
+            "api_calls": dict(sorted(calls.items())),
+        }
+
+
+def measure_memory(args):
+    """
+    レビューをsize件保持したときの1件あたりのメモリ使用量をtracemallocで計測する
+    ReviewRequest、同じ内容の辞書（to_dict()の形式）、アーカイブの列（閉じたレビュー）を比べる
+    """
+    import app
+
+    rng = random.Random(args.seed)
+    snapshot = app.sns_registry.snapshot
+    sns = next(iter(snapshot.accounts))
+    account = snapshot.accounts[sns][0]
+    now = int(time.time())
+
+    def make_review(i):
+        # Slackから受け取る値と同じく、IDは毎回別の文字列として作る
+        review = app.ReviewRequest(
+            author=f"UAUTH{rng.randrange(args.authors):03d}",
+            sns=sns,
+            account=account,
+            text=f"第{i}回 投稿テスト {uuid.UUID(int=rng.getrandbits(128))}",
+            channel=f"C{rng.randrange(1):05d}",
+        )
+        review.ts = f"{1700000000 + i}.000100"
+        for index in rng.sample(range(args.reviewers), min(args.reviewers, args.required_approvals)):
+            review.add_approval(f"UREV{index:03d}", now)
+        review.approved = True
+        return review
+
+    def measure(build):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            held = build()
+            used = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        del held
+        return used
+
+    results = []
+    for size in args.memory_sizes:
+        start = time.perf_counter()
+        rng.seed(args.seed)
+        live = measure(lambda: [make_review(i) for i in range(size)])
+        rng.seed(args.seed)
+        reviews = [make_review(i) for i in range(size)]
+        as_dict = measure(lambda: [review.to_dict() for review in reviews])
+        archive_dir = tempfile.mkdtemp(prefix="snsbot-archive-")
+        try:
+            def archive_all():
+                archive = app.ReviewArchive(archive_dir, segment_rows=size + 1)
+                for review in reviews:
+                    archive.append(review, "posted", closed_at=now)
+                return archive
+            archived = measure(archive_all)
+        finally:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+        del reviews
+        results.append({
+            "scenario": "memory",
+            "reviews": size,
+            "seconds": time.perf_counter() - start,
+            "bytes_per_review": {
+                "review_request": live / size,
+                "dict": as_dict / size,
+                "archive": archived / size,
+            },
+        })
+    return results
+
+
+def measure_auth(args):
+    """
+    認証まわりの1回あたりの時間を計測する
+    - jwt.decode: 毎回署名を検証する場合（キャッシュがない場合のrequire_jwt_auth）
+    - キャッシュ命中: VerifiedTokenCacheに検証済みのトークンがある場合
+    - 初回: キャッシュになく、検証してからキャッシュに入れる場合
+    - トークン生成: プレビューURLのトークンを毎回署名し直す場合
+    - プレビューURL: ReviewMessageRendererがレビューごとに使い回す場合
+    """
+    import jwt
+    import app
+
+    snapshot = app.sns_registry.snapshot
+    sns = next(iter(snapshot.accounts))
+    reviews = [
+        app.ReviewRequest(author=f"UAUTH{i % args.authors:03d}", sns=sns, account=snapshot.accounts[sns][0],
+                          text=f"認証のベンチマーク {i}", channel="CBENCH")
+        for i in range(args.auth_tokens)
+    ]
+    tokens = [app.generate_jwt_token({"request_id": review.request_id}) for review in reviews]
+    iterations = args.auth_iterations
+
+    def per_call(func, items):
+        start = time.perf_counter()
+        for i in range(iterations):
+            func(items[i % len(items)])
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    def first_use(token):
+        cache = app.VerifiedTokenCache()
+        if cache.get(token) is None:
+            cache.put(token, jwt.decode(token, app.JWT_SECRET, algorithms=["HS256"]))
+
+    cache = app.VerifiedTokenCache()
+    for token in tokens:
+        cache.put(token, jwt.decode(token, app.JWT_SECRET, algorithms=["HS256"]))
+    renderer = app.ReviewMessageRenderer(app.BASE_URL)
+    for review in reviews:
+        renderer.preview_url(review)
+
+    decode_us = per_call(lambda token: jwt.decode(token, app.JWT_SECRET, algorithms=["HS256"]), tokens)
+    hit_us = per_call(cache.get, tokens)
+    return {
+        "scenario": "auth",
+        "tokens": len(tokens),
+        "iterations": iterations,
+        "decode_us": decode_us,
+        "cache_hit_us": hit_us,
+        "first_use_us": per_call(first_use, tokens),
+        "mint_us": per_call(lambda review: app.generate_jwt_token({"request_id": review.request_id}), reviews),
+        "preview_url_us": per_call(renderer.preview_url, reviews),
+    }
+
+
+def measure_render(args):
+    """
+    プレビューページとレビューフォームのリクエスト1回あたりの時間を、描画キャッシュありとなしで比べる
+    （なしはキャッシュの件数を0にして毎回描画する。承認でバージョンが変わった直後と同じ）
+    リクエスト全体には認証などの時間も含まれるので、Jinjaの描画1回とキャッシュから返す1回の時間も別に計測する
+    起動時にまとめて行うテンプレートのコンパイルの時間も計測する
+    """
+    from flask import render_template
+
+    import app
+
+    snapshot = app.sns_registry.snapshot
+    sns = next(iter(snapshot.accounts))
+    reviews = []
+    for i in range(args.render_reviews):
+        review = app.ReviewRequest(author=f"UAUTH{i % args.authors:03d}", sns=sns, account=snapshot.accounts[sns][0],
+                                   text=f"描画のベンチマーク {i}\n" * 10, channel="CBENCH")
+        review.add_approval("UREV000")
+        # プレビューでは画像ごとに元画像と縮小画像のURLを生成するので、画像付きの申請と同じにする
+        review.images = tuple(f"{i:060x}{j:04d}.png" for j in range(args.render_images))
+        app.review_store.put(review)
+        reviews.append(review)
+    preview_urls = [f"/preview/{review.request_id}?token={app.generate_jwt_token({'request_id': review.request_id})}"
+                    for review in reviews]
+    form_url = f"/review_form?token={app.generate_jwt_token({'user_id': 'UAUTH000', 'channel_id': 'CBENCH'})}"
+    client = app.flask_app.test_client()
+    iterations = args.render_iterations
+
+    def per_request(urls):
+        start = time.perf_counter()
+        for i in range(iterations):
+            response = client.get(urls[i % len(urls)])
+            if response.status_code != 200:
+                raise RuntimeError(f"ページの表示に失敗しました: {response.status_code}")
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    app.flask_app.jinja_env.cache.clear()
+    start = time.perf_counter()
+    app.compile_templates()
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    result = {"scenario": "render", "reviews": len(reviews), "iterations": iterations, "compile_ms": compile_ms}
+    cached = app.render_cache
+    try:
+        for mode, cache in (("cached", cached), ("uncached", app.RenderCache(max_entries=0))):
+            app.render_cache = cache
+            # 1回目の描画は計測に含めない
+            per_request(preview_urls[:1] + [form_url])
+            result[f"preview_{mode}_us"] = per_request(preview_urls)
+            result[f"form_{mode}_us"] = per_request([form_url])
+    finally:
+        app.render_cache = cached
+
+    # Jinjaの描画そのものと、キャッシュから返す場合の1回あたりの時間
+    review = reviews[0]
+    with app.flask_app.test_request_context(preview_urls[0]):
+        def preview():
+            return render_template("preview.html", review=review, request_id=review.request_id)
+
+        def per_call(func):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            return (time.perf_counter() - start) / iterations * 1e6
+
+        result["jinja_preview_us"] = per_call(preview)
+        result["jinja_form_us"] = per_call(
+            lambda: render_template("review_form.html", sns_accounts=snapshot.form_accounts())
+        )
+        cache = app.RenderCache()
+        result["cache_hit_us"] = per_call(lambda: cache.get_or_render(review.request_id, review.version, preview))
+    return result
+
+
+def seed_startup_store(path, count):
+    """画像付きのレビューをcount件保存したSQLiteのファイルを作る（作成済みならそのまま使う）"""
+    import app
+    from review_store import SQLiteReviewStore
+
+    store = SQLiteReviewStore(path, app.ReviewRequest.from_dict, batch_size=1000)
+    try:
+        for i in range(store.count(), count):
+            review = app.ReviewRequest(author=f"UAUTH{i % 100:03d}", sns="Bench", account="bench",
+                                       text=f"保存済みのレビュー {i}", channel="CBENCH")
+            review.ts = f"1600000000.{i:06d}"
+            review.images = (f"{i % 5000:064x}.png",)
+            store.put(review)
+    finally:
+        store.close()
+
+
+def measure_startup(args):
+    """
+    新しいプロセスでapp.pyを読み込み、最初のリアクションのイベントを処理し終えるまでの時間を計測する
+    ローリングリスタートでイベントを取りこぼす時間の目安として、--startup-target-msと比べる
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    if args.startup_reviews:
+        # 保存済みのレビューが多くても起動が遅くならないかを見るため、画像付きのレビューを保存したSQLiteで起動する
+        path = os.path.join(os.path.dirname(os.environ["REVIEW_DB_PATH"]), "startup-reviews.db")
+        seed_startup_store(path, args.startup_reviews)
+        env.update(REVIEW_STORE="sqlite", REVIEW_DB_PATH=path)
+    event = {
+        "token": "bench",
+        "team_id": "TBENCH",
+        "api_app_id": "ABENCH",
+        "type": "event_callback",
+        "event_id": "EvSTARTUP",
+        "event_time": int(time.time()),
+        "event": {
+            "type": "reaction_added",
+            "user": "UREV000",
+            "reaction": "review_accept",
+            "item": {"type": "message", "channel": "CBENCH", "ts": "1.000000"},
+            "event_ts": f"{time.time():.6f}",
+        },
+        "authorizations": [{"team_id": "TBENCH", "user_id": "UBOT", "is_bot": True}],
+    }
+    runs = []
+    for _ in range(args.startup_runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, package_dir, json.dumps(event)],
+            capture_output=True, text=True, timeout=120, env=env,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+        if output.returncode != 0 or not lines:
+            raise RuntimeError(f"起動の計測に失敗しました: {output.stderr.strip()[-500:]}")
+        run = json.loads(lines[-1])
+        if run["status"] != 200:
+            raise RuntimeError(f"最初のイベントの処理に失敗しました: {run['status']}")
+        run["wall_ms"] = wall_ms
+        runs.append(run)
+    p50 = {key: percentile([run[key] for run in runs], 0.5) for key in ("import_ms", "first_event_ms", "wall_ms")}
+    return {
+        "scenario": "startup",
+        "runs": len(runs),
+        "stored": args.startup_reviews,
+        "import_ms": p50["import_ms"],
+        "first_event_ms": p50["first_event_ms"],
+        "wall_ms": p50["wall_ms"],
+        "target_ms": args.startup_target_ms,
+        "ok": p50["wall_ms"] <= args.startup_target_ms,
+    }
+
+
+def format_startup_result(result):
+    return (
+        f"startup      {result['runs']:>6}回（中央値、保存済み{result['stored']}件） import {result['import_ms']:>7.1f}ms  "
+        f"最初のイベントまで {result['first_event_ms']:>7.1f}ms  プロセス起動から {result['wall_ms']:>7.1f}ms  "
+        f"目標 {result['target_ms']:.0f}ms: {'OK' if result['ok'] else 'NG'}"
+    )
+
+
+def format_auth_result(result):
+    return (
+        f"auth         {result['tokens']:>6}トークン {result['iterations']}回  "
+        f"jwt.decode {result['decode_us']:.1f}µs  キャッシュ命中 {result['cache_hit_us']:.1f}µs"
+        f"（{result['decode_us'] / max(result['cache_hit_us'], 1e-9):.0f}倍）  初回 {result['first_use_us']:.1f}µs\n"
+        f"{'':<12} トークン生成 {result['mint_us']:.1f}µs  プレビューURL（使い回し） {result['preview_url_us']:.1f}µs"
+    )
+
+
+def format_render_result(result):
+    return (
+        f"render       {result['reviews']:>6}件 {result['iterations']}回  "
+        f"プレビュー キャッシュあり {result['preview_cached_us']:.0f}µs  なし {result['preview_uncached_us']:.0f}µs  "
+        f"レビューフォーム キャッシュあり {result['form_cached_us']:.0f}µs  なし {result['form_uncached_us']:.0f}µs\n"
+        f"{'':<12} Jinjaの描画 プレビュー {result['jinja_preview_us']:.0f}µs  レビューフォーム {result['jinja_form_us']:.0f}µs  "
+        f"キャッシュから返す場合 {result['cache_hit_us']:.1f}µs\n"
+        f"{'':<12} テンプレートのコンパイル {result['compile_ms']:.1f}ms（起動時に1回）"
+    )
+
+
+def format_memory_result(result):
+    per_review = result["bytes_per_review"]
+    return (
+        f"memory       {result['reviews']:>8}件  1件あたり ReviewRequest {per_review['review_request']:>7.0f}B  "
+        f"辞書 {per_review['dict']:>7.0f}B  アーカイブ {per_review['archive']:>6.0f}B  "
+        f"（{result['seconds']:.1f}秒）"
+    )
+
+
+def format_result(result):
+    calls = ", ".join(f"{method}={count}" for method, count in result["api_calls"].items()) or "なし"
+    return (
+        f"{result['scenario']:<12} {result['ops']:>6}件 {result['seconds']:>7.2f}秒 "
+        f"{result['ops_per_sec']:>9.1f}件/秒  p50 {result['p50_ms']:>7.2f}ms  p99 {result['p99_ms']:>7.2f}ms  "
+        f"max {result['max_ms']:>7.2f}ms  送信完了まで {result['drained_seconds']:>6.2f}秒  "
+        f"RSS {result['rss_mb']:.0f}MB（+{result['rss_delta_mb']:.1f}）\n"
+        f"{'':<12} API呼び出し: {calls}"
+        + format_message_updates(result.get("message_updates"))
+        + format_loop_lag(result.get("loop_lag"))
+        + format_outbox_stats(result.get("outbox"))
+        + format_approval_stats(result.get("approvals"))
+        + format_upload_stats(result.get("uploads"), result["seconds"])
+        + format_logging_stats(result.get("logging"))
+        + format_image_stats(result.get("images"), result["seconds"])
+        + format_large_store_stats(result.get("large_store"))
+        + format_publish_stats(result.get("publish"))
+        + format_reconcile_stats(result.get("reconcile"))
+    )
+
+
+def format_outbox_stats(stats):
+    if not stats:
+        return ""
+    return (
+        f"\n{'':<12} chat_update {stats['updates']}件の送信完了まで {stats['update_seconds']:.2f}秒  "
+        f"429 {stats['rate_limited']}回  失敗 {stats['update_failed']}件"
+    )
+
+
+def format_approval_stats(stats):
+    if not stats:
+        return ""
+    return (
+        f"\n{'':<12} 承認の通知: {stats['reviews']}件のレビューに {stats['notices']}件  "
+        f"重複 {stats['duplicated']}件  なし {stats['missing']}件  未承認 {stats['not_approved']}件"
+    )
+
+
+def format_publish_stats(stats):
+    if not stats:
+        return ""
+    return (
+        f"\n{'':<12} SNSへの投稿: {stats['targets']}アカウント分  リクエスト {stats['requests']}回  "
+        f"投稿 {stats['posted']}件  タイムアウト後の再送 {stats['replayed']}回  "
+        f"同時投稿数の最大 {stats['max_in_flight']}（上限 {stats['concurrency']}）  "
+        f"1秒あたりの最大 {stats['max_per_second']}件（{stats['rate']:g}件/秒）  不一致 {stats['errors']}件"
+    )
+
+
+def format_large_store_stats(stats):
+    if not stats:
+        return ""
+    return (
+        f"\n{'':<12} 保存済み {stats['stored']}件（準備 {stats['seed_seconds']:.1f}秒）  "
+        f"リアクション p50 {stats['reaction_p50_ms']:.2f}ms  p99 {stats['reaction_p99_ms']:.2f}ms  "
+        f"申請 p50 {stats['submit_p50_ms']:.2f}ms  p99 {stats['submit_p99_ms']:.2f}ms"
+    )
+
+
+def format_image_stats(stats, seconds):
+    if not stats:
+        return ""
+    total = sum(values["bytes"] for values in stats.values())
+    lines = [
+        f"\n{'':<12} {kind:<22} {values['count']:>6}件 {values['count'] / max(seconds, 1e-9):>8.1f}件/秒  "
+        f"{values['bytes'] / (1024 * 1024):>8.1f}MB  p50 {values['p50_ms']:.2f}ms  p99 {values['p99_ms']:.2f}ms"
+        for kind, values in stats.items()
+    ]
+    return "".join(lines) + f"\n{'':<12} 転送量 {total / (1024 * 1024):.1f}MB（{total / (1024 * 1024) / max(seconds, 1e-9):.1f}MB/秒）"
+
+
+def format_logging_stats(stats):
+    if not stats:
+        return ""
+    return (
+        f"\n{'':<12} ログ: {stats['lines']}行 {stats['bytes'] / 1024:.0f}KB  "
+        f"処理後の書き込み {stats['flush_seconds'] * 1000:.1f}ms  捨てた件数 {stats['dropped']}"
+    )
+
+
+def format_upload_stats(stats, seconds):
+    if not stats:
+        return ""
+    mb = 1024 * 1024
+    return (
+        f"\n{'':<12} 申請 {stats['submitted_bytes'] / mb:.0f}MB（{stats['submitted_bytes'] / mb / max(seconds, 1e-9):.1f}MB/秒）  "
+        f"保存 {stats['stored_bytes'] / mb:.0f}MB（重複を除いた画像 {stats['distinct_bytes'] / mb:.0f}MB）  "
+        f"常駐メモリのピーク +{stats['peak_rss_delta_mb']:.0f}MB"
+    )
+
+
+def format_loop_lag(lag):
+    if not lag:
+        return ""
+    return (
+        f"\n{'':<12} イベントループの遅れ: p50 {lag['p50_ms']:.2f}ms  p99 {lag['p99_ms']:.2f}ms  "
+        f"max {lag['max_ms']:.2f}ms"
+    )
+
+
+def format_message_updates(updates):
+    if not updates or not (updates["sent"] or updates["suppressed"]):
+        return ""
+    return f"\n{'':<12} メッセージの更新: 送信 {updates['sent']}  省略 {updates['suppressed']}"
+
+
+def format_reconcile_stats(stats):
+    if not stats:
+        return ""
+    return (
+        f"\n{'':<12} 突き合わせ: {stats['checked']}件 {stats['checked'] / max(stats['seconds'], 1e-9):.1f}件/秒  "
+        f"承認 {stats.get('approved', 0)}  リジェクト {stats.get('rejected', 0)}  更新 {stats.get('updated', 0)}  "
+        f"変更なし {stats.get('unchanged', 0)}  メッセージなし {stats.get('missing', 0)}  "
+        f"失敗 {stats.get('failed', 0)}  429 {stats['rate_limited']}回  不一致 {stats['mismatches']}件"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レビューボットのベンチマーク")
+    parser.add_argument("scenarios", nargs="*", help=f"実行するシナリオ（{', '.join(SCENARIOS + EXTRA_SCENARIOS)}）")
+    parser.add_argument("--store", choices=("memory", "sqlite"), default="memory", help="レビューの保存先")
+    parser.add_argument("--reviews", type=int, default=200, help="リアクションを付けるレビューの件数")
+    parser.add_argument("--reviewers", type=int, default=5, help="レビュワーの人数")
+    parser.add_argument("--required-approvals", type=int, default=2, help="承認に必要な人数")
+    parser.add_argument("--authors", type=int, default=20, help="申請者の人数")
+    parser.add_argument("--submissions", type=int, default=100, help="申請の件数")
+    parser.add_argument("--images", type=int, default=2, help="1件の申請に添付する画像の枚数")
+    parser.add_argument("--image-kb", type=int, default=200, help="画像1枚のサイズ（KB）")
+    parser.add_argument("--posts", type=int, default=50, help="/postで投稿する承認済みレビューの件数")
+    parser.add_argument("--previews", type=int, default=1000, help="プレビューページを開く回数")
+    parser.add_argument("--workers", type=int, default=8, help="同時に処理するスレッド数")
+    parser.add_argument("--api-latency", type=float, default=20.0, help="偽のSlack APIの応答にかける時間（ミリ秒）")
+    parser.add_argument("--outbox-updates", type=int, default=300, help="outboxで溜めるchat_updateの件数")
+    parser.add_argument("--outbox-posts", type=int, default=50, help="outboxで送信するchat_postMessageの件数")
+    parser.add_argument("--outbox-throttle-every", type=int, default=5,
+                        help="outboxで偽のAPIがchat.updateをこの回数ごとに429にする")
+    parser.add_argument("--publishes", type=int, default=20, help="publishで複数アカウントに投稿する告知の件数")
+    parser.add_argument("--publish-rate", type=float, default=40.0, help="publishのSNSごとの1秒あたりの投稿数")
+    parser.add_argument("--seed-reviews", type=int, default=100000,
+                        help="large-storeで事前に保存しておくレビューの件数")
+    parser.add_argument("--auth-tokens", type=int, default=1000, help="authで使うトークン（レビュー）の数")
+    parser.add_argument("--auth-iterations", type=int, default=20000, help="authで1種類あたりに繰り返す回数")
+    parser.add_argument("--uploads", type=int, default=20, help="uploadsで送信する申請の件数")
+    parser.add_argument("--upload-mb", type=int, default=20, help="uploadsの申請1件あたりの画像の合計（MB）")
+    parser.add_argument("--upload-images", type=int, default=4, help="uploadsの申請1件あたりの画像の枚数")
+    parser.add_argument("--upload-sets", type=int, default=3, help="uploadsで用意する画像の組の数（残りは同じ画像の再申請）")
+    parser.add_argument("--render-reviews", type=int, default=100, help="renderでプレビューを開くレビューの件数")
+    parser.add_argument("--render-iterations", type=int, default=2000, help="renderで1種類あたりに開く回数")
+    parser.add_argument("--render-images", type=int, default=4, help="renderでプレビューするレビューの画像の枚数")
+    parser.add_argument("--approval-reviews", type=int, default=300, help="approvalsで同時に承認するレビューの件数")
+    parser.add_argument("--reconcile-reviews", type=int, default=2000, help="reconcileで突き合わせるレビューの件数")
+    parser.add_argument("--reconcile-rate", type=float, default=0.0,
+                        help="reconcileのreactions.getの1秒あたりの回数（0で制限なし）")
+    parser.add_argument("--reconcile-throttle-every", type=int, default=100,
+                        help="偽のAPIがreactions.getをこの回数ごとに429にする（0でしない）")
+    parser.add_argument("--web-workers", type=int, default=2, help="web-prodのワーカープロセス数")
+    parser.add_argument("--web-threads", type=int, default=8, help="web-prodのワーカーごとのスレッド数")
+    parser.add_argument("--startup-runs", type=int, default=5, help="startupシナリオでプロセスを起動する回数")
+    parser.add_argument("--startup-reviews", type=int, default=100000,
+                        help="startupシナリオで保存しておくレビューの件数（0で空のストア）")
+    parser.add_argument("--startup-target-ms", type=float, default=1000.0,
+                        help="プロセスの起動から最初のイベントを処理するまでの目標時間（ミリ秒）")
+    parser.add_argument("--memory-sizes", default="10000,100000",
+                        help="memoryシナリオで保持するレビューの件数（カンマ区切り）")
+    parser.add_argument("--seed", type=int, default=1, help="乱数のシード")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS + EXTRA_SCENARIOS]
+    if unknown:
+        parser.error(f"不明なシナリオです: {', '.join(unknown)}")
+    try:
+        args.memory_sizes = [int(size) for size in args.memory_sizes.split(",") if size.strip()]
+    except ValueError:
+        parser.error(f"--memory-sizesが正しくありません: {args.memory_sizes}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+
+    members = [{"id": f"UAUTH{i:03d}", "name": f"author{i}", "profile": {"display_name": f"author{i}"}}
+               for i in range(args.authors)]
+    api = FakeSlackAPI(latency=args.api_latency / 1000, members=members)
+    api.start()
+
+    workdir = tempfile.mkdtemp(prefix="snsbot-bench-")
+    os.makedirs(os.path.join(workdir, "uploads"))
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SIGNING_SECRET": "bench",
+        "JWT_SECRET": uuid.uuid4().hex,
+        "SLACK_API_URL": api.url,
+        "REVIEWER_IDS": ",".join(f"UREV{i:03d}" for i in range(args.reviewers)),
+        "REQUIRED_APPROVALS": str(args.required_approvals),
+        "REVIEW_STORE": args.store,
+        "REVIEW_DB_PATH": os.path.join(workdir, "reviews.db"),
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.db"),
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "MAX_UPLOAD_BYTES": str(max(40, args.images * args.image_kb * 2 // 1024 + 1) * 1024 * 1024),
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    try:
+        bench = None
+        results = []
+        for name in args.scenarios:
+            if name == "startup":
+                result = measure_startup(args)
+                results.append(result)
+                if not args.json:
+                    print(format_startup_result(result), flush=True)
+                continue
+            if name == "auth":
+                result = measure_auth(args)
+                results.append(result)
+                if not args.json:
+                    print(format_auth_result(result), flush=True)
+                continue
+            if name == "render":
+                result = measure_render(args)
+                results.append(result)
+                if not args.json:
+                    print(format_render_result(result), flush=True)
+                continue
+            if name == "memory":
+                for result in measure_memory(args):
+                    results.append(result)
+                    if not args.json:
+                        print(format_memory_result(result), flush=True)
+                continue
+            if bench is None:
+                bench = Bench(args, api)
+            try:
+                result = bench.run(name)
+            except ScenarioSkipped as e:
+                print(f"{name}: スキップしました（{e}）", file=sys.stderr)
+                continue
+            results.append(result)
+            if not args.json:
+                print(format_result(result), flush=True)
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=2))
+    finally:
+        if bench is not None:
+            bench.close()
+        api.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
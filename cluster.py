@@ -0,0 +1,392 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterLockTimeout(Exception):
+    """他のレプリカが持っているロックを時間内に取得できなかった"""
+
+
+class Cluster:
+    """
+    複数のボットのレプリカで共有する状態（SQLite）
+    - イベントバス: 変更を通知し、他のレプリカがキャッシュを破棄する（publish/subscribe）
+    - クレーム: 同じSlackイベントを1つのレプリカだけが処理する（claim）。処理に失敗したら手放して、再送で処理し直せるようにする
+    - リース: 期限付きのロック。レビューごとのロックとリーダーの選出に使う
+    - 設定: レプリカ間で共有する値（/registerで追加したレビュワーなど）
+    データベースファイルはすべてのレプリカから読み書きできる場所に置くこと
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cluster_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        key TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS cluster_claims (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        state TEXT NOT NULL DEFAULT 'done',
+        expires_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS cluster_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS cluster_settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path, node_id=None, poll_interval=0.2, leader_ttl=15.0, event_retention=3600,
+                 claim_retention=24 * 3600):
+        """
+        Args:
+            path: 共有するデータベースファイルのパス
+            node_id: このレプリカの識別子（省略時は ホスト名-プロセスID）
+            poll_interval: イベントバスを確認する間隔（秒）
+            leader_ttl: リーダーのリースの有効期間（秒）。リーダーが停止するとこの時間で交代する
+            event_retention: 通知を残しておく秒数
+            claim_retention: 処理済みのイベントを覚えておく秒数
+        """
+        self.path = path
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.leader_ttl = leader_ttl
+        self.event_retention = event_retention
+        self.claim_retention = claim_retention
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        # 処理中の状態を持たない古いcluster_claimsには列を追加する（既存の行は処理済みとみなす）
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cluster_claims)")}
+        if "state" not in columns:
+            self._conn.execute("ALTER TABLE cluster_claims ADD COLUMN state TEXT NOT NULL DEFAULT 'done'")
+        if "expires_at" not in columns:
+            self._conn.execute("ALTER TABLE cluster_claims ADD COLUMN expires_at REAL")
+        self._lock = threading.Lock()
+
+        self._subscribers = {}  # トピック -> 関数のリスト
+        self._poll_lock = threading.Lock()
+        self._last_seq = self._execute("SELECT COALESCE(MAX(seq), 0) FROM cluster_events")[0][0]
+
+        self._leader = False
+        self._on_elected = []
+        self._stop = threading.Event()
+        self._threads = {}  # スレッド名 -> スレッド
+        self._start_lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _transaction(self, fn):
+        # 複数プロセスから使っても競合しないように書き込みロックを取ってから読む
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # --- イベントバス ---
+
+    def publish(self, topic, key=""):
+        """他のレプリカに変更を通知する（自分の通知は自分には届かない）"""
+        self._execute(
+            "INSERT INTO cluster_events (origin, topic, key, created_at) VALUES (?, ?, ?, ?)",
+            (self.node_id, topic, key, time.time()),
+        )
+
+    def subscribe(self, topic, callback):
+        """
+        Args:
+            topic: 購読するトピック
+            callback: 通知を受け取る関数 (key)
+        """
+        self._subscribers.setdefault(topic, []).append(callback)
+
+    def poll(self):
+        """
+        未処理の通知を受け取って購読している関数を呼ぶ
+        ロックを取った直後にも呼び、前の持ち主の変更を確実に反映してから読む
+        Returns:
+            int: 処理した通知の件数
+        """
+        with self._poll_lock:
+            rows = self._execute(
+                "SELECT seq, origin, topic, key FROM cluster_events WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            )
+            for seq, origin, topic, key in rows:
+                self._last_seq = seq
+                if origin == self.node_id:
+                    continue
+                for callback in self._subscribers.get(topic, ()):
+                    try:
+                        callback(key)
+                    except Exception as e:
+                        logger.error(f"クラスタの通知の処理に失敗しました: {topic} {key}: {e}")
+            return len(rows)
+
+    # --- クレーム ---
+
+    def claim(self, key, ttl=120.0):
+        """
+        イベントを処理する権利を得る（同じkeyで最初に呼んだレプリカだけがTrue）
+        Slackが再送したイベントを別のレプリカが処理し直さないようにする
+        権利は処理中の状態で期限付きで持ち、complete_claim()で処理済みにするか、release_claim()で手放す
+        持ち主が処理済みにしないまま期限が過ぎた場合（途中で停止した場合など）は、再送されたイベントで取り直せる
+        Args:
+            ttl: 処理中の状態を保つ秒数（イベントの処理にかかる最長の時間より長くする）
+        """
+        def fn(conn):
+            now = time.time()
+            row = conn.execute("SELECT state, expires_at FROM cluster_claims WHERE key = ?", (key,)).fetchone()
+            if row is not None and (row[0] == "done" or row[1] > now):
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cluster_claims (key, owner, created_at, state, expires_at) "
+                "VALUES (?, ?, ?, 'processing', ?)",
+                (key, self.node_id, now, now + ttl),
+            )
+            return True
+        return self._transaction(fn)
+
+    def complete_claim(self, key):
+        """イベントを処理済みにする（以降は同じkeyでclaim()してもFalse）"""
+        self._execute(
+            "UPDATE cluster_claims SET state = 'done', expires_at = NULL WHERE key = ? AND owner = ?",
+            (key, self.node_id),
+        )
+
+    def release_claim(self, key):
+        """処理に失敗したイベントの権利を手放す（再送されたイベントを処理し直せるようにする）"""
+        self._execute(
+            "DELETE FROM cluster_claims WHERE key = ? AND owner = ? AND state = 'processing'", (key, self.node_id)
+        )
+
+    # --- リース ---
+
+    def acquire_lease(self, name, ttl):
+        """
+        期限付きのリースを取得または延長する
+        Returns:
+            bool: 取得できた場合はTrue（他のレプリカが有効なリースを持っている場合はFalse）
+        """
+        def fn(conn):
+            now = time.time()
+            row = conn.execute("SELECT owner, expires_at FROM cluster_leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != self.node_id and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cluster_leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, self.node_id, now + ttl),
+            )
+            return True
+        return self._transaction(fn)
+
+    def release_lease(self, name):
+        self._execute("DELETE FROM cluster_leases WHERE name = ? AND owner = ?", (name, self.node_id))
+
+    def lease(self, name, ttl=30.0, timeout=10.0):
+        """
+        リースを取得するまで待つ（with文で使う）
+        Raises:
+            ClusterLockTimeout: timeout秒以内に取得できなかった場合
+        """
+        return _Lease(self, name, ttl, timeout)
+
+    # --- 設定 ---
+
+    def get_setting(self, key, default=None):
+        rows = self._execute("SELECT value FROM cluster_settings WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_setting(self, key, value):
+        self._execute("INSERT OR REPLACE INTO cluster_settings (key, value) VALUES (?, ?)", (key, value))
+
+    # --- リーダー ---
+
+    def is_leader(self):
+        """期限切れの掃除などの、1つのレプリカだけで行う処理を担当しているか"""
+        return self._leader
+
+    def on_elected(self, callback):
+        """リーダーになったときに呼ぶ関数を登録する"""
+        self._on_elected.append(callback)
+
+    def _elect(self):
+        try:
+            leader = self.acquire_lease("leader", self.leader_ttl)
+        except sqlite3.Error as e:
+            logger.error(f"リーダーのリースの更新に失敗しました: {e}")
+            leader = False
+        if leader and not self._leader:
+            logger.info(f"このレプリカがリーダーになりました: {self.node_id}")
+            self._leader = True
+            for callback in self._on_elected:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"リーダー就任時の処理に失敗しました: {e}")
+        elif not leader and self._leader:
+            logger.warning(f"リーダーではなくなりました: {self.node_id}")
+            self._leader = False
+
+    # --- バックグラウンド処理 ---
+
+    def start(self, elect=True):
+        """
+        通知の受信・リーダーの選出・古い記録の削除を行うスレッドを開始する
+        Args:
+            elect: Falseの場合は通知の受信だけを行い、リーダーの選出には参加しない
+                   （Slackの接続や掃除を持たないWebサーバーのプロセス用。後からTrueで呼ぶと参加する）
+        """
+        targets = [("cluster-bus", self._run_bus)]
+        if elect:
+            targets.append(("cluster-leader", self._run_leader))
+        with self._start_lock:
+            for name, target in targets:
+                if name in self._threads:
+                    continue
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads[name] = thread
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads.values():
+            thread.join(timeout=timeout)
+        self._threads = {}
+        if self._leader:
+            # 次のリーダーがリースの期限切れを待たずに交代できるようにする
+            self._leader = False
+            try:
+                self.release_lease("leader")
+            except sqlite3.Error:
+                pass
+
+    def _run_bus(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"クラスタの通知の受信に失敗しました: {e}")
+
+    def _run_leader(self):
+        last_prune = 0.0
+        while not self._stop.is_set():
+            self._elect()
+            if self._leader and time.monotonic() - last_prune >= 60:
+                last_prune = time.monotonic()
+                try:
+                    self.prune()
+                except sqlite3.Error as e:
+                    logger.error(f"クラスタの古い記録の削除に失敗しました: {e}")
+            self._stop.wait(self.leader_ttl / 3)
+
+    def prune(self):
+        """古い通知・クレーム・期限切れのリースを削除する"""
+        now = time.time()
+        self._execute("DELETE FROM cluster_events WHERE created_at < ?", (now - self.event_retention,))
+        self._execute("DELETE FROM cluster_claims WHERE created_at < ?", (now - self.claim_retention,))
+        self._execute("DELETE FROM cluster_leases WHERE expires_at < ?", (now,))
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+
+class _Lease:
+    def __init__(self, cluster, name, ttl, timeout):
+        self.cluster = cluster
+        self.name = name
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        delay = 0.005
+        while not self.cluster.acquire_lease(self.name, self.ttl):
+            if time.monotonic() >= deadline:
+                raise ClusterLockTimeout(f"ロックを取得できませんでした: {self.name}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cluster.release_lease(self.name)
+
+
+class ClusterReviewLocks:
+    """
+    レプリカをまたいだrequest_idごとのロック（ReviewLocksと同じ使い方）
+    プロセス内のロックを取ってから共有のリースを取得し、取得直後に通知を処理して他のレプリカの変更を反映する
+    同じスレッドからの入れ子のロックでは、共有のリースは最初の1回だけ取得する
+    """
+
+    def __init__(self, cluster, stripes=64, ttl=30.0, timeout=10.0):
+        """
+        Args:
+            cluster: Cluster
+            stripes: プロセス内のロックの数
+            ttl: 共有のリースの有効期間（秒）。延長しないので、ロックを持っている間に待つ最長の時間より十分長くする
+            timeout: 他のレプリカが持っているロックを待つ秒数
+        """
+        self.cluster = cluster
+        self.ttl = ttl
+        self.timeout = timeout
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._depth = {}  # request_id -> 入れ子の深さ（request_idのロックの中でだけ変更する）
+
+    def lock_for(self, request_id):
+        stripe = self._locks[zlib.crc32(request_id.encode()) % len(self._locks)]
+        return _ClusterReviewLock(self, stripe, request_id)
+
+
+class _ClusterReviewLock:
+    def __init__(self, locks, stripe, request_id):
+        self.locks = locks
+        self.stripe = stripe
+        self.request_id = request_id
+
+    def __enter__(self):
+        self.stripe.acquire()
+        depth = self.locks._depth.get(self.request_id, 0)
+        if depth == 0:
+            try:
+                self.locks.cluster.lease(f"review:{self.request_id}", self.locks.ttl, self.locks.timeout).__enter__()
+                self.locks.cluster.poll()
+            except BaseException:
+                self.stripe.release()
+                raise
+        self.locks._depth[self.request_id] = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            depth = self.locks._depth[self.request_id] - 1
+            if depth:
+                self.locks._depth[self.request_id] = depth
+            else:
+                del self.locks._depth[self.request_id]
+                self.locks.cluster.release_lease(f"review:{self.request_id}")
+        finally:
+            self.stripe.release()
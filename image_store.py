@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# 先頭のバイト列と保存時の拡張子
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+FileStat = namedtuple("FileStat", ["size", "mtime"])
+
+
+class UploadRejected(Exception):
+    """アップロードされたファイルを受け付けられない"""
+
+
+def sniff_image_type(head):
+    """
+    ファイル先頭のバイト列から画像形式を判定する
+    Returns:
+        str: 拡張子（画像でない場合はNone）
+    """
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+class ImageStore:
+    """
+    アップロード画像を内容のSHA-256をファイル名にして保存する
+    同じ画像は1つだけ保存し、ReviewRequest.imagesからの参照数が0になったら削除する
+    参照数はrebuild_refcounts()で数えるまで分からないので、それまでは参照数が0になっても削除しない（sweep_orphans()に任せる）
+    """
+
+    def __init__(self, directory, max_file_bytes, chunk_size=64 * 1024, stat_cache_size=4096, delete_on_release=True):
+        """
+        Args:
+            directory: 保存先のディレクトリ
+            max_file_bytes: 1ファイルあたりの最大バイト数
+            chunk_size: ストリームから一度に読み込むバイト数
+            stat_cache_size: stat()の結果をキャッシュする件数
+            delete_on_release: 参照数が0になったらすぐに削除する
+                （複数のプロセスで共有する場合はFalseにし、全体の参照数を数え直してからsweep_orphans()で削除する）
+        """
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.chunk_size = chunk_size
+        self.stat_cache_size = stat_cache_size
+        self.delete_on_release = delete_on_release
+        self._refcounts = Counter()
+        self.loaded = False  # rebuild_refcounts()で参照数を数え終えたか
+        self._added = None  # 数え直している間に保存した画像の参照数
+        self._rebuild_lock = threading.Lock()
+        self._stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def stat(self, filename):
+        """
+        ファイルのサイズと更新日時を返す
+        保存した画像は内容が変わらないので、削除されるまで結果をキャッシュする
+        Returns:
+            FileStat: ファイルがない場合はNone
+        """
+        with self._lock:
+            cached = self._stats.get(filename)
+            if cached is not None:
+                self._stats.move_to_end(filename)
+                return cached
+        try:
+            st = os.stat(self.path(filename))
+        except FileNotFoundError:
+            return None
+        result = FileStat(st.st_size, st.st_mtime)
+        with self._lock:
+            self._stats[filename] = result
+            while len(self._stats) > self.stat_cache_size:
+                self._stats.popitem(last=False)
+        return result
+
+    def forget_stat(self, filename):
+        with self._lock:
+            self._stats.pop(filename, None)
+
+    def rebuild_refcounts(self, reviews):
+        """
+        保存済みのレビューから参照数を数え直す（起動時にバックグラウンドで呼ぶ）
+        Args:
+            reviews: レビューのリスト、またはレビューを返す関数（数え直している間の保存を漏らさないように、数え始めてから呼ぶ）
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._added = Counter()
+            refcounts = Counter()
+            for review in reviews() if callable(reviews) else reviews:
+                refcounts.update(review.images)
+            with self._lock:
+                # 数えている間に保存した画像は読み込んだレビューに含まれているか分からないので足しておく
+                # （多く数えても削除が遅れるだけで、使っている画像は削除しない）
+                refcounts.update(self._added)
+                self._added = None
+                self._refcounts = refcounts
+                self.loaded = True
+
+    def save_stream(self, stream, max_bytes=None):
+        """
+        ストリームをチャンクごとにディスクへ書き込みながらハッシュを計算して保存する
+        保存した画像の参照数は1増える（使わなくなったらrelease()すること）
+        Args:
+            stream: read(size)を持つファイルオブジェクト
+            max_bytes: このファイルに使える残りバイト数（リクエスト全体の上限用）
+        Returns:
+            tuple: (保存したファイル名, バイト数)
+        Raises:
+            UploadRejected: 画像でない、またはサイズ上限を超えた場合
+        """
+        limit = self.max_file_bytes if max_bytes is None else min(self.max_file_bytes, max_bytes)
+        digest = hashlib.sha256()
+        size = 0
+        ext = None
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if ext is None:
+                        ext = sniff_image_type(chunk)
+                        if ext is None:
+                            raise UploadRejected("画像ファイルではありません")
+                    size += len(chunk)
+                    if size > limit:
+                        raise UploadRejected(f"ファイルサイズが上限（{limit}バイト）を超えています")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            if ext is None:
+                raise UploadRejected("空のファイルです")
+
+            filename = digest.hexdigest() + ext
+            with self._lock:
+                if os.path.exists(self.path(filename)):
+                    # 同じ内容の画像が保存済みなので一時ファイルは捨てる
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, self.path(filename))
+                self._refcounts[filename] += 1
+                if self._added is not None:
+                    self._added[filename] += 1
+            return filename, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def release(self, filenames):
+        """
+        画像の参照を外し、参照数が0になったファイルを削除する
+        Returns:
+            int: 削除したバイト数
+        """
+        reclaimed = 0
+        with self._lock:
+            for filename in filenames:
+                if self._refcounts[filename] > 1:
+                    self._refcounts[filename] -= 1
+                    continue
+                self._refcounts.pop(filename, None)
+                if not self.delete_on_release or not self.loaded:
+                    continue
+                self._stats.pop(filename, None)
+                try:
+                    reclaimed += os.path.getsize(self.path(filename))
+                    os.remove(self.path(filename))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"画像ファイルの削除に失敗しました: {filename}: {e}")
+        return reclaimed
+
+    def sweep_orphans(self, min_age=3600):
+        """
+        どのレビューからも参照されていない画像と、中断したアップロードの一時ファイルを削除する
+        アップロード直後のファイルを消さないように、min_age秒より古いものだけを対象にする
+        Returns:
+            tuple: (削除したファイル数, 削除したバイト数)
+        """
+        if not self.loaded:
+            # 参照数を数える前は、参照されている画像と区別できない
+            return 0, 0
+        cutoff = time.time() - min_age
+        count = 0
+        reclaimed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            with self._lock:
+                if not entry.name.startswith(".") and self._refcounts.get(entry.name, 0) > 0:
+                    continue
+                try:
+                    st = entry.stat()
+                    if st.st_mtime > cutoff:
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.error(f"画像ファイルの削除に失敗しました: {entry.name}: {e}")
+                    continue
+                self._stats.pop(entry.name, None)
+            count += 1
+            reclaimed += st.st_size
+        return count, reclaimed
+
+    def refcount(self, filename):
+        with self._lock:
+            return self._refcounts.get(filename, 0)
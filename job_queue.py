@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Job = namedtuple("Job", ["id", "payload", "run_at", "attempts", "lease_until"])
+
+
+class JobQueue:
+    """
+    SQLiteに保存する永続ジョブキュー
+    - ジョブIDで重複を排除する（同じIDのジョブは実行待ちの間1つしか入らない）
+    - ワーカーは可視性タイムアウト付きでジョブをリースし、タイムアウトしたジョブは別のワーカーが再実行する
+      （少なくとも1回の実行を保証するので、処理側は冪等にすること）
+    - 最大試行回数を超えたジョブはデッドレターとして残す
+    - ジョブの途中までの結果（アカウントごとの投稿IDなど）を記録でき、再実行や再投入のときに参照できる
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL,
+        run_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_until REAL,
+        leased_by TEXT,
+        last_error TEXT,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_state_run_at ON jobs (state, run_at);
+    CREATE TABLE IF NOT EXISTS job_results (
+        job_id TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (job_id, key)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, max_attempts=5):
+        """
+        Args:
+            path: データベースファイルのパス
+            max_attempts: デッドレターに移すまでの最大試行回数
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def _transaction(self, fn):
+        # 複数プロセスから使っても競合しないように書き込みロックを取ってから読む
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, job_id, payload, run_at=None):
+        """
+        ジョブを追加する
+        同じIDのジョブが実行待ち・実行中・完了済みの場合は追加しない（デッドレターの場合は再投入する）
+        Returns:
+            bool: 追加した場合はTrue
+        """
+        now = time.time()
+        run_at = now if run_at is None else run_at
+
+        def fn(conn):
+            row = conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and row[0] != "dead":
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, payload, state, run_at, attempts, updated_at) "
+                "VALUES (?, ?, 'queued', ?, 0, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), run_at, now),
+            )
+            return True
+
+        return self._transaction(fn)
+
+    def lease(self, worker_id, visibility_timeout):
+        """
+        実行時刻を過ぎたジョブを1つリースする
+        リースの期限が切れたジョブ（ワーカーが落ちた場合など）も対象になる
+        Returns:
+            Job: リースしたジョブ（なければNone）
+        """
+        now = time.time()
+
+        def fn(conn):
+            row = conn.execute(
+                "SELECT id, payload, run_at, attempts FROM jobs "
+                "WHERE (state = 'queued' AND run_at <= ?) OR (state = 'leased' AND lease_until <= ?) "
+                "ORDER BY run_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, payload, run_at, attempts = row
+            lease_until = now + visibility_timeout
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_until = ?, leased_by = ?, "
+                "updated_at = ? WHERE id = ?",
+                (lease_until, worker_id, now, job_id),
+            )
+            return Job(job_id, json.loads(payload), run_at, attempts + 1, lease_until)
+
+        return self._transaction(fn)
+
+    def complete(self, job_id, worker_id):
+        """ジョブを完了にする（リースが別のワーカーに移っていた場合は何もしない）"""
+        def fn(conn):
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'done', lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND state = 'leased' AND leased_by = ?",
+                (time.time(), job_id, worker_id),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(fn)
+
+    def fail(self, job_id, worker_id, error, retry_delay):
+        """
+        ジョブの失敗を記録し、再試行するかデッドレターに移す
+        Returns:
+            bool: デッドレターに移した場合はTrue
+        """
+        now = time.time()
+
+        def fn(conn):
+            row = conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND state = 'leased' AND leased_by = ?",
+                (job_id, worker_id),
+            ).fetchone()
+            if row is None:
+                return False
+            dead = row[0] >= self.max_attempts
+            conn.execute(
+                "UPDATE jobs SET state = ?, run_at = ?, lease_until = NULL, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                ("dead" if dead else "queued", now + retry_delay, str(error), now, job_id),
+            )
+            return dead
+
+        return self._transaction(fn)
+
+    def cancel(self, job_id):
+        """実行待ちのジョブを取り消す"""
+        def fn(conn):
+            cursor = conn.execute("DELETE FROM jobs WHERE id = ? AND state = 'queued'", (job_id,))
+            if cursor.rowcount == 0:
+                return False
+            conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            return True
+
+        return self._transaction(fn)
+
+    def purge(self, older_than):
+        """
+        完了してからolder_than秒以上経ったジョブを削除する
+        Returns:
+            int: 削除したジョブ数
+        """
+        def fn(conn):
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE state = 'done' AND updated_at < ?", (time.time() - older_than,)
+            )
+            conn.execute("DELETE FROM job_results WHERE job_id NOT IN (SELECT id FROM jobs)")
+            return cursor.rowcount
+
+        return self._transaction(fn)
+
+    def record_result(self, job_id, key, value):
+        """
+        ジョブの途中までの結果を記録する（ジョブが存在しない場合は記録しない）
+        Returns:
+            bool: 記録した場合はTrue
+        """
+        def fn(conn):
+            cursor = conn.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, key, value, updated_at) "
+                "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE id = ?)",
+                (job_id, key, json.dumps(value, ensure_ascii=False), time.time(), job_id),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(fn)
+
+    def result(self, job_id, key):
+        """record_result()で記録した結果（なければNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM job_results WHERE job_id = ? AND key = ?", (job_id, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def state(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def dead_letters(self):
+        """デッドレターになったジョブの (ID, ペイロード, 最後のエラー) のリスト"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, last_error FROM jobs WHERE state = 'dead' ORDER BY updated_at"
+            ).fetchall()
+        return [(job_id, json.loads(payload), error) for job_id, payload, error in rows]
+
+    def counts(self):
+        """状態ごとのジョブ数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobWorkerPool:
+    """ジョブキューからジョブをリースして処理するワーカースレッド群"""
+
+    def __init__(self, queue, handler, workers=2, visibility_timeout=300, poll_interval=1.0,
+                 retry_delay=30, on_dead=None):
+        """
+        Args:
+            queue: JobQueue
+            handler: ジョブを処理する関数（例外を送出すると失敗扱い）
+            workers: ワーカースレッド数
+            visibility_timeout: リースの有効期間（秒）。これを超えると他のワーカーが再実行する
+            poll_interval: ジョブがないときの待ち時間（秒）
+            retry_delay: 失敗したジョブを再実行するまでの基準秒数（試行回数に応じて延ばす）
+            on_dead: デッドレターに移したときに呼ぶ関数 (job, error)
+        """
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.on_dead = on_dead
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            worker_id = f"{socket.gethostname()}-{os.getpid()}-{i}"
+            thread = threading.Thread(target=self._run, args=(worker_id,), name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.lease(worker_id, self.visibility_timeout)
+            except Exception as e:
+                logger.error(f"ジョブの取得に失敗しました: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            try:
+                self.handler(job)
+            except Exception as e:
+                logger.exception(f"ジョブの実行に失敗しました: {job.id}（{job.attempts}回目）")
+                dead = self.queue.fail(job.id, worker_id, e, self.retry_delay * job.attempts)
+                if dead:
+                    logger.error(f"ジョブをデッドレターに移しました: {job.id}")
+                    if self.on_dead is not None:
+                        self.on_dead(job, e)
+                continue
+            self.queue.complete(job.id, worker_id)
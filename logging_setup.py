@@ -0,0 +1,186 @@
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# ログに付けるレビューのrequest_id（スレッド・タスクごと）
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# 何も指定しない場合のモジュールごとのレベル（通信のたびにログを出すライブラリは抑える）
+DEFAULT_LEVELS = {
+    "slack_bolt": "WARNING",
+    "slack_sdk": "WARNING",
+    "urllib3": "WARNING",
+    "asyncio": "WARNING",
+    "werkzeug": "WARNING",
+}
+
+
+@contextmanager
+def log_context(request_id):
+    """with内で出力したログにrequest_idを付ける"""
+    token = request_id_var.set(request_id)
+    try:
+        yield
+    finally:
+        request_id_var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """ログを出力したスレッドのrequest_idをレコードに付ける（キューに入れる前に呼ばれる）"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    同じ場所から大量に出力されるログを間引く
+    ログを出力した行ごとに、interval秒あたりburst件を超えたINFO以下のログを捨てる
+    捨てた件数は次に出力したログのsuppressedに記録する
+    """
+
+    def __init__(self, burst=20, interval=10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # (ロガー名, ファイル, 行) -> [区間の開始時刻, 件数, 捨てた件数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """キューが満杯の場合は待たずにログを捨てる（捨てた件数はdroppedに数える）"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 別スレッドで整形できるように、メッセージと例外を文字列にしてから渡す
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSONで出力する"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """開発用の読みやすい形式（request_idがあれば付ける）"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            text += f" [request_id={request_id}]"
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            text += f" [{suppressed}件のログを省略]"
+        return text
+
+
+def parse_levels(spec):
+    """
+    "slack_bolt=WARNING,review_store=DEBUG" の形式をモジュール名 -> レベルの辞書にする
+    """
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level="INFO", fmt="json", levels=None, rate_limit=20, queue_size=10000, stream=None):
+    """
+    ルートロガーにキュー経由のハンドラを設定する
+    ログを出力するスレッドはキューに入れるだけで、書き込みはバックグラウンドのスレッドが行う
+    Args:
+        level: ルートロガーのレベル
+        fmt: "json" または "text"
+        levels: モジュール名 -> レベル（DEFAULT_LEVELSを上書きする）
+        rate_limit: 同じ行から10秒あたりに出力するINFO以下のログの上限（0なら間引かない）
+        queue_size: 書き込み待ちのログの上限（超えた分は捨てる）
+        stream: 書き込み先（省略すると標準エラー出力）
+    Returns:
+        QueueListener: 終了時にstop()して残りのログを書き込むこと
+    """
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    if rate_limit > 0:
+        queue_handler.addFilter(RateLimitFilter(burst=rate_limit))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    for name, module_level in {**DEFAULT_LEVELS, **(levels or {})}.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
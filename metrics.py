@@ -0,0 +1,225 @@
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("trace")
+
+# METRICS_ENABLED=false の場合は各メトリクスの記録がすぐに返るだけになる
+ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+# TRACING_ENABLED=true の場合はレビューごとの処理の区間（スパン）をログに出力する
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labelnames, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labelnames, values)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    """増える一方の値（呼び出し回数など）"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("_total", self.labelnames, key, value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    増減する値
+    set_function()で関数を設定すると、/metricsを読み込んだときにその値を使う（キューの長さなど）
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value, **labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """
+        Args:
+            function: 値を返す関数（ラベルがある場合は ラベル値のタプル -> 値 の辞書を返す）
+        """
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logger.error(f"メトリクス {self.name} の取得に失敗しました: {e}")
+                return []
+            items = value.items() if self.labelnames else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [("", self.labelnames, key, value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """値の分布（処理時間など）"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # ラベル値 -> [バケットごとの件数..., 合計, 件数]
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with内の処理時間を記録する"""
+        if not ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        labelnames = self.labelnames + ("le",)
+        samples = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", labelnames, key + (bound,), cumulative))
+            samples.append(("_bucket", labelnames, key + ("+Inf",), counts[-1]))
+            samples.append(("_sum", self.labelnames, key, counts[-2]))
+            samples.append(("_count", self.labelnames, key, counts[-1]))
+        return samples
+
+
+def timed(histogram, **labels):
+    """関数の処理時間をhistogramに記録するデコレータ"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    """Prometheusのテキスト形式で全メトリクスを出力する"""
+    with _lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(name, trace_id, **attributes):
+    """
+    処理の区間をトレースとしてログに出力する
+    trace_idにはレビューのrequest_idを渡し、申請から投稿までを1つのトレースとして追えるようにする
+    """
+    if not TRACING_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        attrs = " ".join(f"{key}={value}" for key, value in attributes.items())
+        status = f"error={type(error).__name__}" if error is not None else "ok"
+        trace_logger.info(f"trace={trace_id} span={name} duration_ms={duration_ms:.1f} {status} {attrs}".rstrip())
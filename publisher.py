@@ -0,0 +1,271 @@
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from slack_outbox import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SNS_PUBLISH_SECONDS = metrics.Histogram(
+    "sns_publish_seconds", "SNSへの投稿1回にかかった時間", ["sns", "status"]
+)
+SNS_PUBLISH_RESULTS = metrics.Counter(
+    "sns_publish_results", "アカウントごとの投稿結果（再試行後）", ["sns", "status"]
+)
+
+PublishResult = namedtuple("PublishResult", ["sns", "account", "success", "post_id", "error", "attempts"])
+
+# SNSごとの（同時投稿数, 1秒あたりの投稿数, バースト数）
+DEFAULT_PLATFORM_LIMITS = (2, 1.0, 3)
+
+
+class PublishError(Exception):
+    """SNSへの投稿に失敗した（retryable=Trueなら再試行してよい）"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SnsAdapter:
+    """SNSごとの投稿処理"""
+
+    def publish(self, account, text, image_paths, idempotency_key):
+        """
+        投稿する
+        同じidempotency_keyで再度呼ばれた場合は、二重に投稿しないようにすること
+        Returns:
+            str: 投稿のID
+        Raises:
+            PublishError: 投稿に失敗した場合
+        """
+        raise NotImplementedError
+
+
+class LoggingAdapter(SnsAdapter):
+    """ログを出力するだけの仮の実装"""
+
+    def publish(self, account, text, image_paths, idempotency_key):
+        logger.info(f"{account}アカウントに投稿しています...（仮の実装のためログ出力のみ）")
+        if image_paths:
+            logger.info(f"画像あり投稿: {len(image_paths)}枚")
+        return idempotency_key
+
+
+class HttpAdapter(SnsAdapter):
+    """
+    投稿APIのエンドポイントにJSONをPOSTする
+    Idempotency-Keyヘッダーを付けるので、対応しているサーバーなら再送しても二重投稿にならない
+    """
+
+    def __init__(self, endpoint, timeout=10.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def publish(self, account, text, image_paths, idempotency_key):
+        body = json.dumps({"account": account, "text": text, "images": image_paths}, ensure_ascii=False).encode()
+        req = urllib.request.Request(
+            self.endpoint,
+            data=body,
+            method="POST",
+            headers={"Content-Type": "application/json", "Idempotency-Key": idempotency_key},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return json.loads(response.read() or b"{}").get("id", idempotency_key)
+        except urllib.error.HTTPError as e:
+            # 429と5xxは再試行する
+            raise PublishError(f"HTTP {e.code}", retryable=e.code == 429 or e.code >= 500)
+        except (urllib.error.URLError, TimeoutError) as e:
+            raise PublishError(str(e), retryable=True)
+
+
+class MemoryCompletionLog:
+    """
+    成功した投稿をプロセスのメモリに記録する（件数に上限があり、古いものから忘れる）
+    永続化しないので、再起動をまたいだ二重投稿は防げない
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def result(self, idempotency_key, key):
+        with self._lock:
+            return self._entries.get((idempotency_key, key))
+
+    def record_result(self, idempotency_key, key, post_id):
+        with self._lock:
+            self._entries[(idempotency_key, key)] = post_id
+            self._entries.move_to_end((idempotency_key, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return True
+
+
+class Publisher:
+    """
+    複数のSNSアカウントへの投稿をワーカープールで並行して行う
+    - SNSごとに同時投稿数と投稿レートを制限する
+    - 失敗時はジッター付きの指数バックオフで再試行する
+    - 成功した投稿はidempotency keyとアカウントごとに記録し、再試行や再実行で二重投稿しない
+    """
+
+    def __init__(self, max_workers=8, max_retries=3, base_delay=0.5, max_delay=30.0, limits=None,
+                 completions=None):
+        """
+        Args:
+            max_workers: 投稿に使うスレッド数
+            max_retries: 1アカウントあたりの最大再試行回数
+            base_delay: バックオフの基準秒数
+            max_delay: バックオフの最大秒数
+            limits: SNS名 -> (同時投稿数, 1秒あたりの投稿数, バースト数)
+            completions: 成功した投稿の記録先（result(idempotency_key, key)とrecord_result(idempotency_key, key, 投稿ID)を持つもの。
+                         JobQueueを渡すとジョブごとに永続化する。省略するとメモリに記録する）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limits = dict(limits or {})
+        self._adapters = {}
+        self._default_adapter = LoggingAdapter()
+        self._semaphores = {}
+        self._buckets = {}
+        self._completions = completions if completions is not None else MemoryCompletionLog()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="publisher")
+        # publish_async用（投稿の完了待ちで上のワーカーを埋めないように分ける）
+        self._coordinator = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="publisher-job")
+
+    def register_adapter(self, sns, adapter):
+        self._adapters[sns] = adapter
+
+    def unregister_adapter(self, sns):
+        """SNSのアダプタを外す（以降はログ出力のみの仮の実装で投稿する）"""
+        self._adapters.pop(sns, None)
+
+    def adapters(self):
+        """SNS名 -> 登録済みのアダプタ"""
+        return dict(self._adapters)
+
+    def set_limits(self, sns, concurrency, rate, burst):
+        with self._lock:
+            if self._limits.get(sns) == (concurrency, rate, burst):
+                return
+            self._limits[sns] = (concurrency, rate, burst)
+            self._semaphores.pop(sns, None)
+            self._buckets.pop(sns, None)
+
+    def clear_limits(self, sns):
+        """SNSの投稿制限を外して既定値に戻す"""
+        with self._lock:
+            if self._limits.pop(sns, None) is None:
+                return
+            self._semaphores.pop(sns, None)
+            self._buckets.pop(sns, None)
+
+    def limits(self):
+        """SNS名 -> 設定済みの (同時投稿数, 1秒あたりの投稿数, バースト数)"""
+        with self._lock:
+            return dict(self._limits)
+
+    def _platform(self, sns):
+        with self._lock:
+            if sns not in self._semaphores:
+                concurrency, rate, burst = self._limits.get(sns, DEFAULT_PLATFORM_LIMITS)
+                self._semaphores[sns] = threading.BoundedSemaphore(concurrency)
+                self._buckets[sns] = TokenBucket(rate, burst)
+            return self._semaphores[sns], self._buckets[sns]
+
+    def _backoff(self, attempt):
+        # フルジッター: 0〜base*2^attemptの間でランダムに待つ
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _publish_one(self, sns, account, text, image_paths, idempotency_key):
+        target = f"{sns}:{account}"
+        key = f"{idempotency_key}:{target}"
+        post_id = self._completions.result(idempotency_key, target)
+        if post_id is not None:
+            return PublishResult(sns, account, True, post_id, None, 0)
+
+        adapter = self._adapters.get(sns, self._default_adapter)
+        semaphore, bucket = self._platform(sns)
+        error = None
+        attempt = 0
+        while attempt <= self.max_retries:
+            attempt += 1
+            wait = bucket.reserve()
+            while wait > 0:
+                time.sleep(wait)
+                wait = bucket.reserve()
+            start = time.perf_counter()
+            try:
+                with semaphore, metrics.span("sns.publish", idempotency_key, sns=sns, account=account, attempt=attempt):
+                    post_id = adapter.publish(account, text, image_paths, key)
+            except PublishError as e:
+                SNS_PUBLISH_SECONDS.observe(time.perf_counter() - start, sns=sns, status="error")
+                error = e
+                logger.warning(f"{sns}の{account}への投稿に失敗しました（{attempt}回目）: {e}")
+                if not e.retryable:
+                    break
+                if attempt <= self.max_retries:
+                    time.sleep(self._backoff(attempt))
+                continue
+            except Exception as e:
+                SNS_PUBLISH_SECONDS.observe(time.perf_counter() - start, sns=sns, status="error")
+                error = e
+                logger.exception(f"{sns}の{account}への投稿中にエラーが発生しました: {e}")
+                break
+            SNS_PUBLISH_SECONDS.observe(time.perf_counter() - start, sns=sns, status="ok")
+            SNS_PUBLISH_RESULTS.inc(sns=sns, status="ok")
+            try:
+                self._completions.record_result(idempotency_key, target, post_id)
+            except Exception as e:
+                # 投稿はできているので成功として返す（再実行時はアダプタのidempotency keyで二重投稿を防ぐ）
+                logger.error(f"{sns}の{account}への投稿結果を記録できませんでした: {e}")
+            return PublishResult(sns, account, True, post_id, None, attempt)
+        SNS_PUBLISH_RESULTS.inc(sns=sns, status="failed")
+        return PublishResult(sns, account, False, None, str(error), attempt)
+
+    def publish(self, targets, text, image_paths, idempotency_key):
+        """
+        複数のアカウントに並行して投稿し、すべて終わるまで待つ
+        Args:
+            targets: (SNS名, アカウント名) のリスト
+            text: 投稿テキスト
+            image_paths: 画像パスのリスト
+            idempotency_key: 投稿を識別するキー（レビューのrequest_idなど）
+        Returns:
+            list: PublishResultのリスト（targetsと同じ順番）
+        """
+        # ログのrequest_idなどを投稿スレッドに引き継ぐ
+        futures = [
+            self._executor.submit(
+                contextvars.copy_context().run, self._publish_one, sns, account, text, image_paths, idempotency_key
+            )
+            for sns, account in targets
+        ]
+        return [future.result() for future in futures]
+
+    def publish_async(self, targets, text, image_paths, idempotency_key):
+        """
+        publish()をバックグラウンドで実行する
+        Returns:
+            Future: PublishResultのリストが設定される
+        """
+        return self._coordinator.submit(
+            contextvars.copy_context().run, self.publish, targets, text, image_paths, idempotency_key
+        )
+
+    def shutdown(self):
+        self._coordinator.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
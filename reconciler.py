@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from slack_sdk.errors import SlackApiError
+
+from slack_outbox import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# メッセージやチャンネルが削除されている（レビューの状態はそのままにする）
+MISSING_MESSAGE_ERRORS = frozenset({"message_not_found", "channel_not_found", "not_in_channel", "is_archived"})
+
+
+class ReconcileStopped(Exception):
+    """stop()で突き合わせが打ち切られた"""
+
+
+class ReactionReconciler:
+    """
+    保存しているレビューの承認状況を、Slackのメッセージに付いている現在のリアクションと突き合わせる
+    ボットが停止している間に付け外しされたリアクションはイベントが届かないので、起動時にまとめて取得して反映する
+    reactions.getは同時に実行する数を制限し、トークンバケットで呼び出し間隔を調整する（429ではRetry-Afterに従う）
+    待っている間にstop()されたらすぐに打ち切る（Slackに接続できないときも終了を待たせない）
+    """
+
+    def __init__(self, client_getter, get, apply, concurrency=4, rate=0.8, burst=5, max_retries=5,
+                 max_refetch=3):
+        """
+        Args:
+            client_getter: Slack WebClientを返す関数
+            get: request_id -> レビュー（削除済みならNone）を返す関数
+            apply: (レビュー, リアクション名 -> ユーザーIDのリスト, 取得前のversion) を受け取って反映する関数
+                   結果（"approved", "rejected", "updated", "unchanged", "closed", "stale"）を返す
+                   取得中にレビューが変更されていた場合は "stale" を返すと取得し直す
+            concurrency: 同時に実行するreactions.getの数
+            rate: 1秒あたりのreactions.getの回数（SlackのTier 3は1分あたり50回程度）
+            burst: バースト数
+            max_retries: レート制限やエラーで再試行する回数
+            max_refetch: 取得中にレビューが変更されていた場合に取得し直す回数
+        """
+        self.client_getter = client_getter
+        self.get = get
+        self.apply = apply
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.max_refetch = max_refetch
+        self._bucket = TokenBucket(rate, burst)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rate_limited = 0
+        self.last_stats = None
+
+    def set_rate_limit(self, rate, burst):
+        """reactions.getの呼び出しレートを変更する"""
+        self._bucket = TokenBucket(rate, burst)
+
+    def _sleep(self, seconds):
+        if self._stop.wait(seconds):
+            raise ReconcileStopped()
+
+    def fetch(self, channel, ts):
+        """
+        メッセージに付いているリアクションを取得する
+        Returns:
+            dict: リアクション名 -> ユーザーIDのリスト（メッセージが削除されている場合はNone）
+        Raises:
+            ReconcileStopped: 待っている間にstop()された場合
+        """
+        attempts = 0
+        while True:
+            if self._stop.is_set():
+                raise ReconcileStopped()
+            wait = self._bucket.reserve()
+            while wait > 0:
+                self._sleep(wait)
+                wait = self._bucket.reserve()
+
+            attempts += 1
+            try:
+                response = self.client_getter().reactions_get(channel=channel, timestamp=ts, full=True)
+            except SlackApiError as e:
+                if e.response.get("error") in MISSING_MESSAGE_ERRORS:
+                    return None
+                if getattr(e.response, "status_code", None) == 429 and attempts <= self.max_retries:
+                    retry_after = retry_after_seconds(e.response)
+                    logger.warning(f"Slackのレート制限に達しました: reactions_get（{retry_after}秒後に再試行）")
+                    with self._lock:
+                        self.rate_limited += 1
+                    self._bucket.pause(retry_after)
+                    continue
+                raise
+            except Exception as e:
+                if attempts <= self.max_retries:
+                    logger.warning(f"リアクションの取得に失敗しました: {channel} {ts}: {e}（再試行します）")
+                    self._bucket.pause(min(2 ** attempts, 30))
+                    continue
+                raise
+            message = response.get("message") or {}
+            return {reaction["name"]: list(reaction.get("users", ())) for reaction in message.get("reactions", ())}
+
+    def reconcile(self, request_id):
+        """
+        1件のレビューを突き合わせる
+        Returns:
+            str: applyの結果（メッセージが削除されていた場合は "missing"）
+        """
+        result = "stale"
+        for _ in range(self.max_refetch + 1):
+            review = self.get(request_id)
+            if review is None or not review.ts:
+                return "closed"
+            version = review.version
+            reactions = self.fetch(review.channel, review.ts)
+            if reactions is None:
+                return "missing"
+            result = self.apply(review, reactions, version)
+            if result != "stale":
+                return result
+        return result
+
+    def run(self, reviews):
+        """
+        メッセージを投稿済みのレビューをまとめて突き合わせる
+        Args:
+            reviews: レビューのリスト
+        Returns:
+            dict: 結果ごとの件数と、かかった秒数・レート制限の回数
+        """
+        request_ids = [review.request_id for review in reviews if review.ts]
+        counts = Counter()
+        rate_limited_before = self.rate_limited
+        start = time.monotonic()
+
+        pending = iter(request_ids)
+
+        def task(request_id):
+            if self._stop.is_set():
+                result = "skipped"
+            else:
+                try:
+                    result = self.reconcile(request_id)
+                except ReconcileStopped:
+                    result = "skipped"
+                except Exception as e:
+                    logger.error(f"レビューの突き合わせに失敗しました: {request_id}: {e}")
+                    result = "failed"
+            with self._lock:
+                counts[result] += 1
+
+        def work():
+            while True:
+                with self._lock:
+                    request_id = next(pending, None)
+                if request_id is None:
+                    return
+                task(request_id)
+
+        # ThreadPoolExecutorのスレッドはプロセスの終了時に残りのタスクを待つので、デーモンスレッドで実行する
+        workers = [
+            threading.Thread(target=work, name=f"reconcile-{i}", daemon=True)
+            for i in range(max(1, min(self.concurrency, len(request_ids))))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        stats = dict(counts)
+        stats["checked"] = len(request_ids)
+        stats["seconds"] = time.monotonic() - start
+        stats["rate_limited"] = self.rate_limited - rate_limited_before
+        self.last_stats = stats
+        changed = sum(counts[key] for key in ("approved", "rejected", "updated"))
+        logger.info(
+            f"Slackのリアクションと突き合わせました: {len(request_ids)}件中 {changed}件を更新"
+            f"（承認 {counts['approved']}件、リジェクト {counts['rejected']}件、"
+            f"メッセージなし {counts['missing']}件、失敗 {counts['failed']}件、打ち切り {counts['skipped']}件、"
+            f"{stats['seconds']:.1f}秒）"
+        )
+        return stats
+
+    def start(self, load):
+        """
+        バックグラウンドのスレッドで1回だけ突き合わせる（起動を待たせない）
+        Args:
+            load: 保存済みのレビューを返す関数
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            try:
+                self.run(load())
+            except Exception as e:
+                logger.error(f"Slackのリアクションとの突き合わせに失敗しました: {e}")
+
+        self._thread = threading.Thread(target=run, name="reaction-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """実行中の突き合わせを打ち切る（取得済みのものは反映する）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"REVCOL1\n"
+
+# 列名と種類
+#   int: 64ビット整数（array("q")）
+#   dict: 辞書符号化した文字列（同じ値が多い列。値の一覧と32ビットの番号）
+#   str: 文字列（UTF-8を連結したものと32ビットのオフセット）
+COLUMNS = (
+    ("request_id", "str"),
+    ("author", "dict"),
+    ("sns", "dict"),
+    ("account", "dict"),
+    ("channel", "dict"),
+    ("status", "dict"),
+    ("approvers", "dict"),
+    ("rejecters", "dict"),
+    ("ts", "str"),
+    ("text", "str"),
+    ("images", "int"),
+    ("created_at", "int"),
+    ("publish_at", "int"),
+    ("closed_at", "int"),
+)
+
+
+class _Columns:
+    """行を列ごとの配列に追加していくバッファ"""
+
+    def __init__(self):
+        self.rows = 0
+        self.ints = {name: array("q") for name, kind in COLUMNS if kind == "int"}
+        self.codes = {name: array("I") for name, kind in COLUMNS if kind == "dict"}
+        self.dictionaries = {name: {} for name, kind in COLUMNS if kind == "dict"}  # 値 -> 番号
+        self.strings = {name: bytearray() for name, kind in COLUMNS if kind == "str"}
+        self.offsets = {name: array("I", [0]) for name, kind in COLUMNS if kind == "str"}
+
+    def append(self, row):
+        for name, kind in COLUMNS:
+            value = row[name]
+            if kind == "int":
+                self.ints[name].append(int(value or 0))
+            elif kind == "dict":
+                dictionary = self.dictionaries[name]
+                code = dictionary.get(value)
+                if code is None:
+                    code = dictionary[value] = len(dictionary)
+                self.codes[name].append(code)
+            else:
+                self.strings[name] += (value or "").encode()
+                self.offsets[name].append(len(self.strings[name]))
+        self.rows += 1
+
+    def encode(self):
+        """
+        1つのセグメントファイルの内容にする
+        MAGIC, ヘッダーの長さ（4バイト）, ヘッダー（JSON）, 列ごとのバイト列 の順に並べる
+        """
+        header = {"rows": self.rows, "columns": []}
+        blobs = []
+        for name, kind in COLUMNS:
+            column = {"name": name, "type": kind}
+            if kind == "int":
+                blob = self.ints[name].tobytes()
+            elif kind == "dict":
+                values = sorted(self.dictionaries[name], key=self.dictionaries[name].get)
+                column["dictionary"] = values
+                blob = self.codes[name].tobytes()
+            else:
+                offsets = self.offsets[name]
+                column["offsets_bytes"] = len(offsets) * offsets.itemsize
+                blob = offsets.tobytes() + bytes(self.strings[name])
+            column["bytes"] = len(blob)
+            header["columns"].append(column)
+            blobs.append(blob)
+        header_bytes = json.dumps(header, ensure_ascii=False).encode()
+        return MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(blobs)
+
+    def rows_as_dicts(self):
+        dictionaries = {
+            name: sorted(dictionary, key=dictionary.get) for name, dictionary in self.dictionaries.items()
+        }
+        for i in range(self.rows):
+            row = {}
+            for name, kind in COLUMNS:
+                if kind == "int":
+                    row[name] = self.ints[name][i]
+                elif kind == "dict":
+                    row[name] = dictionaries[name][self.codes[name][i]]
+                else:
+                    offsets = self.offsets[name]
+                    row[name] = self.strings[name][offsets[i]:offsets[i + 1]].decode()
+            yield row
+
+
+def read_segment(path):
+    """
+    セグメントファイルを列ごとに読み込む
+    Returns:
+        dict: 列名 -> 値のリスト
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"アーカイブのファイルではありません: {path}")
+    pos = len(MAGIC)
+    (header_length,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    header = json.loads(data[pos:pos + header_length])
+    pos += header_length
+
+    rows = header["rows"]
+    columns = {}
+    for column in header["columns"]:
+        blob = data[pos:pos + column["bytes"]]
+        pos += column["bytes"]
+        if column["type"] == "int":
+            values = array("q")
+            values.frombytes(blob)
+            columns[column["name"]] = values.tolist()
+        elif column["type"] == "dict":
+            codes = array("I")
+            codes.frombytes(blob)
+            dictionary = column["dictionary"]
+            columns[column["name"]] = [dictionary[code] for code in codes]
+        else:
+            offsets = array("I")
+            offsets.frombytes(blob[:column["offsets_bytes"]])
+            text = blob[column["offsets_bytes"]:]
+            columns[column["name"]] = [text[offsets[i]:offsets[i + 1]].decode() for i in range(rows)]
+    return columns
+
+
+class ReviewArchive:
+    """
+    投稿・リジェクト・期限切れで閉じたレビューを監査用に残す列指向のアーカイブ
+    閉じたレビューはメモリ上の列に追加し、segment_rows件たまるごとにセグメントファイルに書き出す
+    """
+
+    def __init__(self, directory, segment_rows=10000):
+        """
+        Args:
+            directory: セグメントファイルの保存先
+            segment_rows: 1つのセグメントファイルにまとめる行数
+        """
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self._buffer = _Columns()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, review, status, closed_at=None):
+        """
+        閉じたレビューを追加する
+        Args:
+            review: ReviewRequest
+            status: "posted", "rejected", "expired" のいずれか
+            closed_at: 閉じた日時（エポック秒、省略時は現在時刻）
+        """
+        row = {
+            "request_id": review.request_id,
+            "author": review.author,
+            "sns": review.sns,
+            "account": review.account,
+            "channel": review.channel,
+            "status": status,
+            "approvers": ",".join(sorted(review.approvals)),
+            "rejecters": ",".join(sorted(review.rejections)),
+            "ts": review.ts,
+            "text": review.text,
+            "images": len(review.images),
+            "created_at": review.created_ts,
+            "publish_at": review.publish_at,
+            "closed_at": closed_at if closed_at is not None else time.time(),
+        }
+        with self._lock:
+            self._buffer.append(row)
+            if self._buffer.rows >= self.segment_rows:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer.rows:
+            return
+        data = self._buffer.encode()
+        name = f"segment-{time.strftime('%Y%m%d-%H%M%S')}-{time.monotonic_ns() % 1000000:06d}.revcol"
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".segment-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"閉じたレビューをアーカイブに書き出しました: {name}（{self._buffer.rows}件、{len(data)}バイト）")
+        self._buffer = _Columns()
+
+    def flush(self):
+        """メモリ上の行をセグメントファイルに書き出す"""
+        with self._lock:
+            self._flush_locked()
+
+    def segments(self):
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".revcol")
+        )
+
+    def rows(self):
+        """アーカイブのすべての行を古い順に返す（監査用）"""
+        for path in self.segments():
+            columns = read_segment(path)
+            names = list(columns)
+            for values in zip(*(columns[name] for name in names)):
+                yield dict(zip(names, values))
+        with self._lock:
+            pending = list(self._buffer.rows_as_dicts())
+        yield from pending
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,515 @@
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewStore:
+    """
+    レビューリクエストの保存先の共通インターフェース
+    取得したReviewRequestを変更した場合は、必ずput()で書き戻すこと
+    """
+
+    def get(self, request_id):
+        """request_idに対応するレビューを返す（存在しない場合はNone）"""
+        raise NotImplementedError
+
+    def get_by_message(self, channel, ts):
+        """Slackメッセージの(channel, ts)に対応するレビューを返す（存在しない場合はNone）"""
+        raise NotImplementedError
+
+    def find_approved_by_author(self, author):
+        """投稿者の承認済みレビューを作成日時順に返す"""
+        raise NotImplementedError
+
+    def find_unposted(self):
+        """Slackにメッセージを投稿できていない（tsがない）レビューを返す"""
+        raise NotImplementedError
+
+    def put(self, review):
+        """レビューを追加または更新する"""
+        raise NotImplementedError
+
+    def delete(self, request_id):
+        """レビューを削除し、削除したレビューを返す（存在しない場合はNone）"""
+        raise NotImplementedError
+
+    def all(self):
+        """保存されているすべてのレビューを返す"""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def invalidate(self, request_id):
+        """他のプロセスが変更したレビューのキャッシュを破棄する（キャッシュしない場合は何もしない）"""
+
+    def flush(self):
+        """未書き込みの変更を永続化する"""
+
+    def close(self):
+        self.flush()
+
+    def __contains__(self, request_id):
+        return self.get(request_id) is not None
+
+    def __len__(self):
+        return self.count()
+
+
+class ReviewLocks:
+    """
+    request_idごとのロック（ロックストライピング）
+    レビュー数に関係なく固定個のロックを使い回すので、ロック自体の作成・削除は不要
+    同じrequest_idには常に同じロックが割り当てられる
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def lock_for(self, request_id):
+        """request_idに対応するロックを返す（with文で使う）"""
+        return self._locks[zlib.crc32(request_id.encode()) % len(self._locks)]
+
+
+class InMemoryReviewStore(ReviewStore):
+    """プロセス内の辞書にレビューを保持する（再起動で消える）"""
+
+    def __init__(self):
+        self._reviews = {}
+        # (channel, ts) -> request_id の二次インデックス
+        self._by_message = {}
+        # 投稿者 -> 承認済みレビューのrequest_idの集合
+        self._approved_by_author = {}
+        self._lock = threading.Lock()
+
+    def get(self, request_id):
+        return self._reviews.get(request_id)
+
+    def get_by_message(self, channel, ts):
+        with self._lock:
+            request_id = self._by_message.get((channel, ts))
+            if request_id is None:
+                return None
+            return self._reviews.get(request_id)
+
+    def find_approved_by_author(self, author):
+        with self._lock:
+            request_ids = self._approved_by_author.get(author, ())
+            reviews = [self._reviews[request_id] for request_id in request_ids]
+        return sorted(reviews, key=lambda r: r.created_ts)
+
+    def find_unposted(self):
+        with self._lock:
+            return [review for review in self._reviews.values() if not review.ts]
+
+    def _unindex_author(self, request_id, author):
+        # self._lock を取得した状態で呼ぶこと
+        request_ids = self._approved_by_author.get(author)
+        if request_ids is not None:
+            request_ids.discard(request_id)
+            if not request_ids:
+                del self._approved_by_author[author]
+
+    def put(self, review):
+        with self._lock:
+            old = self._reviews.get(review.request_id)
+            if old is not None:
+                if old.ts and (old.channel, old.ts) != (review.channel, review.ts):
+                    self._by_message.pop((old.channel, old.ts), None)
+                self._unindex_author(old.request_id, old.author)
+            self._reviews[review.request_id] = review
+            if review.ts:
+                self._by_message[(review.channel, review.ts)] = review.request_id
+            if review.approved and not review.rejected:
+                self._approved_by_author.setdefault(review.author, set()).add(review.request_id)
+            else:
+                self._unindex_author(review.request_id, review.author)
+
+    def delete(self, request_id):
+        with self._lock:
+            review = self._reviews.pop(request_id, None)
+            if review is not None:
+                if review.ts:
+                    self._by_message.pop((review.channel, review.ts), None)
+                self._unindex_author(request_id, review.author)
+            return review
+
+    def all(self):
+        with self._lock:
+            return list(self._reviews.values())
+
+    def count(self):
+        return len(self._reviews)
+
+
+_DELETED = object()
+
+
+class SQLiteReviewStore(ReviewStore):
+    """
+    SQLite（WALモード）にレビューを保存する
+    書き込みはバッファに溜めて、一定件数または一定時間ごとに1トランザクションでまとめて反映する
+    未反映の変更は読み出し時にバッファから返すため、書き込み直後の読み出しも一貫する
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS reviews (
+        request_id TEXT PRIMARY KEY,
+        author TEXT NOT NULL,
+        channel TEXT NOT NULL,
+        ts TEXT,
+        approved INTEGER NOT NULL DEFAULT 0,
+        rejected INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_reviews_message ON reviews (channel, ts);
+    CREATE INDEX IF NOT EXISTS idx_reviews_author_approved ON reviews (author, approved);
+    CREATE INDEX IF NOT EXISTS idx_reviews_unposted ON reviews (request_id) WHERE ts IS NULL;
+    """
+
+    def __init__(self, path, factory, batch_size=100, flush_interval=0.05):
+        """
+        Args:
+            path: データベースファイルのパス
+            factory: to_dict()の結果からレビューを復元する関数
+            batch_size: この件数の変更が溜まったら即座に書き込む
+            flush_interval: 書き込みスレッドが変更を反映する間隔（秒）
+        """
+        self.path = path
+        self.factory = factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._db_lock = threading.Lock()
+
+        # request_id -> 行データ または _DELETED
+        self._pending = {}
+        # 書き込み中の変更（コミットが終わるまで読み出し対象に含める）
+        self._flushing = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="review-store-writer", daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def _to_row(review):
+        data = review.to_dict()
+        return (
+            review.request_id,
+            review.author,
+            review.channel,
+            review.ts,
+            1 if review.approved else 0,
+            1 if review.rejected else 0,
+            data["created_at"],
+            json.dumps(data, ensure_ascii=False),
+        )
+
+    def _from_row(self, row):
+        return self.factory(json.loads(row[0]))
+
+    def _query(self, sql, params=()):
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _pending_snapshot(self):
+        with self._pending_lock:
+            snapshot = dict(self._flushing)
+            snapshot.update(self._pending)
+            return snapshot
+
+    def get(self, request_id):
+        with self._pending_lock:
+            pending = self._pending.get(request_id, self._flushing.get(request_id))
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            return self.factory(json.loads(pending[7]))
+        rows = self._query("SELECT data FROM reviews WHERE request_id = ?", (request_id,))
+        return self._from_row(rows[0]) if rows else None
+
+    def get_by_message(self, channel, ts):
+        # 読み出し中に書き込みが反映されないように書き込みと排他にする
+        with self._flush_lock:
+            # 未反映の変更を優先して探す
+            pending = self._pending_snapshot()
+            for row in pending.values():
+                if row is not _DELETED and row[2] == channel and row[3] == ts:
+                    return self.factory(json.loads(row[7]))
+            rows = self._query(
+                "SELECT request_id, data FROM reviews WHERE channel = ? AND ts = ?", (channel, ts)
+            )
+            for request_id, data in rows:
+                if request_id not in pending:
+                    return self.factory(json.loads(data))
+            return None
+
+    def find_approved_by_author(self, author):
+        # 読み出し中に書き込みが反映されないように書き込みと排他にする
+        with self._flush_lock:
+            pending = self._pending_snapshot()
+            rows = self._query(
+                "SELECT request_id, data FROM reviews WHERE author = ? AND approved = 1 AND rejected = 0", (author,)
+            )
+            reviews = [self.factory(json.loads(data)) for request_id, data in rows if request_id not in pending]
+            for row in pending.values():
+                if row is not _DELETED and row[1] == author and row[4] and not row[5]:
+                    reviews.append(self.factory(json.loads(row[7])))
+            return sorted(reviews, key=lambda r: r.created_ts)
+
+    def find_unposted(self):
+        # 読み出し中に書き込みが反映されないように書き込みと排他にする
+        with self._flush_lock:
+            pending = self._pending_snapshot()
+            rows = self._query("SELECT request_id, data FROM reviews WHERE ts IS NULL")
+            reviews = [self.factory(json.loads(data)) for request_id, data in rows if request_id not in pending]
+            for row in pending.values():
+                if row is not _DELETED and not row[3]:
+                    reviews.append(self.factory(json.loads(row[7])))
+            return reviews
+
+    def put(self, review):
+        row = self._to_row(review)
+        with self._pending_lock:
+            self._pending[review.request_id] = row
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def delete(self, request_id):
+        review = self.get(request_id)
+        if review is not None:
+            with self._pending_lock:
+                self._pending[request_id] = _DELETED
+            self._wakeup.set()
+        return review
+
+    def all(self):
+        # 読み出し中に書き込みが反映されないように書き込みと排他にする
+        # 件数が多いと復元に時間がかかるので、復元はロックを外してから行う（その間も他の読み書きを待たせない）
+        with self._flush_lock:
+            pending = self._pending_snapshot()
+            rows = self._query("SELECT request_id, data FROM reviews")
+        reviews = [self.factory(json.loads(data)) for request_id, data in rows if request_id not in pending]
+        reviews.extend(self.factory(json.loads(row[7])) for row in pending.values() if row is not _DELETED)
+        return reviews
+
+    def count(self):
+        # 読み出し中に書き込みが反映されないように書き込みと排他にする
+        with self._flush_lock:
+            pending = self._pending_snapshot()
+            total = self._query("SELECT COUNT(*) FROM reviews")[0][0]
+            if pending:
+                placeholders = ",".join("?" * len(pending))
+                total -= self._query(
+                    f"SELECT COUNT(*) FROM reviews WHERE request_id IN ({placeholders})", tuple(pending)
+                )[0][0]
+                total += sum(1 for row in pending.values() if row is not _DELETED)
+            return total
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        with self._pending_lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = {}
+            self._flushing = batch
+        upserts = [row for row in batch.values() if row is not _DELETED]
+        deletes = [(request_id,) for request_id, row in batch.items() if row is _DELETED]
+        try:
+            with self._db_lock:
+                self._conn.execute("BEGIN")
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO reviews "
+                        "(request_id, author, channel, ts, approved, rejected, created_at, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        upserts,
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM reviews WHERE request_id = ?", deletes)
+                self._conn.execute("COMMIT")
+            with self._pending_lock:
+                self._flushing = {}
+        except Exception as e:
+            logger.error(f"レビューの書き込みに失敗しました: {e}")
+            with self._db_lock:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+            # 失敗した変更はより新しい変更を上書きしないように戻す
+            with self._pending_lock:
+                for request_id, row in batch.items():
+                    self._pending.setdefault(request_id, row)
+                self._flushing = {}
+            raise
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # エラーはflush()でログ出力済み。次の周期で再試行する
+                pass
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+class CachedReviewStore(ReviewStore):
+    """
+    よく使われるReviewRequestをLRUで保持するライトスルーキャッシュ
+    キャッシュ上のオブジェクトをそのまま返すので、変更後にput()すれば同じオブジェクトが保存される
+    """
+
+    def __init__(self, backend, capacity=1024, on_change=None):
+        """
+        Args:
+            backend: 実際の保存先
+            capacity: キャッシュする件数
+            on_change: put()・delete()のあとに呼ぶ関数 (request_id)。他のプロセスへの変更の通知に使う
+        """
+        self.backend = backend
+        self.capacity = capacity
+        self.on_change = on_change
+        self._cache = OrderedDict()
+        # キャッシュ内レビューの (channel, ts) -> request_id
+        self._by_message = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, review):
+        with self._lock:
+            old = self._cache.pop(review.request_id, None)
+            if old is not None and old.ts:
+                self._by_message.pop((old.channel, old.ts), None)
+            self._cache[review.request_id] = review
+            if review.ts:
+                self._by_message[(review.channel, review.ts)] = review.request_id
+            while len(self._cache) > self.capacity:
+                _, evicted = self._cache.popitem(last=False)
+                if evicted.ts:
+                    self._by_message.pop((evicted.channel, evicted.ts), None)
+
+    def _forget(self, request_id):
+        with self._lock:
+            review = self._cache.pop(request_id, None)
+            if review is not None and review.ts:
+                self._by_message.pop((review.channel, review.ts), None)
+
+    def get(self, request_id):
+        with self._lock:
+            review = self._cache.get(request_id)
+            if review is not None:
+                self._cache.move_to_end(request_id)
+                self.hits += 1
+                return review
+            self.misses += 1
+        review = self.backend.get(request_id)
+        if review is not None:
+            self._remember(review)
+        return review
+
+    def get_by_message(self, channel, ts):
+        with self._lock:
+            request_id = self._by_message.get((channel, ts))
+        if request_id is not None:
+            return self.get(request_id)
+        with self._lock:
+            self.misses += 1
+        review = self.backend.get_by_message(channel, ts)
+        if review is not None:
+            self._remember(review)
+        return review
+
+    def find_approved_by_author(self, author):
+        reviews = []
+        for review in self.backend.find_approved_by_author(author):
+            # キャッシュ済みのオブジェクトがあればそちらを返す
+            with self._lock:
+                cached = self._cache.get(review.request_id)
+            reviews.append(cached if cached is not None else review)
+        return reviews
+
+    def find_unposted(self):
+        return self.backend.find_unposted()
+
+    def put(self, review):
+        self.backend.put(review)
+        self._remember(review)
+        if self.on_change is not None:
+            self.on_change(review.request_id)
+
+    def delete(self, request_id):
+        with self._lock:
+            cached = self._cache.get(request_id)
+        self._forget(request_id)
+        review = self.backend.delete(request_id)
+        if review is None:
+            return None
+        if self.on_change is not None:
+            self.on_change(request_id)
+        return review if cached is None else cached
+
+    def invalidate(self, request_id):
+        self._forget(request_id)
+
+    def all(self):
+        return self.backend.all()
+
+    def count(self):
+        return self.backend.count()
+
+    def flush(self):
+        self.backend.flush()
+
+    def close(self):
+        self.backend.close()
+
+
+def create_review_store(backend, factory, path=None, cache_size=1024, on_change=None):
+    """
+    設定に応じてレビューストアを作成する
+    Args:
+        backend: "memory" または "sqlite"
+        factory: to_dict()の結果からレビューを復元する関数
+        path: SQLiteのデータベースファイルのパス
+        cache_size: LRUキャッシュの件数（0でキャッシュなし）
+        on_change: 変更のたびに呼ぶ関数 (request_id)。複数のプロセスで共有する場合に使う（sqliteのみ）
+    Returns:
+        ReviewStore: 作成したストア
+    """
+    if backend == "memory":
+        if on_change is not None:
+            raise ValueError("memoryのレビューストアは複数のプロセスで共有できません")
+        # 全件をメモリに保持するのでキャッシュは不要
+        return InMemoryReviewStore()
+    if backend == "sqlite":
+        store = SQLiteReviewStore(path, factory)
+        if cache_size > 0 or on_change is not None:
+            store = CachedReviewStore(store, capacity=max(cache_size, 0), on_change=on_change)
+        return store
+    raise ValueError(f"不明なレビューストアです: {backend}")
@@ -0,0 +1,178 @@
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewSweeper:
+    """
+    期限を過ぎたレビューを削除するバックグラウンドの掃除役
+    期限順のヒープで管理するので、1回の掃除では期限を過ぎたものだけを見る（全件は走査しない）
+    承認などで期限が変わった場合はtrack()し直す（古いヒープの要素は取り出したときに捨てる）
+    """
+
+    def __init__(self, store, deadline, expire, interval=300, housekeeping=None, housekeeping_interval=3600,
+                 active=None, load=None, retry=None):
+        """
+        Args:
+            store: レビューの保存先（get()を使う）
+            deadline: レビュー -> 期限（エポック秒、期限なしならNone）を返す関数
+            expire: 期限切れのレビューを削除する関数。削除したバイト数を返す（いま削除できない場合はNone）
+            interval: 掃除の間隔（秒）
+            housekeeping: 一定間隔で呼ぶ関数（孤立した画像の削除など）。削除した (件数, バイト数) を返す
+            housekeeping_interval: housekeepingを呼ぶ間隔（秒）
+            active: 掃除を行うかどうかを返す関数（複数のプロセスのうち1つだけで掃除する場合に使う）
+            load: 保存済みのレビューを返す関数。start()したスレッドで呼んで期限を登録する（起動を待たせない）
+            retry: 送れなかったメッセージを送り直す関数。掃除のたびに呼ぶ（activeでないプロセスでも呼ぶ）
+        """
+        self.store = store
+        self.deadline = deadline
+        self.expire = expire
+        self.interval = interval
+        self.housekeeping = housekeeping
+        self.housekeeping_interval = housekeeping_interval
+        self.active = active
+        self.load = load
+        self.retry = retry
+        self._heap = []  # (期限, request_id)
+        self._deadlines = {}  # request_id -> ヒープに入っている最新の期限
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_housekeeping = time.monotonic()
+        self._stats = {"expired": 0, "expired_bytes": 0, "orphans": 0, "orphan_bytes": 0, "runs": 0}
+
+    def track(self, review):
+        """レビューの期限を登録する（新規作成時や承認で期限が変わったときに呼ぶ）"""
+        deadline = self.deadline(review)
+        with self._lock:
+            if deadline is None:
+                self._deadlines.pop(review.request_id, None)
+                return
+            if self._deadlines.get(review.request_id) == deadline:
+                return
+            self._deadlines[review.request_id] = deadline
+            heapq.heappush(self._heap, (deadline, review.request_id))
+
+    def forget(self, request_id):
+        """投稿・リジェクトで削除したレビューを対象から外す"""
+        with self._lock:
+            self._deadlines.pop(request_id, None)
+
+    def rebuild(self, reviews):
+        """保存済みのレビューから期限を登録し直す（起動時に呼ぶ）"""
+        for review in reviews:
+            self.track(review)
+        logger.info(f"期限の管理対象のレビュー: {len(self._deadlines)}件")
+
+    def _pop_due(self, now):
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, request_id = heapq.heappop(self._heap)
+                if self._deadlines.get(request_id) == deadline:
+                    del self._deadlines[request_id]
+                    return request_id
+        return None
+
+    def sweep(self, now=None):
+        """
+        期限を過ぎたレビューを削除する
+        Returns:
+            tuple: (削除したレビューの件数, 削除した画像のバイト数)
+        """
+        now = time.time() if now is None else now
+        expired = 0
+        reclaimed = 0
+        postponed = []
+        while True:
+            request_id = self._pop_due(now)
+            if request_id is None:
+                break
+            review = self.store.get(request_id)
+            if review is None:
+                continue
+            deadline = self.deadline(review)
+            if deadline is None:
+                continue
+            if deadline > now:
+                # 承認などで期限が延びていた
+                self.track(review)
+                continue
+            try:
+                result = self.expire(review)
+            except Exception as e:
+                logger.exception(f"レビューの期限切れ処理に失敗しました: {request_id}: {e}")
+                result = None
+            if result is None:
+                postponed.append(review)
+                continue
+            expired += 1
+            reclaimed += result
+
+        # 投稿中などでいま削除できなかったものは次の掃除で再確認する
+        for review in postponed:
+            with self._lock:
+                self._deadlines[review.request_id] = now + self.interval
+                heapq.heappush(self._heap, (now + self.interval, review.request_id))
+
+        with self._lock:
+            self._stats["expired"] += expired
+            self._stats["expired_bytes"] += reclaimed
+            self._stats["runs"] += 1
+        if expired:
+            logger.info(f"期限切れのレビューを{expired}件削除しました（画像 {reclaimed}バイト）")
+        return expired, reclaimed
+
+    def run_housekeeping(self):
+        if self.housekeeping is None:
+            return 0, 0
+        count, reclaimed = self.housekeeping()
+        with self._lock:
+            self._stats["orphans"] += count
+            self._stats["orphan_bytes"] += reclaimed
+        if count:
+            logger.info(f"参照されていない画像を{count}件削除しました（{reclaimed}バイト）")
+        return count, reclaimed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked"] = len(self._deadlines)
+            stats["next_deadline"] = self._heap[0][0] if self._heap else None
+        return stats
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="review-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self):
+        if self.load is not None:
+            try:
+                self.rebuild(self.load())
+            except Exception as e:
+                logger.error(f"保存済みのレビューの期限の登録に失敗しました: {e}")
+        while not self._stop.wait(self.interval):
+            if self.retry is not None:
+                try:
+                    self.retry()
+                except Exception as e:
+                    logger.error(f"メッセージの再送に失敗しました: {e}")
+            if self.active is not None and not self.active():
+                continue
+            try:
+                self.sweep()
+                if time.monotonic() - self._last_housekeeping >= self.housekeeping_interval:
+                    self._last_housekeeping = time.monotonic()
+                    self.run_housekeeping()
+            except Exception as e:
+                logger.error(f"レビューの掃除に失敗しました: {e}")
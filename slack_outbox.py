@@ -0,0 +1,375 @@
+import logging
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from slack_sdk.errors import SlackApiError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLACK_API_SECONDS = metrics.Histogram(
+    "slack_api_request_seconds", "Slack Web APIの呼び出しにかかった時間", ["method", "status"]
+)
+SLACK_OUTBOX_DELAY_SECONDS = metrics.Histogram(
+    "slack_outbox_delay_seconds", "アウトボックスに追加してから送信が終わるまでの時間", ["method"]
+)
+
+# メソッドごとの送信レート（1秒あたりの回数, バースト数）
+# SlackのTier制限より少し控えめに設定している
+DEFAULT_RATE_LIMITS = {
+    "chat_postMessage": (1.0, 5),
+    "chat_update": (0.8, 5),
+    "chat_postEphemeral": (1.5, 10),
+}
+DEFAULT_RATE_LIMIT = (1.0, 5)
+
+# 同じ内容で2回呼んでも結果が変わらないメソッド（通信エラーのときは届いたかどうかによらず再送する）
+# chat_postMessageなどは、Slackに届いてから接続が切れた場合に二重投稿になるので、接続できなかった場合だけ再送する
+IDEMPOTENT_METHODS = frozenset({
+    "chat_update",
+    "chat_delete",
+    "reactions_add",
+    "reactions_remove",
+    "reactions_get",
+    "users_info",
+    "users_list",
+    "conversations_info",
+})
+
+
+class OutboxFull(Exception):
+    """送信キューが満杯でリクエストを受け付けられなかった"""
+
+
+def retry_after_seconds(response, default=1.0):
+    """
+    429のレスポンスのRetry-After（秒）を返す
+    ヘッダー名の大文字・小文字は区別しない（値がリストの場合は最初の値を使う）
+    """
+    headers = getattr(response, "headers", None) or {}
+    for name, value in headers.items():
+        if name.lower() != "retry-after":
+            continue
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            break
+    return default
+
+
+def never_sent(error):
+    """
+    通信エラーが、リクエストをSlackに送る前（接続できなかった・名前解決できなかった）に起きたものか
+    urllibのURLErrorは原因をreasonに、それ以外は__cause__や__context__に持つ
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (ConnectionRefusedError, socket.gaierror)):
+            return True
+        reason = getattr(error, "reason", None)
+        error = reason if isinstance(reason, BaseException) else error.__cause__ or error.__context__
+    return False
+
+
+class TokenBucket:
+    """
+    トークンバケットによるレート制限
+    Retry-Afterを受け取った場合はpause()で指定時間まで送信を止める
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """
+        トークンを1つ取得する
+        Returns:
+            float: 取得できるまでに待つべき秒数（0なら取得済み）
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds):
+        """指定秒数のあいだ送信を止め、バケットを空にする"""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+
+class _Call:
+    __slots__ = ("method", "kwargs", "futures", "enqueued_at", "attempts", "key")
+
+    def __init__(self, method, kwargs, key=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.futures = [Future()]
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.key = key
+
+
+class _Lane:
+    """メソッドごとの送信キューと送信スレッド"""
+
+    __slots__ = ("method", "queue", "thread")
+
+    def __init__(self, method, maxsize):
+        self.method = method
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
+
+
+class SlackOutbox:
+    """
+    Slack Web APIの呼び出しをバックグラウンドで送信するアウトボックス
+    - メソッドごとに送信キューと送信スレッドを持ち、同じメソッドの呼び出しは順番に送信する
+      （chat_updateが溜まったり429で止まったりしても、chat_postMessageなど他のメソッドは待たされない）
+    - 同じメッセージ(channel, ts)へのchat_updateは、未送信のものを最新の内容にまとめる
+    - メソッドごとのトークンバケットで送信間隔を調整し、429のRetry-Afterに従って再送する
+    - 通信エラーは、IDEMPOTENT_METHODSのメソッドか、Slackに届いていないことが確かな場合だけ再送する
+    """
+
+    def __init__(self, client_getter, maxsize=1000, rate_limits=None, max_retries=5, put_timeout=5.0):
+        """
+        Args:
+            client_getter: WebClientを返す関数
+            maxsize: メソッドごとの送信キューの最大長
+            rate_limits: メソッド名 -> (1秒あたりの回数, バースト数)
+            max_retries: 429やネットワークエラー時の最大再送回数
+            put_timeout: キューが満杯のときに空きを待つ秒数
+        """
+        self.client_getter = client_getter
+        self.max_retries = max_retries
+        self.put_timeout = put_timeout
+        self.maxsize = maxsize
+        self._lanes = {}  # メソッド名 -> _Lane
+        self._rate_limits = dict(DEFAULT_RATE_LIMITS)
+        self._rate_limits.update(rate_limits or {})
+        self._buckets = {}
+
+        # (channel, ts) -> 未送信のchat_update
+        self._pending_updates = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self._latencies = deque(maxlen=1000)
+
+    def set_rate_limit(self, method, rate, burst):
+        """メソッドの送信レートを変更する"""
+        with self._lock:
+            self._rate_limits[method] = (rate, burst)
+            self._buckets.pop(method, None)
+
+    def _bucket(self, method):
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            rate, capacity = self._rate_limits.get(method, DEFAULT_RATE_LIMIT)
+            bucket = self._buckets.setdefault(method, TokenBucket(rate, capacity))
+        return bucket
+
+    def _lane(self, method):
+        """メソッドの送信キューを返す（なければ作成し、送信スレッドを開始する）"""
+        with self._lock:
+            lane = self._lanes.get(method)
+            if lane is None:
+                lane = self._lanes[method] = _Lane(method, self.maxsize)
+            if lane.thread is None:
+                self._stopping = False
+                lane.thread = threading.Thread(target=self._run, args=(lane,), name=f"slack-outbox-{method}",
+                                               daemon=True)
+                lane.thread.start()
+            return lane
+
+    def stop(self, timeout=10.0):
+        """キューに残っている呼び出しを送信してから停止する"""
+        with self._lock:
+            lanes = [lane for lane in self._lanes.values() if lane.thread is not None]
+            if not lanes:
+                return
+            self._stopping = True
+        deadline = time.monotonic() + timeout
+        for lane in lanes:
+            try:
+                lane.queue.put_nowait(None)
+            except queue.Full:
+                # 満杯なら送信スレッドは待たずに取り出せるので、空になったところで_stoppingを見て終了する
+                pass
+        for lane in lanes:
+            lane.thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            for lane in lanes:
+                lane.thread = None
+
+    def _enqueue(self, call):
+        lane = self._lane(call.method)
+        try:
+            lane.queue.put(call, timeout=self.put_timeout)
+        except queue.Full:
+            raise OutboxFull(f"Slack送信キューが満杯です: {call.method}")
+
+    def call(self, method, **kwargs):
+        """
+        Web APIメソッドの呼び出しをキューに追加する
+        Returns:
+            Future: APIのレスポンスが設定される
+        """
+        call = _Call(method, kwargs)
+        self._enqueue(call)
+        return call.futures[0]
+
+    def update_message(self, channel, ts, **kwargs):
+        """
+        chat_updateをキューに追加する
+        同じメッセージへの未送信の更新があれば、その内容を置き換えて1回の送信にまとめる
+        Returns:
+            Future: APIのレスポンスが設定される
+        """
+        key = (channel, ts)
+        kwargs = dict(kwargs, channel=channel, ts=ts)
+        with self._lock:
+            pending = self._pending_updates.get(key)
+            if pending is not None:
+                pending.kwargs = kwargs
+                future = Future()
+                pending.futures.append(future)
+                self.coalesced += 1
+                return future
+            call = _Call("chat_update", kwargs, key=key)
+            self._pending_updates[key] = call
+        try:
+            self._enqueue(call)
+        except OutboxFull:
+            with self._lock:
+                self._pending_updates.pop(key, None)
+            raise
+        return call.futures[0]
+
+    def _run(self, lane):
+        while True:
+            try:
+                # 停止中はキューが空になったら終了する（満杯で終了の合図を入れられなかった場合）
+                call = lane.queue.get(timeout=0.1 if self._stopping else None)
+            except queue.Empty:
+                return
+            if call is None:
+                if self._stopping:
+                    # 残っている呼び出しを送信してから終了する
+                    while True:
+                        try:
+                            call = lane.queue.get_nowait()
+                        except queue.Empty:
+                            return
+                        if call is not None:
+                            self._process(call)
+                continue
+            self._process(call)
+
+    def _process(self, call):
+        if call.key is not None:
+            # ここから先に届いた更新は次の送信にまわす
+            with self._lock:
+                self._pending_updates.pop(call.key, None)
+        self._dispatch(call)
+
+    def _dispatch(self, call):
+        bucket = self._bucket(call.method)
+        while True:
+            wait = bucket.reserve()
+            while wait > 0:
+                time.sleep(wait)
+                wait = bucket.reserve()
+
+            call.attempts += 1
+            start = time.perf_counter()
+            try:
+                response = getattr(self.client_getter(), call.method)(**call.kwargs)
+            except SlackApiError as e:
+                status = getattr(e.response, "status_code", None)
+                SLACK_API_SECONDS.observe(time.perf_counter() - start, method=call.method, status=status or "error")
+                if status == 429 and call.attempts <= self.max_retries:
+                    retry_after = retry_after_seconds(e.response)
+                    logger.warning(f"Slackのレート制限に達しました: {call.method}（{retry_after}秒後に再送）")
+                    self.rate_limited += 1
+                    self.retried += 1
+                    bucket.pause(retry_after)
+                    continue
+                self._finish(call, error=e)
+                return
+            except Exception as e:
+                SLACK_API_SECONDS.observe(time.perf_counter() - start, method=call.method, status="error")
+                retryable = call.method in IDEMPOTENT_METHODS or never_sent(e)
+                if retryable and call.attempts <= self.max_retries:
+                    logger.warning(f"Slack APIの呼び出しに失敗しました: {call.method}: {e}（再送します）")
+                    self.retried += 1
+                    bucket.pause(min(2 ** call.attempts, 30))
+                    continue
+                self._finish(call, error=e)
+                return
+            SLACK_API_SECONDS.observe(time.perf_counter() - start, method=call.method, status="ok")
+            self._finish(call, response=response)
+            return
+
+    def _finish(self, call, response=None, error=None):
+        self._latencies.append(time.monotonic() - call.enqueued_at)
+        SLACK_OUTBOX_DELAY_SECONDS.observe(self._latencies[-1], method=call.method)
+        if error is not None:
+            self.failed += 1
+            logger.error(f"Slack APIの呼び出しに失敗しました: {call.method}: {error}")
+            for future in call.futures:
+                future.set_exception(error)
+        else:
+            self.sent += 1
+            for future in call.futures:
+                future.set_result(response)
+
+    def stats(self):
+        """キューの状態と送信レイテンシを返す"""
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "queue_depth": sum(lane.queue.qsize() for lane in list(self._lanes.values())),
+            "pending_updates": len(self._pending_updates),
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidAccountConfig(Exception):
+    """sns.jsonの内容が正しくない"""
+
+
+class AccountSnapshot:
+    """
+    ある時点のSNSアカウント設定（読み取り専用）
+    sns.jsonの書式:
+        {"Twitter": ["公式アカウント", "部門アカウント"]}
+    または、SNSごとの投稿制限やアカウントごとの情報を付ける場合:
+        {"Twitter": {
+            "accounts": ["公式アカウント", {"name": "部門アカウント", "credentials": "TWITTER_BUMON_TOKEN"}],
+            "limits": {"concurrency": 2, "rate": 1.0, "burst": 3},
+            "endpoint": "https://..."
+        }}
+    """
+
+    def __init__(self, config, version=0):
+        """
+        Args:
+            config: sns.jsonを読み込んだ辞書
+            version: 設定のバージョン（読み込むたびに増える）
+        Raises:
+            InvalidAccountConfig: 設定が正しくない場合
+        """
+        if not isinstance(config, dict) or not config:
+            raise InvalidAccountConfig("SNSの設定が空、または辞書ではありません")
+
+        self.version = version
+        accounts = {}
+        account_sets = {}
+        metadata = {}
+        limits = {}
+        endpoints = {}
+        for sns, entry in config.items():
+            if isinstance(entry, list):
+                entry = {"accounts": entry}
+            if not isinstance(entry, dict) or not isinstance(entry.get("accounts"), list):
+                raise InvalidAccountConfig(f"{sns}のアカウント一覧がありません")
+
+            names = []
+            for account in entry["accounts"]:
+                if isinstance(account, str):
+                    account = {"name": account}
+                name = account.get("name") if isinstance(account, dict) else None
+                if not isinstance(name, str) or not name:
+                    raise InvalidAccountConfig(f"{sns}のアカウント名が正しくありません: {account!r}")
+                if name in names:
+                    raise InvalidAccountConfig(f"{sns}のアカウント名が重複しています: {name}")
+                names.append(name)
+                metadata[(sns, name)] = MappingProxyType(
+                    {key: value for key, value in account.items() if key != "name"}
+                )
+            accounts[sns] = tuple(names)
+            account_sets[sns] = frozenset(names)
+
+            if "limits" in entry:
+                limit = entry["limits"]
+                try:
+                    limits[sns] = (int(limit["concurrency"]), float(limit["rate"]), int(limit["burst"]))
+                except (KeyError, TypeError, ValueError):
+                    raise InvalidAccountConfig(f"{sns}の投稿制限が正しくありません: {limit!r}")
+                if min(limits[sns]) <= 0:
+                    raise InvalidAccountConfig(f"{sns}の投稿制限は正の値にしてください: {limit!r}")
+            if entry.get("endpoint"):
+                endpoints[sns] = entry["endpoint"]
+
+        self.accounts = MappingProxyType(accounts)  # SNS名 -> アカウント名のタプル（表示順）
+        self._account_sets = account_sets
+        self._metadata = metadata
+        self.limits = MappingProxyType(limits)  # SNS名 -> (同時投稿数, 1秒あたりの投稿数, バースト数)
+        self.endpoints = MappingProxyType(endpoints)  # SNS名 -> 投稿APIのエンドポイント
+
+    def has_sns(self, sns):
+        return sns in self._account_sets
+
+    def has_account(self, sns, account):
+        return account in self._account_sets.get(sns, ())
+
+    def account_info(self, sns, account):
+        """アカウントごとの追加情報（credentialsなど）。未登録のアカウントはNone"""
+        return self._metadata.get((sns, account))
+
+    def form_accounts(self):
+        """フォーム用の SNS名 -> アカウント名のリスト"""
+        return {sns: list(names) for sns, names in self.accounts.items()}
+
+
+class SnsAccountRegistry:
+    """
+    sns.jsonを監視し、変更されたら読み込み直して設定を差し替える
+    読み込んだ設定は検証してから丸ごと差し替えるので、読む側は常に一貫したスナップショットを参照できる
+    不正な内容に変更された場合は直前の設定を使い続ける
+    """
+
+    def __init__(self, path, fallback, poll_interval=5.0, on_change=None, lazy=False):
+        """
+        Args:
+            path: sns.jsonのパス
+            fallback: 起動時にファイルを読み込めなかった場合の設定
+            poll_interval: 更新日時を確認する間隔（秒）
+            on_change: 設定を差し替えたときに呼ぶ関数 (snapshot)
+            lazy: 最初にsnapshotを参照するかstart()するまで読み込まない
+        """
+        self.path = path
+        self.fallback = fallback
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self._signature = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        if not lazy:
+            self._ensure_loaded()
+
+    @property
+    def snapshot(self):
+        """現在の設定（最初に参照したときに読み込む）"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._ensure_loaded()
+        return snapshot
+
+    def _ensure_loaded(self):
+        with self._load_lock:
+            if self._snapshot is None and not self.reload():
+                self._swap(AccountSnapshot(self.fallback))
+            return self._snapshot
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _swap(self, snapshot):
+        self._snapshot = snapshot
+        if self.on_change is not None:
+            try:
+                self.on_change(snapshot)
+            except Exception as e:
+                logger.error(f"SNSアカウント設定の反映に失敗しました: {e}")
+
+    def reload(self):
+        """
+        sns.jsonを読み込んで設定を差し替える
+        Returns:
+            bool: 差し替えた場合はTrue
+        """
+        with self._lock:
+            signature = self._file_signature()
+            self._signature = signature
+            try:
+                with open(self.path, "r") as f:
+                    config = json.load(f)
+                version = self._snapshot.version + 1 if self._snapshot is not None else 0
+                snapshot = AccountSnapshot(config, version)
+            except Exception as e:
+                logger.error(f"SNSアカウント情報の読み込みに失敗しました: {e}")
+                return False
+            self._swap(snapshot)
+        logger.info(f"SNSアカウント情報を読み込みました: {dict(snapshot.accounts)}")
+        return True
+
+    def start(self):
+        """ファイルの変更を確認するスレッドを開始する"""
+        if self._thread is not None:
+            return
+        self._ensure_loaded()
+        self._thread = threading.Thread(target=self._watch, name="sns-accounts", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            signature = self._file_signature()
+            if signature is not None and signature != self._signature:
+                self.reload()
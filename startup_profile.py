@@ -0,0 +1,64 @@
+"""
+起動にかかる時間の計測（python app.py --profile-startup）
+app.pyの最初で読み込み、それ以降のimportと初期化の各段階にかかった時間を記録する
+"""
+import builtins
+import os
+import sys
+import time
+
+ENABLED = "--profile-startup" in sys.argv or os.environ.get("PROFILE_STARTUP", "false").lower() == "true"
+
+_started = time.perf_counter()
+_last_mark = _started
+_phases = []  # (段階の名前, 秒数)
+_imports = {}  # モジュール名 -> (importにかかった秒数, 入れ子の深さ)
+_depth = 0
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        _imports.setdefault(name, (time.perf_counter() - start, _depth))
+
+
+if ENABLED:
+    builtins.__import__ = _timed_import
+
+
+def mark(name):
+    """前回のmark()からこの呼び出しまでを1つの段階として記録する"""
+    global _last_mark
+    if not ENABLED:
+        return
+    now = time.perf_counter()
+    _phases.append((name, now - _last_mark))
+    _last_mark = now
+
+
+def report(file=None, top=15):
+    """importと各段階にかかった時間を出力する"""
+    file = file or sys.stderr
+    builtins.__import__ = _original_import
+    total = time.perf_counter() - _started
+    print("=== 起動時間 ===", file=file)
+    print(f"合計: {total * 1000:.1f}ms", file=file)
+    if _imports:
+        depth = min(depth for seconds, depth in _imports.values())
+        direct = sorted(
+            ((seconds, name) for name, (seconds, d) in _imports.items() if d == depth), reverse=True
+        )
+        print(f"--- import（時間のかかった順に{min(top, len(direct))}件） ---", file=file)
+        for seconds, name in direct[:top]:
+            print(f"{seconds * 1000:8.1f}ms  {name}", file=file)
+    print("--- 初期化 ---", file=file)
+    for name, seconds in _phases:
+        print(f"{seconds * 1000:8.1f}ms  {name}", file=file)
@@ -0,0 +1,98 @@
+import logging
+import signal
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessSupervisor:
+    """
+    子プロセスを起動し、異常終了したら待ち時間を延ばしながら起動し直す
+    stop()ではSIGTERMを送って終了を待ち、時間内に終わらなければ強制終了する
+    """
+
+    def __init__(self, name, argv, env=None, cwd=None, min_backoff=1.0, max_backoff=60.0, stable_after=60.0):
+        """
+        Args:
+            name: ログに表示する名前
+            argv: 起動するコマンド
+            env: 環境変数（省略時は親プロセスと同じ）
+            cwd: 作業ディレクトリ
+            min_backoff: 異常終了してから起動し直すまでの最初の待ち時間（秒）
+            max_backoff: 待ち時間の上限（秒）
+            stable_after: この秒数以上動いていれば、次の異常終了では待ち時間を最初に戻す
+        """
+        self.name = name
+        self.argv = list(argv)
+        self.env = env
+        self.cwd = cwd
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.restarts = 0
+        self._process = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def pid(self):
+        process = self._process
+        return process.pid if process is not None else None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f"supervisor-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            with self._lock:
+                if self._stop.is_set():
+                    return
+                started = time.monotonic()
+                self._process = subprocess.Popen(self.argv, env=self.env, cwd=self.cwd)
+            logger.info(f"{self.name}を起動しました（pid={self._process.pid}）")
+            code = self._process.wait()
+            if self._stop.is_set():
+                return
+            if time.monotonic() - started >= self.stable_after:
+                backoff = self.min_backoff
+            self.restarts += 1
+            logger.error(f"{self.name}が終了しました（終了コード {code}）。{backoff:.0f}秒後に起動し直します")
+            if self._stop.wait(backoff):
+                return
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def signal(self, signum):
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            process.send_signal(signum)
+
+    def stop(self, timeout=30.0):
+        """
+        SIGTERMを送って終了を待つ（起動し直さない）
+        Returns:
+            int: 終了コード（起動していなかった場合はNone）
+        """
+        with self._lock:
+            self._stop.set()
+            process = self._process
+        if process is None:
+            return None
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logger.error(f"{self.name}が{timeout:.0f}秒以内に終了しなかったため強制終了します")
+                process.kill()
+                process.wait()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        return process.returncode
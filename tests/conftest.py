@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（app.py、bench.pyなど）を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import FakeSlackAPI  # noqa: E402
+
+
+@pytest.fixture
+def slack_api():
+    """偽のSlack Web API"""
+    api = FakeSlackAPI()
+    api.start()
+    yield api
+    api.stop()
+
+
+@pytest.fixture(scope="session")
+def bot(tmp_path_factory):
+    """
+    偽のSlack Web APIに接続したapp.pyを読み込み、(appモジュール, 偽のAPI) を返す
+    app.pyは環境変数を読み込み時に参照するので、テスト全体で1回だけ読み込む
+    """
+    api = FakeSlackAPI()
+    api.start()
+    workdir = tmp_path_factory.mktemp("bot")
+    os.makedirs(workdir / "uploads")
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-test",
+        "SIGNING_SECRET": "test",
+        "JWT_SECRET": "test-secret-0123456789abcdef0123456789abcdef",
+        "SLACK_API_URL": api.url,
+        "REVIEWER_IDS": "UREV1,UREV2,UREV3",
+        "REQUIRED_APPROVALS": "2",
+        "REVIEW_STORE": "memory",
+        "REVIEW_DB_PATH": str(workdir / "reviews.db"),
+        "JOB_DB_PATH": str(workdir / "jobs.db"),
+        "CLUSTER_DB_PATH": str(workdir / "cluster.db"),
+        "UPLOAD_DIR": str(workdir / "uploads"),
+        "ARCHIVE_DIR": str(workdir / "archive"),
+        "RECONCILE_ON_START": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    import app
+
+    # リスナーの完了まで待つ（SocketModeHandlerと同じくワーカースレッドからdispatchする）
+    app.app.listener_runner.process_before_response = True
+    for method in ("chat_postMessage", "chat_update", "chat_postEphemeral"):
+        app.slack_outbox.set_rate_limit(method, 10000.0, 10000)
+    yield app, api
+    api.stop()
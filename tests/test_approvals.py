@@ -0,0 +1,72 @@
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from slack_bolt.request import BoltRequest
+
+
+def reaction_added(user, review):
+    return {
+        "token": "test",
+        "team_id": "TTEST",
+        "api_app_id": "ATEST",
+        "type": "event_callback",
+        "event_id": f"Ev{uuid.uuid4().hex}",
+        "event_time": int(time.time()),
+        "event": {
+            "type": "reaction_added",
+            "user": user,
+            "reaction": "review_accept",
+            "item": {"type": "message", "channel": review.channel, "ts": review.ts},
+            "item_user": review.author,
+            "event_ts": f"{time.time():.6f}",
+        },
+        "authorizations": [{"team_id": "TTEST", "user_id": "UBOT", "is_bot": True}],
+    }
+
+
+def wait_outbox(app, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = app.slack_outbox.stats()
+        if not stats["queue_depth"] and not stats["pending_updates"]:
+            return
+        time.sleep(0.05)
+
+
+def test_concurrent_approvals_send_one_notice_per_review(bot):
+    """すべてのレビュワーが同時に承認し、一部のイベントが再送されても、承認の通知はレビューごとに1件だけ"""
+    app, api = bot
+    sns = next(iter(app.sns_registry.snapshot.accounts))
+    reviews = []
+    for i in range(30):
+        review = app.ReviewRequest(author=f"UAPPROVE{i:03d}", sns=sns, account=app.sns_registry.snapshot.accounts[sns][0],
+                                   text=f"テスト用の投稿 {i}", channel="CTEST")
+        app.review_store.put(review)
+        app.update_review_message(review)
+        assert review.ts
+        reviews.append(review)
+
+    events = []
+    for review in reviews:
+        for reviewer in app.REVIEWER_IDS:
+            event = reaction_added(reviewer, review)
+            events.append(event)
+            if review.author.endswith(("0", "5")):
+                # 再送されたイベント
+                events.append(event)
+
+    def dispatch(body):
+        return app.app.dispatch(BoltRequest(body=body, mode="socket_mode")).status
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        assert set(executor.map(dispatch, events)) == {200}
+    wait_outbox(app)
+
+    notices = Counter()
+    for text, posted in api.snapshot_posted().items():
+        if text and "承認されました" in text:
+            notices[text.split(">", 1)[0].lstrip("<@")] += posted
+    assert {review.author: notices[review.author] for review in reviews} == {review.author: 1 for review in reviews}
+    assert all(app.review_store.get(review.request_id).approved for review in reviews)
@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from cluster import Cluster
+
+
+def test_claim_is_released_on_failure_and_kept_after_success(tmp_path):
+    path = str(tmp_path / "cluster.db")
+    first = Cluster(path, node_id="first")
+    second = Cluster(path, node_id="second")
+
+    assert first.claim("event-1")
+    # 処理中は他のレプリカが取れない
+    assert not second.claim("event-1")
+    # 失敗して手放すと、再送されたイベントを処理し直せる
+    first.release_claim("event-1")
+    assert second.claim("event-1")
+    second.complete_claim("event-1")
+    assert not first.claim("event-1")
+    # 処理済みの権利は他のレプリカからは手放せない
+    first.release_claim("event-1")
+    assert not first.claim("event-1")
+
+    # 処理済みにしないまま期限が過ぎたら取り直せる
+    assert first.claim("event-2", ttl=0.05)
+    assert not second.claim("event-2")
+    time.sleep(0.1)
+    assert second.claim("event-2")
+    first.close()
+    second.close()
+
+
+def test_old_claims_table_is_migrated(tmp_path):
+    path = str(tmp_path / "cluster.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE cluster_claims (key TEXT PRIMARY KEY, owner TEXT NOT NULL, created_at REAL NOT NULL)")
+    conn.execute("INSERT INTO cluster_claims VALUES ('event-1', 'old', ?)", (time.time(),))
+    conn.commit()
+    conn.close()
+
+    cluster = Cluster(path, node_id="new")
+    # 以前に処理したイベントは処理済みのまま
+    assert not cluster.claim("event-1")
+    assert cluster.claim("event-2")
+    cluster.close()
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from bench import FakePlatformServer
+from job_queue import JobQueue, JobWorkerPool
+from publisher import HttpAdapter, MemoryCompletionLog, PublishError, Publisher
+
+
+@pytest.fixture
+def platform():
+    """偽のSNSの投稿API"""
+    server = FakePlatformServer(timeout_delay=0.5)
+    server.start()
+    yield server
+    server.stop()
+
+
+def make_publisher(platform, completions=None, sns=("TestA",), **kwargs):
+    publisher = Publisher(base_delay=0.01, completions=completions, **kwargs)
+    for name in sns:
+        publisher.register_adapter(name, HttpAdapter(platform.url + name, timeout=platform.timeout_delay / 2))
+        publisher.set_limits(name, 4, 1000.0, 1000)
+    return publisher
+
+
+def test_retries_and_restart_do_not_post_twice(platform, tmp_path):
+    """再試行でも再起動後の再実行でも、同じIdempotency-Keyで送るので二重に投稿されない"""
+    targets = [("TestA", "timeout-1"), ("TestA", "5xx-2"), ("TestA", "ok-3")]
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    jobs.enqueue("job-1", {"channel": "C1"})
+    publisher = make_publisher(platform, completions=jobs)
+    results = publisher.publish(targets, "告知", [], idempotency_key="job-1")
+    publisher.shutdown()
+    jobs.close()
+    assert [(result.success, result.attempts) for result in results] == [(True, 2), (True, 3), (True, 1)]
+    # タイムアウトした投稿の再送はサーバーが同じIdempotency-Keyで受け付け済みの投稿を返す
+    assert len(platform.posted) == 3
+    assert platform.replayed == 1
+    attempts = dict(platform.attempts)
+
+    # 再起動後は記録済みの結果を使い、投稿APIを呼ばない
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    publisher = make_publisher(platform, completions=jobs)
+    results = publisher.publish(targets, "告知", [], idempotency_key="job-1")
+    publisher.shutdown()
+    jobs.close()
+    assert all(result.success and result.attempts == 0 for result in results)
+    assert dict(platform.attempts) == attempts
+
+    # 記録が残っていなくても、同じIdempotency-Keyで送るのでサーバー側で二重投稿にならない
+    publisher = make_publisher(platform, completions=MemoryCompletionLog())
+    results = publisher.publish(targets, "告知", [], idempotency_key="job-1")
+    publisher.shutdown()
+    assert all(result.success for result in results)
+    assert set(platform.attempts) == set(attempts)
+    assert len(platform.posted) == 3
+
+
+def test_per_sns_concurrency_and_rate_limits(platform):
+    platform.latency = 0.05
+    concurrency, rate, burst = 2, 10.0, 2
+    publisher = make_publisher(platform, sns=("TestA", "TestB"), max_workers=16)
+    for sns in ("TestA", "TestB"):
+        publisher.set_limits(sns, concurrency, rate, burst)
+    targets = [(sns, f"ok-{i}") for i in range(15) for sns in ("TestA", "TestB")]
+    start = time.monotonic()
+    results = publisher.publish(targets, "告知", [], idempotency_key="limits")
+    elapsed = time.monotonic() - start
+    publisher.shutdown()
+
+    assert all(result.success for result in results)
+    for sns in ("TestA", "TestB"):
+        assert platform.max_in_flight[sns] <= concurrency
+        # サーバーに届く時刻は送信した時刻から同時投稿数の分だけずれることがある
+        assert platform.max_per_second(sns) <= rate + burst + concurrency
+    # SNSごとに制限するので、2つのSNSへの投稿は並行して進む（1つのSNSへの15件は(15 - バースト) / レート秒以上かかる）
+    assert (15 - burst) / rate * 0.9 <= elapsed < (30 - burst) / rate
+
+
+def test_failed_job_goes_to_dead_letters(platform, tmp_path):
+    """再試行できない失敗が続いたジョブは、最大試行回数でデッドレターに移る"""
+    jobs = JobQueue(str(tmp_path / "jobs.db"), max_attempts=3)
+    publisher = make_publisher(platform, completions=jobs)
+    dead = []
+
+    def handler(job):
+        results = publisher.publish([("TestA", "reject-1")], "告知", [], idempotency_key=job.id)
+        failed = [result for result in results if not result.success]
+        if failed:
+            raise PublishError(failed[0].error)
+
+    pool = JobWorkerPool(jobs, handler, workers=1, poll_interval=0.01, retry_delay=0,
+                         on_dead=lambda job, error: dead.append((job.id, job.attempts, str(error))))
+    jobs.enqueue("job-dead", {"channel": "C1"})
+    pool.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not dead and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+        publisher.shutdown()
+
+    assert dead == [("job-dead", 3, "HTTP 400")]
+    assert jobs.state("job-dead") == "dead"
+    assert [(job_id, error) for job_id, _, error in jobs.dead_letters()] == [("job-dead", "HTTP 400")]
+    # 試行のたびに同じIdempotency-Keyで送っている
+    assert platform.attempts == {"job-dead:TestA:reject-1": 3}
+    assert not platform.posted
+    jobs.close()
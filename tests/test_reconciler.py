@@ -0,0 +1,88 @@
+import random
+import time
+from types import SimpleNamespace
+
+from slack_sdk import WebClient
+
+from reconciler import ReactionReconciler
+
+
+def test_reconcile_applies_reactions_changed_while_stopped(bot):
+    """停止中に付け外しされたリアクションを、429を挟みながらすべて期待どおりに反映する"""
+    app, api = bot
+    rng = random.Random(1)
+    reviewers = app.REVIEWER_IDS
+    required = app.REQUIRED_APPROVALS
+    sns = next(iter(app.sns_registry.snapshot.accounts))
+    expected = {}  # request_id -> ("pending" / "approved" / "rejected", 承認したユーザーの集合)
+    reviews = []
+    for i in range(60):
+        review = app.ReviewRequest(author=f"URECONCILE{i:03d}", sns=sns,
+                                   account=app.sns_registry.snapshot.accounts[sns][0],
+                                   text=f"テスト用の投稿 {i}", channel="CRECONCILE")
+        app.review_store.put(review)
+        app.update_review_message(review)
+        # 停止前に付いていた承認（必要数には達していない）
+        before = rng.sample(reviewers, rng.randint(0, required - 1))
+        for user in before:
+            review.add_approval(user)
+        app.review_store.put(review)
+        reviews.append(review)
+
+        # 停止中に一部の承認が外され、別のレビュワーが承認した
+        accepted = [user for user in before if rng.random() >= 0.2]
+        accepted += [user for user in reviewers if user not in before and rng.random() < 0.4]
+        if i % 20 == 0:
+            # メッセージが削除された（状態はそのまま）
+            api.delete_message(review.channel, review.ts)
+            expected[review.request_id] = ("pending", set(before))
+            continue
+        reactions = {"review_accept": accepted, "eyes": reviewers[:1]}
+        if i % 10 == 5:
+            reactions["review_reject"] = [reviewers[-1]]
+            expected[review.request_id] = ("rejected", None)
+        elif len(accepted) >= required:
+            expected[review.request_id] = ("approved", set(accepted))
+        else:
+            expected[review.request_id] = ("pending", set(accepted))
+        api.set_reactions(review.channel, review.ts, reactions)
+
+    # 偽のAPIはレート制限しないので、呼び出し間隔はあけない。代わりに7回に1回は429にする（ヘッダー名は小文字）
+    app.reaction_reconciler.set_rate_limit(1000.0, 10)
+    api.throttle("reactions.get", 7)
+    api.retry_after_header = "retry-after"
+    try:
+        stats = app.reaction_reconciler.run(reviews)
+    finally:
+        api.throttle("reactions.get", 0)
+        api.retry_after_header = "Retry-After"
+
+    mismatches = []
+    for request_id, (state, approvals) in expected.items():
+        review = app.review_store.get(request_id)
+        actual = "rejected" if review is None else "approved" if review.approved else "pending"
+        if actual != state or (review is not None and set(review.approvals) != approvals):
+            mismatches.append(request_id)
+    assert mismatches == []
+    assert stats["rate_limited"] > 0
+    assert stats.get("failed", 0) == 0
+    assert stats["missing"] == 3
+
+
+def test_stop_returns_promptly_while_waiting_for_retry_after(slack_api):
+    slack_api.throttle("reactions.get", 1)
+    slack_api.retry_after = "30"
+    client = WebClient(token="xoxb-test", base_url=slack_api.url)
+    reviews = {
+        f"r{i}": SimpleNamespace(request_id=f"r{i}", channel="C1", ts=f"1.{i}", version=0) for i in range(20)
+    }
+    reconciler = ReactionReconciler(lambda: client, reviews.get, lambda review, reactions, version: "unchanged",
+                                    concurrency=4, rate=1000.0, burst=10)
+    reconciler.start(lambda: list(reviews.values()))
+    while not reconciler.rate_limited:
+        time.sleep(0.01)
+
+    start = time.monotonic()
+    reconciler.stop()
+    assert time.monotonic() - start < 1.0
+    assert reconciler.last_stats["skipped"] == len(reviews)
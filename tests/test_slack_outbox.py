@@ -0,0 +1,117 @@
+import threading
+import time
+from urllib.error import URLError
+
+import pytest
+from slack_sdk import WebClient
+
+from slack_outbox import OutboxFull, SlackOutbox
+
+FAST = {method: (10000.0, 10000) for method in ("chat_postMessage", "chat_update")}
+
+
+class GatedClient:
+    """
+    呼び出しを記録するだけのWebClientの代わり
+    gatedに含まれるメソッドは、gateがセットされるまで最初の呼び出しで止まる
+    """
+
+    def __init__(self, gated=()):
+        self.calls = []
+        self.gated = set(gated)
+        self.gate = threading.Event()
+        self.entered = threading.Event()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, method):
+        def call(**kwargs):
+            with self._lock:
+                self.calls.append((method, kwargs))
+            if method in self.gated:
+                self.entered.set()
+                self.gate.wait(10)
+            return {"ok": True, "channel": kwargs.get("channel"), "ts": kwargs.get("ts", "1.0")}
+        return call
+
+
+def test_updates_to_same_message_are_coalesced():
+    client = GatedClient(gated={"chat_update"})
+    outbox = SlackOutbox(lambda: client, rate_limits=FAST)
+    try:
+        # 1件目の送信中に、2つのメッセージへの更新を10件ずつ溜める
+        first = outbox.update_message("C1", "0.1", text="first")
+        assert client.entered.wait(5)
+        futures = [outbox.update_message("C1", ts, text=f"{ts} {i}") for i in range(10) for ts in ("1.1", "1.2")]
+        client.gate.set()
+        first.result(timeout=5)
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        outbox.stop()
+
+    updates = [kwargs for method, kwargs in client.calls if method == "chat_update"]
+    assert [kwargs["ts"] for kwargs in updates].count("1.1") == 1
+    assert [kwargs["ts"] for kwargs in updates].count("1.2") == 1
+    # まとめた更新は最新の内容で送る
+    assert {kwargs["ts"]: kwargs["text"] for kwargs in updates}["1.1"] == "1.1 9"
+    assert outbox.coalesced == 18
+
+
+def test_rate_limit_pauses_only_the_affected_lane(slack_api):
+    slack_api.throttle("chat.update", 1)
+    slack_api.retry_after = "0.5"
+    client = WebClient(token="xoxb-test", base_url=slack_api.url)
+    outbox = SlackOutbox(lambda: client, rate_limits=FAST)
+    try:
+        update = outbox.update_message("C1", "1.1", text="update")
+        while not slack_api.rate_limited["chat.update"]:
+            time.sleep(0.01)
+        # chat_updateがRetry-Afterで止まっている間もchat_postMessageはすぐに送信される
+        start = time.monotonic()
+        outbox.call("chat_postMessage", channel="C1", text="post").result(timeout=5)
+        assert time.monotonic() - start < 0.4
+        assert not update.done()
+
+        slack_api.throttle("chat.update", 0)
+        assert update.result(timeout=5)["ok"]
+        assert outbox.rate_limited >= 1
+    finally:
+        outbox.stop()
+
+
+def test_full_lane_raises_outbox_full_and_stop_does_not_hang():
+    client = GatedClient(gated={"chat_postMessage"})
+    outbox = SlackOutbox(lambda: client, maxsize=1, rate_limits=FAST, put_timeout=0.05)
+    try:
+        outbox.call("chat_postMessage", channel="C1", text="in flight")
+        assert client.entered.wait(5)
+        outbox.call("chat_postMessage", channel="C1", text="queued")
+        with pytest.raises(OutboxFull):
+            outbox.call("chat_postMessage", channel="C1", text="overflow")
+        # 他のメソッドのキューには影響しない
+        assert outbox.update_message("C1", "1.1", text="update").result(timeout=5)["ok"]
+
+        # 満杯のキューがあってもstop()は待ち続けない
+        start = time.monotonic()
+        outbox.stop(timeout=0.5)
+        assert time.monotonic() - start < 2
+    finally:
+        client.gate.set()
+        outbox.stop()
+
+
+def test_post_message_is_not_retried_when_it_may_have_reached_slack():
+    attempts = []
+
+    class TimeoutClient:
+        def chat_postMessage(self, **kwargs):
+            attempts.append(kwargs)
+            raise URLError(TimeoutError("timed out"))
+
+    outbox = SlackOutbox(lambda: TimeoutClient(), rate_limits=FAST)
+    try:
+        with pytest.raises(URLError):
+            outbox.call("chat_postMessage", channel="C1", text="post").result(timeout=5)
+    finally:
+        outbox.stop()
+    assert len(attempts) == 1
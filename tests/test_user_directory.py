@@ -0,0 +1,40 @@
+import time
+
+from user_directory import UserDirectory
+
+
+class UsersClient:
+    def __init__(self, members):
+        self.members = members
+
+    def users_list(self, cursor=None, limit=200):
+        return {"members": self.members, "response_metadata": {"next_cursor": ""}}
+
+
+def member(user_id, display_name):
+    return {"id": user_id, "name": user_id.lower(), "profile": {"display_name": display_name}}
+
+
+def test_rename_repoints_shared_name_to_remaining_user():
+    client = UsersClient([member("U1", "taro"), member("U2", "taro"), member("U3", "hanako")])
+    directory = UserDirectory(lambda: client)
+    directory.refresh()
+    assert directory.lookup("Taro") == "U1"
+
+    # U1が名前を変えたら、同じ名前のU2を指す
+    directory.upsert(member("U1", "jiro"))
+    assert directory.lookup("taro") == "U2"
+    assert directory.lookup("jiro") == "U1"
+
+    # 誰も使わなくなった名前は索引から消える
+    directory.upsert(member("U3", "hanako2"))
+    assert directory.lookup("hanako") is None
+
+
+def test_stop_ends_refresh_loop():
+    directory = UserDirectory(lambda: UsersClient([member("U1", "taro")]), ttl=3600)
+    directory.start()
+    start = time.monotonic()
+    directory.stop()
+    assert time.monotonic() - start < 1.0
+    assert directory.lookup("taro") == "U1"
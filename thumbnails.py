@@ -0,0 +1,147 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillowがない場合はサムネイルを作らずに元画像を返す
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 生成するサムネイルの幅（これ以外の幅は一番近いものに丸める）
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def available():
+    """サムネイルを生成できるか（Pillowがインストールされているか）"""
+    return Image is not None
+
+
+def normalize_width(width):
+    """指定された幅を生成対象の幅に丸める"""
+    return min(THUMBNAIL_WIDTHS, key=lambda w: abs(w - width))
+
+
+class ThumbnailCache:
+    """
+    縮小画像をディスクにキャッシュする
+    ファイル名は元画像のハッシュ・幅・形式から決まるので、同じ画像のサムネイルは一度だけ生成される
+    合計サイズが上限を超えたら、最近使われていないものから削除する
+    """
+
+    def __init__(self, directory, max_bytes, quality=80):
+        """
+        Args:
+            directory: キャッシュを保存するディレクトリ
+            max_bytes: キャッシュ全体の上限バイト数
+            quality: WebP/JPEGの品質
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._entries = OrderedDict()  # ファイル名 -> バイト数（古い順）
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # 同じサムネイルを同時に生成しないためのロック
+        self._generating = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def key(content_hash, width, fmt):
+        """サムネイルのファイル名（ETagにも使う）"""
+        return f"{content_hash}_{width}.{fmt}"
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, source_path, content_hash, width, fmt):
+        """
+        サムネイルのパスを返す（なければ生成する）
+        Args:
+            source_path: 元画像のパス
+            content_hash: 元画像の内容のハッシュ
+            width: サムネイルの幅（THUMBNAIL_WIDTHSのいずれか）
+            fmt: "webp" または "jpeg"
+        Returns:
+            tuple: (サムネイルのパス, キー)
+        """
+        key = self.key(content_hash, width, fmt)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self.path(key), key
+            lock = self._generating.setdefault(key, threading.Lock())
+
+        with lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self.path(key), key
+            try:
+                size = self._generate(source_path, key, width, fmt)
+            finally:
+                with self._lock:
+                    self._generating.pop(key, None)
+
+        with self._lock:
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+        return self.path(key), key
+
+    def _generate(self, source_path, key, width, fmt):
+        pil_format, _ = FORMATS[fmt]
+        with Image.open(source_path) as image:
+            # スマートフォンで撮影した画像の向きを反映してから縮小する
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".thumb-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, pil_format, quality=self.quality)
+                os.replace(tmp_path, self.path(key))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return os.path.getsize(self.path(key))
+
+    def _evict(self):
+        # self._lock を取得した状態で呼ぶこと
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes}
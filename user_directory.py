@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _names(member):
+    """メンバーの表示名・実名・ユーザー名（検索用に小文字化したもの）"""
+    profile = member.get("profile", {})
+    names = [
+        profile.get("display_name", "") or "",
+        profile.get("real_name", "") or "",
+        member.get("name", "") or "",
+    ]
+    return [name.casefold() for name in names if name]
+
+
+class UserDirectory:
+    """
+    Slackユーザーの名前 -> ユーザーIDの索引
+    users_listで全件を読み込んだ後は、user_change / team_join イベントで差分を反映する
+    バックグラウンドで一定間隔ごとに全件を読み直す
+    """
+
+    def __init__(self, client_getter, ttl=3600, miss_refresh_interval=60):
+        """
+        Args:
+            client_getter: WebClientを返す関数
+            ttl: 全件を読み直す間隔（秒）
+            miss_refresh_interval: 見つからなかった名前のために読み直す最短間隔（秒）
+        """
+        self.client_getter = client_getter
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self._index = {}  # 小文字化した名前 -> ユーザーID
+        self._names_by_user = {}  # ユーザーID -> 登録した名前のリスト
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """users_listを全ページ読み込んで索引を作り直す"""
+        with self._refresh_lock:
+            members = []
+            cursor = None
+            while True:
+                response = self.client_getter().users_list(cursor=cursor, limit=200)
+                members.extend(response.get("members", []))
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    break
+
+            index = {}
+            names_by_user = {}
+            for member in members:
+                user_id = member.get("id")
+                names = _names(member)
+                names_by_user[user_id] = names
+                for name in names:
+                    # 同じ名前のユーザーが複数いる場合は一覧で先に出てきたユーザーを優先する
+                    index.setdefault(name, user_id)
+
+            with self._lock:
+                self._index = index
+                self._names_by_user = names_by_user
+                self._loaded_at = time.monotonic()
+            logger.info(f"Slackユーザー一覧を読み込みました: {len(members)}人")
+
+    def upsert(self, member):
+        """user_change / team_join イベントのユーザー情報を索引に反映する"""
+        user_id = member.get("id")
+        if not user_id:
+            return
+        names = _names(member)
+        with self._lock:
+            old_names = self._names_by_user.get(user_id, [])
+            self._names_by_user[user_id] = names
+            for name in old_names:
+                if name in names or self._index.get(name) != user_id:
+                    continue
+                # 同じ名前の他のユーザーがいれば、一覧で先に出てきたユーザーを指すようにする
+                other = next(
+                    (other_id for other_id, other_names in self._names_by_user.items()
+                     if other_id != user_id and name in other_names),
+                    None,
+                )
+                if other is None:
+                    del self._index[name]
+                else:
+                    self._index[name] = other
+            for name in names:
+                self._index.setdefault(name, user_id)
+
+    def lookup(self, name):
+        """
+        表示名・実名・ユーザー名のいずれかが一致するユーザーIDを返す（大文字小文字は区別しない）
+        Returns:
+            str: 見つからない場合はNone
+        """
+        key = name.casefold()
+        with self._lock:
+            loaded_at = self._loaded_at
+            user_id = self._index.get(key)
+        if user_id is not None:
+            return user_id
+
+        # 未読み込み、または最近読み込んでいない場合だけ読み直す
+        if loaded_at is None or time.monotonic() - loaded_at > self.miss_refresh_interval:
+            self.refresh()
+            with self._lock:
+                return self._index.get(key)
+        return None
+
+    def start(self):
+        """一定間隔で全件を読み直すスレッドを開始する"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="user-directory", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Slackユーザー一覧の読み込みに失敗しました: {e}")
+            self._stop.wait(self.ttl)
@@ -0,0 +1,9 @@
+"""
+本番用のWSGIサーバー（gunicorn）から読み込むエントリポイント
+    gunicorn --worker-class gthread --workers 2 --threads 8 wsgi:application
+通常は python app.py --serve=prod で起動する
+"""
+from app import flask_app, start_web_services
+
+start_web_services()
+application = flask_app